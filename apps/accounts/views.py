@@ -22,10 +22,12 @@ def profile_view(request):
     
     if request.method == 'POST' and 'avatar' in request.FILES:
         avatar_file = request.FILES['avatar']
-        image = Image.objects.create(
+        image = Image(
             title=f"{request.user.username}_avatar",
             file=avatar_file
         )
+        image.upload_role = 'avatar'
+        image.save()
         profile.avatar = image
         profile.save()
         messages.success(request, 'Avatar updated successfully!')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.related import build_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related-posts index for every live blog post'
+
+    def handle(self, *args, **options):
+        rows = build_related_posts()
+        self.stdout.write(self.style.SUCCESS(f'Successfully built {rows} related-post entries'))
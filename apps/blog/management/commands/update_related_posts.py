@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.blog.related import UPDATE_BATCH_SIZE, process_related_updates
+
+
+class Command(BaseCommand):
+    help = 'Apply related-posts updates queued by publishing and unpublishing blog posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=UPDATE_BATCH_SIZE,
+            help=f'Queued posts to apply per corpus build (default: {UPDATE_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting once it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep between polls when the queue is empty (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            updated = process_related_updates(options['batch_size'])
+            total += updated
+            if updated:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully updated related posts for {total} posts')
+        )
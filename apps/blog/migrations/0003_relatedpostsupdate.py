@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPostsUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_id', models.PositiveIntegerField(unique=True)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
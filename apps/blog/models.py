@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from wagtail.models import Page
 from wagtail.fields import RichTextField
 from wagtail.admin.panels import FieldPanel
@@ -7,6 +8,8 @@ from modelcluster.fields import ParentalKey, ParentalManyToManyField
 from modelcluster.contrib.taggit import ClusterTaggableManager
 from taggit.models import TaggedItemBase
 
+from apps.core.renditions import RENDITION_SPECS, prefetch_page_images
+
 
 class BlogTag(TaggedItemBase):
     content_object = ParentalKey(
@@ -52,7 +55,9 @@ class BlogIndexPage(Page):
         if category:
             posts = posts.filter(blogpost__categories__name__iexact=category)
         
-        context['posts'] = posts
+        context['posts'] = prefetch_page_images(
+            list(posts.specific()), 'featured_image', *RENDITION_SPECS['blog.BlogPost']['featured_image']
+        )
         context['categories'] = BlogCategory.objects.all()
         return context
 
@@ -103,8 +108,42 @@ class BlogPost(Page):
     
     def get_context(self, request):
         context = super().get_context(request)
-        # Related posts
-        context['related_posts'] = BlogPost.objects.live().exclude(id=self.id).filter(
-            categories__in=self.categories.all()
-        ).distinct()[:3]
-        return context
\ No newline at end of file
+        # Related posts, precomputed by apps.blog.related
+        context['related_posts'] = BlogPost.objects.live().filter(
+            related_by__post=self
+        ).select_related('featured_image').order_by('related_by__rank')
+        return context
+
+
+class RelatedPost(models.Model):
+    """Precomputed related-post entry, ranked by score.
+
+    Maintained by the ``update_related_posts`` worker after each publish and
+    by the ``build_related_posts`` command (see ``apps.blog.related``) so a
+    post view reads its related posts in one query.
+    """
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='related_by')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        unique_together = ['post', 'related']
+
+    def __str__(self):
+        return f"{self.post} -> {self.related} ({self.score:.2f})"
+
+
+class RelatedPostsUpdate(models.Model):
+    """A post whose related-post entries need refreshing after a publish or unpublish.
+
+    Written in the publishing transaction and drained by the
+    ``update_related_posts`` command, so publishing never waits on the
+    corpus build.
+    """
+    post_id = models.PositiveIntegerField(unique=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Related posts update for post {self.post_id}"
@@ -0,0 +1,167 @@
+import math
+import re
+from collections import Counter
+from html import unescape
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import BlogPost, RelatedPost, RelatedPostsUpdate
+
+RELATED_POSTS_COUNT = 3
+UPDATE_BATCH_SIZE = 100
+
+# Shared categories outrank shared tags; text similarity (cosine, 0-1) is
+# weighted below one tag so it only orders posts with equal overlap
+CATEGORY_WEIGHT = 2.0
+TAG_WEIGHT = 1.0
+TEXT_WEIGHT = 0.5
+
+WORD_PATTERN = re.compile(r'[^\W\d_]{3,}')
+STOP_WORDS = frozenset(
+    'the and for are but not you all any can had her was one our out has him his how its '
+    'may new now see two who did get let put say she too use with that this from they '
+    'will have been were your what when them then than into more some such only also '
+    'about which their there would could should these those other after before over'.split()
+)
+
+
+def tokenize(text):
+    return [
+        word for word in WORD_PATTERN.findall(unescape(strip_tags(text)).lower())
+        if word not in STOP_WORDS
+    ]
+
+
+def build_corpus():
+    """Categories, tags and a unit TF-IDF vector for every live post.
+
+    Three queries: the posts, then their categories and tags in bulk.
+    """
+    posts = list(
+        BlogPost.objects.live().prefetch_related('categories', 'tags').only('id', 'excerpt', 'body')
+    )
+    term_counts = {post.pk: Counter(tokenize(f'{post.excerpt} {post.body}')) for post in posts}
+
+    document_frequency = Counter()
+    for counts in term_counts.values():
+        document_frequency.update(counts.keys())
+    total = len(posts)
+
+    corpus = {}
+    for post in posts:
+        vector = {
+            term: count * math.log(total / document_frequency[term])
+            for term, count in term_counts[post.pk].items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        corpus[post.pk] = {
+            'categories': {category.pk for category in post.categories.all()},
+            'tags': {tag.pk for tag in post.tags.all()},
+            'vector': {term: weight / norm for term, weight in vector.items()} if norm else {},
+        }
+    return corpus
+
+
+def score_pair(a, b):
+    """Relatedness of two corpus entries; symmetric"""
+    if len(a['vector']) > len(b['vector']):
+        a, b = b, a
+    similarity = sum(weight * b['vector'].get(term, 0) for term, weight in a['vector'].items())
+    return (
+        len(a['categories'] & b['categories']) * CATEGORY_WEIGHT
+        + len(a['tags'] & b['tags']) * TAG_WEIGHT
+        + similarity * TEXT_WEIGHT
+    )
+
+
+def rank_related(post_id, corpus, count=RELATED_POSTS_COUNT):
+    """The ``count`` best (score, post_id) pairs for a post, best first"""
+    entry = corpus[post_id]
+    scores = [
+        (score_pair(entry, other), other_id)
+        for other_id, other in corpus.items() if other_id != post_id
+    ]
+    # Highest score first, newer post (higher id) on ties
+    return sorted((pair for pair in scores if pair[0] > 0), reverse=True)[:count]
+
+
+def save_related(post_ids, corpus):
+    """Replace the related-post rows of ``post_ids``"""
+    rows = [
+        RelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+        for post_id in post_ids
+        for rank, (score, related_id) in enumerate(rank_related(post_id, corpus))
+    ]
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.bulk_create(rows)
+    return len(rows)
+
+
+def build_related_posts():
+    """Recompute the whole related-posts index; returns the rows written"""
+    started = timezone.now()
+    corpus = build_corpus()
+    with transaction.atomic():
+        RelatedPost.objects.exclude(post_id__in=corpus).delete()
+        rows = save_related(list(corpus), corpus)
+        # The rebuild covers every update queued before it started
+        RelatedPostsUpdate.objects.filter(queued_at__lte=started).delete()
+    return rows
+
+
+def queue_related_update(post):
+    """Queue a refresh of the index around ``post`` for the ``update_related_posts`` worker"""
+    RelatedPostsUpdate.objects.update_or_create(post_id=post.pk, defaults={'queued_at': timezone.now()})
+
+
+def update_related_posts(post_id, corpus):
+    """Refresh the index after post ``post_id`` was published or unpublished.
+
+    Recomputes the post itself, the posts that listed it, and the posts it
+    now outscores one of their entries for. Scores are symmetric, so the
+    post's own scores against every other post decide the last group.
+    Corpus-wide IDF drift is left to the ``build_related_posts`` command.
+    """
+    affected = set(RelatedPost.objects.filter(related_id=post_id).values_list('post_id', flat=True))
+
+    if post_id in corpus:
+        affected.add(post_id)
+        lowest = {}
+        counts = Counter()
+        for other_id, score in RelatedPost.objects.values_list('post_id', 'score'):
+            lowest[other_id] = min(score, lowest.get(other_id, score))
+            counts[other_id] += 1
+        for other_id, other in corpus.items():
+            if other_id == post_id:
+                continue
+            score = score_pair(corpus[post_id], other)
+            if score > 0 and (counts[other_id] < RELATED_POSTS_COUNT or score > lowest[other_id]):
+                affected.add(other_id)
+    else:
+        RelatedPost.objects.filter(post_id=post_id).delete()
+
+    return save_related([other_id for other_id in affected if other_id in corpus], corpus)
+
+
+def process_related_updates(batch_size=UPDATE_BATCH_SIZE):
+    """Apply one batch of queued updates against a single corpus build.
+
+    An update queued again while the batch runs keeps its newer row and is
+    picked up by the next batch. Returns the number of posts updated.
+    """
+    started = timezone.now()
+    post_ids = list(
+        RelatedPostsUpdate.objects.filter(queued_at__lte=started)
+        .order_by('queued_at').values_list('post_id', flat=True)[:batch_size]
+    )
+    if not post_ids:
+        return 0
+
+    corpus = build_corpus()
+    for post_id in post_ids:
+        update_related_posts(post_id, corpus)
+    RelatedPostsUpdate.objects.filter(post_id__in=post_ids, queued_at__lte=started).delete()
+    return len(post_ids)
@@ -0,0 +1,12 @@
+from django.dispatch import receiver
+from wagtail.signals import page_published, page_unpublished
+
+from .models import BlogPost
+from .related import queue_related_update
+
+
+@receiver(page_published, sender=BlogPost)
+@receiver(page_unpublished, sender=BlogPost)
+def blog_post_changed(sender, instance, **kwargs):
+    """Queue a related-posts refresh; the ``update_related_posts`` worker applies it"""
+    queue_related_update(instance)
@@ -0,0 +1,118 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Site
+
+from .models import BlogCategory, BlogIndexPage, BlogPost, RelatedPost, RelatedPostsUpdate
+from .related import build_related_posts, process_related_updates
+
+
+class BlogViewQueryTestCase(TestCase):
+    """Query budgets for the blog pages, which must not grow with the number of posts"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, RENDITION_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.image = get_image_model().objects.create(title='Cover', file=get_test_image_file())
+        root = Site.objects.get(is_default_site=True).root_page
+        self.index = BlogIndexPage(title='Blog', slug='test-blog')
+        root.add_child(instance=self.index)
+        self.author = User.objects.create_user('writer', 'writer@example.com', 'pass12345')
+        self.post = self.add_post('First post')
+        self.add_post('Second post')
+        # Signed in, so the page cache is bypassed and the views themselves are measured
+        self.client.force_login(self.author)
+
+    def add_post(self, title):
+        post = BlogPost(
+            title=title, slug=title.lower().replace(' ', '-'), excerpt=title, body='<p>Bricks</p>',
+            author=self.author, featured_image=self.image,
+        )
+        self.index.add_child(instance=post)
+        post.save_revision().publish()
+        process_related_updates()
+        return post
+
+    def assertQueryBudget(self, url, count):
+        self.client.get(url)
+        with self.assertNumQueries(count):
+            self.client.get(url)
+        for index in range(4):
+            self.add_post(f'Post {index}')
+        self.client.get(url)
+        with self.assertNumQueries(count):
+            self.client.get(url)
+
+    def test_blog_index(self):
+        self.assertQueryBudget(self.index.url, 18)
+
+    def test_blog_post(self):
+        self.assertQueryBudget(self.post.url, 21)
+
+
+class RelatedPostsTestCase(TestCase):
+    def setUp(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        self.index = BlogIndexPage(title='Blog', slug='test-blog')
+        root.add_child(instance=self.index)
+        self.news = BlogCategory.objects.create(name='News')
+        self.guides = BlogCategory.objects.create(name='Guides')
+        self.author = User.objects.create_user('writer', 'writer@example.com', 'pass12345')
+
+    def add_post(self, title, body, categories=(), tags=()):
+        post = BlogPost(
+            title=title, slug=title.lower().replace(' ', '-'), excerpt=title, body=body, author=self.author
+        )
+        self.index.add_child(instance=post)
+        post.categories.set(categories)
+        post.tags.add(*tags)
+        post.save_revision().publish()
+        process_related_updates()
+        return post
+
+    def related_ids(self, post):
+        return list(RelatedPost.objects.filter(post=post).values_list('related_id', flat=True))
+
+    def test_categories_outrank_tags_and_text_breaks_ties(self):
+        post = self.add_post('Castle build', '<p>Medieval castle towers and walls</p>', [self.news], ['castle'])
+        same_category = self.add_post('Patch notes', '<p>Server update</p>', [self.news])
+        same_tag = self.add_post('Tower tips', '<p>Build taller towers</p>', tags=['castle'])
+        similar_text = self.add_post('Castle walls', '<p>Castle walls and medieval towers</p>')
+        self.add_post('Unrelated', '<p>Racing karts</p>', [self.guides])
+
+        build_related_posts()
+        self.assertEqual(self.related_ids(post), [same_category.pk, same_tag.pk, similar_text.pk])
+
+    def test_publish_updates_other_posts(self):
+        first = self.add_post('First', '<p>Bricks</p>', [self.news])
+        second = self.add_post('Second', '<p>Bricks</p>', [self.news])
+        self.assertEqual(self.related_ids(first), [second.pk])
+
+        second.unpublish()
+        # Publishing only queues the refresh; the worker applies it
+        self.assertEqual(self.related_ids(first), [second.pk])
+        self.assertTrue(RelatedPostsUpdate.objects.filter(post_id=second.pk).exists())
+
+        self.assertEqual(process_related_updates(), 1)
+        self.assertEqual(self.related_ids(first), [])
+        self.assertFalse(RelatedPostsUpdate.objects.exists())
+
+    def test_post_view_reads_related_posts_in_one_query(self):
+        post = self.add_post('First', '<p>Bricks</p>', [self.news])
+        other = self.add_post('Second', '<p>Bricks</p>', [self.news])
+
+        with CaptureQueriesContext(connection) as queries:
+            related = list(post.get_context(self.client.get('/').wsgi_request)['related_posts'])
+        self.assertEqual(related, [other])
+        self.assertEqual(len([q for q in queries.captured_queries if 'blog_relatedpost' in q['sql']]), 1)
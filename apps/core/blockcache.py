@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import translation
+from django.utils.safestring import mark_safe
+from wagtail import blocks
+from wagtail.blocks import StreamValue
+from wagtail.images import get_image_model
+from wagtail.images.blocks import ImageChooserBlock
+
+from .renditions import renditions_pending
+from .versions import bump_version, get_version
+
+BLOCK_CACHE_TIMEOUT = 60 * 60 * 24
+BLOCK_VERSION_KEY = 'core:block_version'
+
+
+def get_block_version():
+    return get_version(BLOCK_VERSION_KEY)
+
+
+def invalidate_block_cache():
+    """Drop every cached block, e.g. after an image they show changed"""
+    bump_version(BLOCK_VERSION_KEY)
+
+
+def get_block_cache_key(block, raw_item, index, language, version):
+    """Key a block's HTML by its definition, stored value, position and language.
+
+    The position is part of the key because block templates may read the
+    enclosing ``forloop``.
+    """
+    value = json.dumps(raw_item['value'], sort_keys=True, cls=DjangoJSONEncoder)
+    digest = hashlib.md5(f'{type(block).__module__}.{type(block).__qualname__}:{value}'.encode()).hexdigest()
+    return f'core:block:{version}:{digest}:{index}:{language}'
+
+
+# ============================================================================
+# BATCHED CONVERSION
+# ============================================================================
+
+def get_image_ids(block, value):
+    """Image ids referenced by a raw block value"""
+    if isinstance(block, ImageChooserBlock):
+        return [value] if value else []
+    if isinstance(block, blocks.StructBlock):
+        return [
+            image_id
+            for name, child_block in block.child_blocks.items() if name in value
+            for image_id in get_image_ids(child_block, value[name])
+        ]
+    return []
+
+
+def to_python(block, value, images):
+    """Like ``block.to_python``, taking images from ``images`` instead of the database"""
+    if isinstance(block, ImageChooserBlock):
+        return images.get(value)
+    if isinstance(block, blocks.StructBlock):
+        return block._to_struct_value([
+            (name, to_python(child_block, value[name], images) if name in value else child_block.get_default())
+            for name, child_block in block.child_blocks.items()
+        ])
+    return block.to_python(value)
+
+
+# ============================================================================
+# RENDERING
+# ============================================================================
+
+def render_cached_streams(context, page, field_names):
+    """Render the blocks of several StreamFields, reusing cached HTML.
+
+    Returns ``{field_name: [html, ...]}``. Every block's key is fetched with
+    one ``get_many``; the blocks that miss are converted together, with all
+    their images and renditions loaded in two queries, rendered, and stored
+    with one ``set_many``. Blocks showing a rendition that is still being
+    generated are not stored.
+    """
+    language = translation.get_language()
+    version = get_block_version()
+
+    items = []
+    for field_name in field_names:
+        stream = getattr(page, field_name)
+        for index, raw_item in enumerate(stream.raw_data):
+            block = stream.stream_block.child_blocks[raw_item['type']]
+            key = get_block_cache_key(block, raw_item, index, language, version)
+            items.append((field_name, index, block, raw_item, key))
+
+    cached = cache.get_many([key for *_, key in items])
+
+    misses = [item for item in items if item[-1] not in cached]
+    image_ids = {
+        image_id for field_name, index, block, raw_item, key in misses
+        for image_id in get_image_ids(block, raw_item['value'])
+    }
+    images = get_image_model().objects.prefetch_renditions().in_bulk(image_ids) if image_ids else {}
+
+    rendered = {field_name: [] for field_name in field_names}
+    missing = {}
+    for field_name, index, block, raw_item, key in items:
+        html = cached.get(key)
+        if html is None:
+            child = StreamValue.StreamChild(
+                block, to_python(block, raw_item['value'], images), id=raw_item.get('id')
+            )
+            forloop = {'counter': index + 1, 'counter0': index, 'first': index == 0}
+            token = renditions_pending.set(False)
+            with context.push(forloop=forloop):
+                html = child.render(context.flatten())
+            pending = renditions_pending.get()
+            renditions_pending.reset(token)
+            if pending:
+                renditions_pending.set(True)
+            else:
+                missing[key] = html
+        rendered[field_name].append(mark_safe(html))
+
+    if missing:
+        cache.set_many(missing, BLOCK_CACHE_TIMEOUT)
+    return rendered
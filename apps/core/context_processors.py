@@ -1,18 +1,74 @@
+from django.core.cache import cache
+from django.utils import translation
+
+from .lazy import lazy_context
+from .versions import bump_version, get_version
 from .models import SocialMediaLink, PrivacyPolicyPage, TermsOfServicePage
 from apps.shop.models import ProductCategory, Brand
 from apps.games.models import GameCategory
 from wagtail.models import Page
 
+FOOTER_CACHE_TIMEOUT = 60 * 60 * 24
+FOOTER_VERSION_KEY = 'core:footer_version'
 
-def footer_context(request):
-    """Add footer-related context to all templates"""
+FOOTER_KEYS = [
+    'social_links', 'privacy_page', 'terms_page', 'footer_brands',
+    'footer_product_categories', 'footer_game_categories',
+    'shop_index_page', 'games_index_page',
+]
+
+
+def get_footer_version():
+    return get_version(FOOTER_VERSION_KEY)
+
+
+def invalidate_footer_cache():
+    """Drop every cached footer; called when pages or footer snippets change"""
+    bump_version(FOOTER_VERSION_KEY)
+
+
+def get_footer_cache_key(request):
+    # The host picks the Wagtail site without a Site query
+    return 'core:footer:{}:{}:{}'.format(
+        get_footer_version(), request.get_host(), translation.get_language()
+    )
+
+
+def page_link(page, request):
+    """Reduce a page to the url/title pair the footer renders"""
+    if page is None:
+        return None
+    return {'title': page.title, 'url': page.get_url(request)}
+
+
+def build_footer_context(request):
+    """Run the footer queries"""
     return {
-        'social_links': SocialMediaLink.objects.all(),
-        'privacy_page': PrivacyPolicyPage.objects.live().first(),
-        'terms_page': TermsOfServicePage.objects.live().first(),
-        'footer_brands': Brand.objects.all(),
-        'footer_product_categories': ProductCategory.objects.all(),
-        'footer_game_categories': GameCategory.objects.all(),
-        'shop_index_page': Page.objects.filter(content_type__model='shopindexpage').live().first(),
-        'games_index_page': Page.objects.filter(content_type__model='gamesindexpage').live().first(),
-    }
\ No newline at end of file
+        'social_links': list(SocialMediaLink.objects.all()),
+        'privacy_page': page_link(PrivacyPolicyPage.objects.live().first(), request),
+        'terms_page': page_link(TermsOfServicePage.objects.live().first(), request),
+        'footer_brands': list(Brand.objects.all()),
+        'footer_product_categories': list(ProductCategory.objects.all()),
+        'footer_game_categories': list(GameCategory.objects.all()),
+        'shop_index_page': page_link(
+            Page.objects.filter(content_type__model='shopindexpage').live().first(), request
+        ),
+        'games_index_page': page_link(
+            Page.objects.filter(content_type__model='gamesindexpage').live().first(), request
+        ),
+    }
+
+
+def get_footer_context(request):
+    """Return the footer values, from the cache when warm"""
+    cache_key = get_footer_cache_key(request)
+    context = cache.get(cache_key)
+    if context is None:
+        context = build_footer_context(request)
+        cache.set(cache_key, context, FOOTER_CACHE_TIMEOUT)
+    return context
+
+
+def footer_context(request):
+    """Add footer-related context to all templates, loaded on first use"""
+    return lazy_context(lambda: get_footer_context(request), FOOTER_KEYS)
@@ -0,0 +1,28 @@
+from django.utils.functional import SimpleLazyObject
+
+
+class LazyValues:
+    """Runs ``loader`` at most once, on the first access to any of its values"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._values = None
+
+    def load(self):
+        if self._values is None:
+            self._values = self._loader()
+        return self._values
+
+    def get(self, key):
+        return SimpleLazyObject(lambda: self.load()[key])
+
+
+def lazy_context(loader, keys):
+    """Build a context processor result whose values are computed on demand.
+
+    ``loader`` returns a dict containing ``keys``. Each key maps to a lazy
+    proxy, and the first one a template touches runs ``loader`` for all of
+    them. Templates that never use the values never pay for the queries.
+    """
+    values = LazyValues(loader)
+    return {key: values.get(key) for key in keys}
@@ -0,0 +1,41 @@
+import re
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+TABLE_PATTERN = re.compile(r'\bFROM "?(\w+)"?')
+
+
+class Command(BaseCommand):
+    help = 'Report how many queries each URL runs, broken down by table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='URL paths to request, e.g. /shop/ /missing/')
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Host header to send (must be in ALLOWED_HOSTS; default: localhost)',
+        )
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+
+        for path in options['paths']:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+
+            tables = Counter(
+                table
+                for query in queries.captured_queries
+                for table in TABLE_PATTERN.findall(query['sql'])
+            )
+            self.stdout.write(
+                f'{path}  status={response.status_code}  queries={len(queries.captured_queries)}'
+            )
+            for table, count in tables.most_common():
+                self.stdout.write(f'    {count:>4}  {table}')
+
+        self.stdout.write(self.style.SUCCESS('Successfully reported view queries'))
@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from apps.core.renditions import RENDITION_SPECS, generate_renditions, get_responsive_specs
+
+
+class Command(BaseCommand):
+    help = 'Generate the listing and detail renditions of every live page image ahead of traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            choices=sorted(RENDITION_SPECS),
+            help='Only warm images of this page model (may be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        labels = options['model'] or sorted(RENDITION_SPECS)
+
+        for label in labels:
+            model = apps.get_model(label)
+            for field, specs in RENDITION_SPECS[label].items():
+                specs = [responsive_spec for spec in specs for responsive_spec in get_responsive_specs(spec)]
+                image_ids = set(
+                    model.objects.live().filter(**{f'{field}__isnull': False}).values_list(f'{field}_id', flat=True)
+                )
+                for image_id in image_ids:
+                    generate_renditions(image_id, specs)
+                self.stdout.write(f'{label}.{field}: {len(image_ids)} images x {len(specs)} renditions')
+
+        self.stdout.write(self.style.SUCCESS('Successfully warmed renditions'))
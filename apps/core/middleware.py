@@ -1,18 +1,42 @@
-from django.utils import translation
+from .pagecache import get_cached_response, is_cacheable_request, store_response
+from .preferences import activate_preferred_language
+from .renditions import renditions_pending
 
 
 class UserLanguageMiddleware:
-    """Middleware to set language from user profile"""
+    """Middleware to set language from user preferences"""
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        if request.user.is_authenticated and hasattr(request.user, 'userprofile'):
-            user_language = request.user.userprofile.language
-            if user_language:
-                translation.activate(user_language)
-                request.LANGUAGE_CODE = user_language
+        activate_preferred_language(request)
         
         response = self.get_response(request)
         return response
+
+
+class AnonymousPageCacheMiddleware:
+    """Serve Wagtail pages to anonymous visitors from the page cache.
+
+    Must come after LocaleMiddleware so the cache key sees the active
+    language. Pages opt in through the before_serve_page hook.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if is_cacheable_request(request):
+            response = get_cached_response(request)
+            if response is not None:
+                return response
+        
+        # Server threads run many requests in one context; start each clean
+        token = renditions_pending.set(False)
+        try:
+            response = self.get_response(request)
+            store_response(request, response)
+        finally:
+            renditions_pending.reset(token)
+        return response
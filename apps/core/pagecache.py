@@ -0,0 +1,167 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import translation
+from wagtail.models import Page
+
+from .preferences import get_preferences
+from .renditions import renditions_pending
+
+# Page types served from the anonymous page cache, with the snippet models
+# their templates list (a change to any of them drops every page of the type)
+CACHEABLE_PAGE_MODELS = {
+    'home.HomePage': ['home.AppStoreLink'],
+    'games.GamesIndexPage': ['games.GameCategory'],
+    'games.GamePage': ['games.GameCategory'],
+    'blog.BlogIndexPage': ['blog.BlogCategory'],
+    'blog.BlogPost': ['blog.BlogCategory'],
+    'events.EventPage': [],
+    'shop.ProductPage': ['shop.ProductCategory', 'shop.Brand'],
+}
+
+# Shared by every page: header menus and footer
+LAYOUT_TAG = 'layout'
+
+UNCACHED_HEADERS = {'set-cookie', 'vary'}
+
+
+def get_page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_SECONDS', 60 * 10)
+
+
+def get_page_cache_key(request):
+    """Key a response by host, full path, language and currency"""
+    url = f'{request.get_host()}{request.get_full_path()}'
+    return 'pagecache:{}:{}:{}'.format(
+        hashlib.md5(url.encode()).hexdigest(),
+        translation.get_language(),
+        get_preferences(request).currency,
+    )
+
+
+def is_cacheable_request(request):
+    """Only anonymous GET/HEAD requests without pending messages are cached"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not getattr(request, 'is_preview', False)
+        and not request.user.is_authenticated
+        and not len(getattr(request, '_messages', ()))
+    )
+
+
+# ============================================================================
+# TAG VERSIONS
+# ============================================================================
+
+def get_tag_key(tag):
+    return f'pagecache:tag:{tag}'
+
+
+def get_tag_versions(tags):
+    """Current version of each tag; a missing version reads as 0"""
+    stored = cache.get_many([get_tag_key(tag) for tag in tags])
+    return {tag: stored.get(get_tag_key(tag), 0) for tag in tags}
+
+
+def bump_tags(tags):
+    """Invalidate every cached page carrying any of ``tags``"""
+    for tag in tags:
+        try:
+            cache.incr(get_tag_key(tag))
+        except ValueError:
+            # An evicted version must not come back as a value already stored
+            cache.set(get_tag_key(tag), time.time_ns(), None)
+
+
+def get_page_tags(page):
+    """Tags a cached response for ``page`` depends on.
+
+    ``tree:<id>`` covers the page and each ancestor, so publishing a page
+    drops it and everything below it. ``children:<id>`` covers its own
+    children and its siblings, which index pages and related-post lists
+    show. ``page:<id>`` is bumped for changes to the page alone, such as
+    stock or a referenced snippet.
+    """
+    ancestor_ids = list(Page.objects.ancestor_of(page, inclusive=True).values_list('id', flat=True))
+    tags = [f'page:{page.pk}', f'children:{page.pk}', LAYOUT_TAG]
+    tags += [f'tree:{pk}' for pk in ancestor_ids]
+    if len(ancestor_ids) > 1:
+        tags.append(f'children:{ancestor_ids[-2]}')
+    tags += [f'model:{label}' for label in CACHEABLE_PAGE_MODELS[page._meta.label]]
+    return tags
+
+
+def invalidate_pages(page_ids):
+    """Drop the cached responses of individual pages"""
+    bump_tags([f'page:{pk}' for pk in page_ids])
+
+
+def invalidate_page_tree(page):
+    """Drop a page, everything below it and the lists its parent renders"""
+    tags = [f'tree:{page.pk}']
+    parent_path = page.path[:-page.steplen]
+    if parent_path:
+        parent_id = Page.objects.filter(path=parent_path).values_list('id', flat=True).first()
+        if parent_id:
+            tags.append(f'children:{parent_id}')
+    bump_tags(tags)
+
+
+def invalidate_layout():
+    """Drop every cached page, after a header or footer change"""
+    bump_tags([LAYOUT_TAG])
+
+
+# ============================================================================
+# STORE & SERVE
+# ============================================================================
+
+def prepare_page_cache(page, request):
+    """Mark a page render for caching; called before the page is served.
+
+    Tag versions are read now, before rendering, so an invalidation that
+    lands during the render makes the stored entry stale immediately.
+    """
+    renditions_pending.set(False)
+    if page._meta.label not in CACHEABLE_PAGE_MODELS or not is_cacheable_request(request):
+        return
+    tags = get_page_tags(page)
+    request.page_cache_render = True
+    request._page_cache = {'tags': tags, 'versions': get_tag_versions(tags)}
+
+
+def store_response(request, response):
+    """Save a rendered page response, minus its cookies.
+
+    Renders that showed placeholder renditions are not stored, so the page
+    is rendered again once the renditions exist.
+    """
+    entry = getattr(request, '_page_cache', None)
+    if (
+        entry is None
+        or request.method != 'GET'
+        or response.status_code != 200
+        or response.streaming
+        or renditions_pending.get()
+    ):
+        return
+    entry['content'] = response.content
+    entry['headers'] = [
+        (name, value) for name, value in response.items() if name.lower() not in UNCACHED_HEADERS
+    ]
+    cache.set(get_page_cache_key(request), entry, get_page_cache_timeout())
+
+
+def get_cached_response(request):
+    """Return the cached response for the request if none of its tags moved"""
+    entry = cache.get(get_page_cache_key(request))
+    if entry is None or get_tag_versions(entry['tags']) != entry['versions']:
+        return None
+    response = HttpResponse(entry['content'])
+    for name, value in entry['headers']:
+        response[name] = value
+    response['X-Page-Cache'] = 'hit'
+    return response
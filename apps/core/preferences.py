@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.utils import translation
+
+from apps.shop.models import UserProfile
+
+LANGUAGE_SESSION_KEY = '_language'
+CURRENCY_SESSION_KEY = 'currency'
+# Records which user's profile has already been copied into the session
+PROFILE_SESSION_KEY = '_preferences_user'
+
+DEFAULT_CURRENCY = 'USD'
+
+
+class Preferences:
+    """Language and currency resolved for one request"""
+
+    def __init__(self, language=None, currency=DEFAULT_CURRENCY):
+        self.language = language
+        self.currency = currency
+
+
+def get_preferences(request):
+    """Resolve the request's language and currency once.
+
+    Values live in the session. The shop profile is read only the first time
+    a signed-in user is seen in a session, so this costs at most one query
+    per session. The result is memoized on the request for the middlewares,
+    the context processor and the views that share it.
+    """
+    preferences = getattr(request, '_preferences', None)
+    if preferences is not None:
+        return preferences
+
+    session = getattr(request, 'session', None)
+    if session is None:
+        preferences = Preferences(currency=DEFAULT_CURRENCY)
+    else:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and session.get(PROFILE_SESSION_KEY) != user.pk:
+            load_profile_preferences(session, user)
+        preferences = Preferences(
+            language=session.get(LANGUAGE_SESSION_KEY),
+            currency=session.get(CURRENCY_SESSION_KEY, DEFAULT_CURRENCY),
+        )
+
+    request._preferences = preferences
+    return preferences
+
+
+def load_profile_preferences(session, user):
+    """Copy the profile's preferences into the session.
+
+    The profile currency wins over one picked before signing in; a language
+    already chosen in this session wins over the profile language.
+    """
+    profile = UserProfile.objects.filter(user=user).values('language', 'currency').first()
+    if profile:
+        if profile['currency']:
+            session[CURRENCY_SESSION_KEY] = profile['currency']
+        if profile['language'] and not session.get(LANGUAGE_SESSION_KEY):
+            session[LANGUAGE_SESSION_KEY] = profile['language']
+    session[PROFILE_SESSION_KEY] = user.pk
+
+
+def set_preferences(request, language=None, currency=None):
+    """Record a language or currency choice for the rest of the session"""
+    preferences = get_preferences(request)
+    if language:
+        request.session[LANGUAGE_SESSION_KEY] = language
+        preferences.language = language
+    if currency:
+        request.session[CURRENCY_SESSION_KEY] = currency
+        preferences.currency = currency
+    return preferences
+
+
+def activate_preferred_language(request):
+    """Activate the resolved language for the rest of the request"""
+    language = get_preferences(request).language
+    if language and language in dict(settings.LANGUAGES):
+        translation.activate(language)
+        request.LANGUAGE_CODE = language
@@ -0,0 +1,259 @@
+import contextvars
+import logging
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.templatetags.static import static
+from PIL import features
+from wagtail.images import get_image_model
+from wagtail.images.models import Filter, SourceImageIOError
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_IMAGE = 'images/placeholder.svg'
+PENDING_TIMEOUT = 60 * 5
+# How long a rendition that failed waits before it is queued again
+FAILED_RETRY_DELAY = 60 * 30
+
+# Renditions each page type's templates ask for, used to pre-warm them
+RENDITION_SPECS = {
+    'games.GamePage': {'featured_image': ['fill-400x250', 'fill-800x400']},
+    'blog.BlogPost': {'featured_image': ['fill-300x200', 'fill-800x400']},
+    'events.EventPage': {'featured_image': ['fill-400x200', 'fill-800x400']},
+    'shop.ProductPage': {'featured_image': ['fill-300x250', 'fill-600x600', 'fill-100x100']},
+}
+
+# Renditions generated as soon as an image is saved, by upload role: editor
+# uploads cover product cards and pages, hero slides and game galleries
+UPLOAD_RENDITION_SPECS = {
+    'editor': ['fill-300x250', 'fill-600x600', 'fill-1920x1080', 'fill-300x200'],
+    'avatar': ['fill-24x24', 'fill-100x100'],
+}
+
+# Modern formats offered ahead of the original format, best first. AVIF
+# needs a Pillow built with libavif (11.2+); offering it otherwise would
+# leave renditions that can never be generated
+RESPONSIVE_FORMATS = [
+    (image_format, mime)
+    for image_format, mime in [('avif', 'image/avif'), ('webp', 'image/webp')]
+    if image_format in features.modules and features.check_module(image_format)
+]
+MAX_DENSITY_WIDTH = 1920
+
+SIZE_PATTERN = re.compile(r'(fill|max|min)-(\d+)x(\d+)')
+
+# Set when something rendered a placeholder or partial srcset, so callers
+# caching rendered HTML can tell it will change once the renditions exist
+renditions_pending = contextvars.ContextVar('renditions_pending', default=False)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PlaceholderRendition:
+    """Stands in for a rendition that is still being generated"""
+
+    is_placeholder = True
+
+    def __init__(self, spec):
+        self.url = static(PLACEHOLDER_IMAGE)
+        match = SIZE_PATTERN.search(spec)
+        self.width, self.height = (int(match[2]), int(match[3])) if match else (None, None)
+
+
+def get_rendition_workers():
+    return getattr(settings, 'RENDITION_WORKERS', 2)
+
+
+def get_executor():
+    """Process pool for rendition work, started on first use.
+
+    Workers are spawned rather than forked so they never share the parent's
+    database connections, and set Django up once when they start.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=get_rendition_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+    return _executor
+
+
+def get_pending_key(image_id, spec):
+    return f'core:rendition_pending:{image_id}:{spec}'
+
+
+def get_failed_specs(image_id, specs):
+    """The ``specs`` that failed to render recently and are backing off"""
+    pending = cache.get_many([get_pending_key(image_id, spec) for spec in specs])
+    return {spec for spec in specs if pending.get(get_pending_key(image_id, spec)) == 'failed'}
+
+
+def generate_renditions(image_id, specs):
+    """Create any missing renditions of ``specs`` for one image.
+
+    Specs are rendered one at a time, so a spec that fails does not cost the
+    rest of the batch. A failed spec keeps its pending flag for
+    ``FAILED_RETRY_DELAY``, so it is not queued again by every request that
+    shows its placeholder in the meantime.
+    """
+    Image = get_image_model()
+    try:
+        image = Image.objects.get(pk=image_id)
+    except Image.DoesNotExist:
+        logger.warning('Could not render image %s: it no longer exists', image_id)
+        cache.delete_many([get_pending_key(image_id, spec) for spec in specs])
+        return {}
+
+    renditions = {}
+    failed = []
+    for spec in specs:
+        try:
+            renditions[spec] = image.get_rendition(spec)
+        except SourceImageIOError as e:
+            logger.warning('Could not render %s of image %s: %s', spec, image_id, e)
+            failed.append(spec)
+        except Exception:
+            logger.exception('Could not render %s of image %s', spec, image_id)
+            failed.append(spec)
+
+    cache.delete_many([get_pending_key(image_id, spec) for spec in renditions])
+    cache.set_many({get_pending_key(image_id, spec): 'failed' for spec in failed}, FAILED_RETRY_DELAY)
+    return renditions
+
+
+def _generate_in_worker(image_id, specs):
+    close_old_connections()
+    try:
+        generate_renditions(image_id, specs)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(image, specs):
+    """Queue generation of ``specs`` for ``image`` on the worker processes.
+
+    A short-lived cache flag stops every request that sees the missing
+    rendition, in any process, from queueing it again. With
+    ``RENDITION_WORKERS = 0`` renditions are generated inline instead.
+    """
+    specs = [spec for spec in specs if cache.add(get_pending_key(image.pk, spec), True, PENDING_TIMEOUT)]
+    if not specs:
+        return
+    if get_rendition_workers() == 0:
+        generate_renditions(image.pk, specs)
+    else:
+        get_executor().submit(_generate_in_worker, image.pk, specs)
+
+
+def prefetch_page_images(pages, field, *specs):
+    """Load the ``field`` images of ``pages`` and their renditions in two queries.
+
+    Templates then find existing renditions without a query per item.
+    """
+    image_ids = {getattr(page, f'{field}_id') for page in pages} - {None}
+    if not image_ids:
+        return pages
+    images = get_image_model().objects.filter(pk__in=image_ids).prefetch_renditions(*specs).in_bulk()
+    for page in pages:
+        image = images.get(getattr(page, f'{field}_id'))
+        if image is not None:
+            setattr(page, field, image)
+    return pages
+
+
+def get_rendition_or_placeholder(image, spec):
+    """Return an existing rendition, or a placeholder while it is generated"""
+    Rendition = image.get_rendition_model()
+    try:
+        return image.find_existing_rendition(Filter(spec=spec))
+    except Rendition.DoesNotExist:
+        # A spec that failed will not appear soon, so the page may still be cached
+        if not get_failed_specs(image.pk, [spec]):
+            renditions_pending.set(True)
+            schedule_renditions(image, [spec])
+        return PlaceholderRendition(spec)
+
+
+# ============================================================================
+# RESPONSIVE IMAGES
+# ============================================================================
+
+def get_density_specs(spec):
+    """``spec`` at 1x, plus 2x where that stays within MAX_DENSITY_WIDTH"""
+    match = SIZE_PATTERN.search(spec)
+    if not match or int(match[2]) * 2 > MAX_DENSITY_WIDTH:
+        return {1: spec}
+    double = f'{match[1]}-{int(match[2]) * 2}x{int(match[3]) * 2}'
+    return {1: spec, 2: spec.replace(match[0], double)}
+
+
+def get_format_spec(spec, image_format):
+    return f'{spec}|format-{image_format}' if image_format else spec
+
+
+def get_responsive_specs(spec):
+    """Every rendition the srcset tag can use for ``spec``"""
+    return [
+        get_format_spec(density_spec, image_format)
+        for density_spec in get_density_specs(spec).values()
+        for image_format in [None, *(image_format for image_format, mime in RESPONSIVE_FORMATS)]
+    ]
+
+
+def schedule_upload_renditions(image, role='editor'):
+    """Queue every rendition configured for a newly uploaded image"""
+    specs = [
+        responsive_spec
+        for spec in UPLOAD_RENDITION_SPECS[role]
+        for responsive_spec in get_responsive_specs(spec)
+    ]
+    schedule_renditions(image, specs)
+
+
+def get_responsive_image(image, spec):
+    """Renditions for a ``<picture>`` of ``image`` at ``spec``.
+
+    Only renditions that already exist are used, in one lookup; missing ones
+    are queued. A format is offered once all its densities exist, and the
+    placeholder is shown until the 1x original-format rendition does.
+    """
+    densities = get_density_specs(spec)
+    formats = [] if image.is_svg() else RESPONSIVE_FORMATS
+    specs = get_responsive_specs(spec) if formats else list(densities.values())
+    existing = image.find_existing_renditions(*[Filter(spec=s) for s in specs])
+    found = {f.spec: rendition for f, rendition in existing.items()}
+
+    missing = [s for s in specs if s not in found]
+    if missing:
+        failed = get_failed_specs(image.pk, missing)
+        missing = [s for s in missing if s not in failed]
+    if missing:
+        renditions_pending.set(True)
+        schedule_renditions(image, missing)
+
+    def get_srcset(image_format):
+        renditions = [(density, found.get(get_format_spec(s, image_format))) for density, s in densities.items()]
+        if all(rendition for density, rendition in renditions):
+            return ', '.join(f'{rendition.url} {density}x' for density, rendition in renditions)
+        return None
+
+    sources = []
+    for image_format, mime in formats:
+        srcset = get_srcset(image_format)
+        if srcset:
+            sources.append({'type': mime, 'srcset': srcset})
+    return {
+        'img': found.get(spec) or PlaceholderRendition(spec),
+        'srcset': get_srcset(None),
+        'sources': sources if spec in found else [],
+    }
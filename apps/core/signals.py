@@ -0,0 +1,95 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from wagtail.images import get_image_model
+from wagtail.models import Page, ReferenceIndex
+from wagtail.signals import page_published, page_unpublished, post_page_move
+from wagtail.snippets.models import get_snippet_models
+from wagtailmenus.models import MainMenu, MainMenuItem, FlatMenu, FlatMenuItem
+
+from apps.games.models import GameCategory, GamesIndexPage
+from apps.shop.models import ProductCategory, Brand, ShopIndexPage
+from .blockcache import invalidate_block_cache
+from .context_processors import invalidate_footer_cache
+from .models import SocialMediaLink, PrivacyPolicyPage, TermsOfServicePage
+from .pagecache import bump_tags, invalidate_layout, invalidate_page_tree, invalidate_pages
+from .renditions import schedule_upload_renditions
+
+FOOTER_SNIPPETS = [SocialMediaLink, Brand, ProductCategory, GameCategory]
+FOOTER_PAGES = (PrivacyPolicyPage, TermsOfServicePage, ShopIndexPage, GamesIndexPage)
+MENU_MODELS = [MainMenu, MainMenuItem, FlatMenu, FlatMenuItem]
+
+
+def page_changed(sender, instance, **kwargs):
+    """Drop the cached page, its subtree and its parent's child listings"""
+    invalidate_page_tree(instance)
+    if issubclass(instance.specific_class or Page, FOOTER_PAGES):
+        invalidate_footer_cache()
+        invalidate_layout()
+    elif instance.show_in_menus:
+        invalidate_layout()
+
+
+def page_was_moved(sender, instance, parent_page_before, parent_page_after, **kwargs):
+    """A move changes the page's URL and both parents' child listings"""
+    page_changed(sender, instance)
+    bump_tags([f'children:{parent_page_before.pk}', f'children:{parent_page_after.pk}'])
+
+
+def footer_snippet_changed(sender, **kwargs):
+    """A snippet listed in the footer was added, edited or removed"""
+    invalidate_footer_cache()
+    invalidate_layout()
+
+
+def menu_changed(sender, **kwargs):
+    """Menus are rendered in the header of every page"""
+    invalidate_layout()
+
+
+def referenced_object_changed(sender, instance, **kwargs):
+    """Drop cached pages that reference a snippet or image that changed"""
+    if sender not in get_snippet_models() and sender is not get_image_model():
+        return
+    bump_tags([f'model:{sender._meta.label}'])
+    page_type = ContentType.objects.get_for_model(Page)
+    page_ids = ReferenceIndex.get_references_to(instance).filter(
+        base_content_type=page_type
+    ).values_list('object_id', flat=True)
+    invalidate_pages(set(page_ids))
+
+
+def image_uploaded(sender, instance, created, raw=False, **kwargs):
+    """Render a new image's configured renditions before anyone views it.
+
+    Callers saving a non-editor image set ``upload_role`` on it first.
+    """
+    if created and not raw:
+        role = getattr(instance, 'upload_role', 'editor')
+        transaction.on_commit(lambda: schedule_upload_renditions(instance, role))
+
+
+def image_changed(sender, **kwargs):
+    """Cached StreamField blocks embed the rendition URLs of their images"""
+    invalidate_block_cache()
+
+
+page_published.connect(page_changed, dispatch_uid='core_page_published')
+page_unpublished.connect(page_changed, dispatch_uid='core_page_unpublished')
+post_page_move.connect(page_was_moved, dispatch_uid='core_page_moved')
+
+for model in FOOTER_SNIPPETS:
+    post_save.connect(footer_snippet_changed, sender=model, dispatch_uid=f'core_footer_save_{model.__name__}')
+    post_delete.connect(footer_snippet_changed, sender=model, dispatch_uid=f'core_footer_delete_{model.__name__}')
+
+for model in MENU_MODELS:
+    post_save.connect(menu_changed, sender=model, dispatch_uid=f'core_menu_save_{model.__name__}')
+    post_delete.connect(menu_changed, sender=model, dispatch_uid=f'core_menu_delete_{model.__name__}')
+
+post_save.connect(image_uploaded, sender=get_image_model(), dispatch_uid='core_image_uploaded')
+post_save.connect(image_changed, sender=get_image_model(), dispatch_uid='core_image_changed')
+post_delete.connect(image_changed, sender=get_image_model(), dispatch_uid='core_image_deleted')
+
+# Snippets register once every app is ready, so filter inside the receiver
+post_save.connect(referenced_object_changed, dispatch_uid='core_reference_save')
+post_delete.connect(referenced_object_changed, dispatch_uid='core_reference_delete')
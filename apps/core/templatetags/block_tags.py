@@ -0,0 +1,14 @@
+from django import template
+
+from apps.core.blockcache import render_cached_streams
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def cached_streams(context, page, *field_names):
+    """Rendered HTML of each block in ``page``'s StreamFields, by field name.
+
+    Usage: {% cached_streams page "hero_slides" "featured_games" as blocks %}
+    """
+    return render_cached_streams(context, page, field_names)
@@ -0,0 +1,29 @@
+from django import template
+
+from apps.core.renditions import get_rendition_or_placeholder, get_responsive_image
+
+register = template.Library()
+
+
+@register.simple_tag
+def listing_image(image, spec):
+    """Rendition of ``image`` for a listing, never rendered inside the request.
+
+    Usage: {% listing_image game.featured_image "fill-400x250" as img %}
+    """
+    return get_rendition_or_placeholder(image, spec)
+
+
+@register.inclusion_tag('includes/responsive_image.html')
+def srcset(image, spec, alt='', css_class='', loading='lazy', **attrs):
+    """``<picture>`` of ``image`` offering AVIF and WebP at 1x and 2x.
+
+    Usage: {% srcset page.featured_image "fill-600x600" alt=page.title css_class="img-fluid" %}
+    """
+    return {
+        **get_responsive_image(image, spec),
+        'alt': alt,
+        'css_class': css_class,
+        'loading': loading,
+        'attrs': attrs,
+    }
@@ -0,0 +1,362 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Site
+
+from apps.events.models import EventsIndexPage, EventPage
+from apps.home.models import HomePage
+
+from apps.shop.models import Brand
+from .context_processors import footer_context
+from .lazy import lazy_context
+from .renditions import (
+    RESPONSIVE_FORMATS, PlaceholderRendition, generate_renditions, get_pending_key,
+    get_rendition_or_placeholder, get_responsive_image, get_responsive_specs, prefetch_page_images,
+    renditions_pending, schedule_renditions
+)
+from .preferences import CURRENCY_SESSION_KEY, LANGUAGE_SESSION_KEY
+from .models import SocialMediaLink
+from .versions import bump_version, get_version
+
+
+class FooterContextTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        SocialMediaLink.objects.create(name='YouTube', url='https://youtube.com/', icon_class='bi-youtube')
+
+    def test_warm_footer_runs_no_queries(self):
+        list(footer_context(self.factory.get('/'))['social_links'])
+
+        with self.assertNumQueries(0):
+            context = footer_context(self.factory.get('/'))
+            self.assertEqual([link.name for link in context['social_links']], ['YouTube'])
+
+    def test_snippet_save_invalidates_footer(self):
+        list(footer_context(self.factory.get('/'))['footer_brands'])
+
+        Brand.objects.create(name='Brickaria')
+
+        context = footer_context(self.factory.get('/'))
+        self.assertEqual([brand.name for brand in context['footer_brands']], ['Brickaria'])
+
+    def test_cache_is_keyed_by_host(self):
+        list(footer_context(self.factory.get('/'))['social_links'])
+
+        with self.assertNumQueries(0):
+            list(footer_context(self.factory.get('/'))['social_links'])
+        other_host = self.factory.get('/', HTTP_HOST='shop.example.com')
+        with self.settings(ALLOWED_HOSTS=['*']), CaptureQueriesContext(connection) as queries:
+            list(footer_context(other_host)['social_links'])
+        self.assertTrue(queries.captured_queries)
+
+    def test_unused_footer_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            footer_context(self.factory.get('/'))
+
+
+class LazyContextTestCase(TestCase):
+    def test_loader_runs_once_on_first_access(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {'a': 1, 'b': None}
+
+        context = lazy_context(loader, ['a', 'b'])
+        self.assertEqual(calls, [])
+
+        self.assertEqual(context['a'] + 1, 2)
+        self.assertFalse(context['b'])
+        self.assertEqual(calls, [1])
+
+
+class PreferencesTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.user.shop_profile.currency = 'EUR'
+        self.user.shop_profile.language = 'de'
+        self.user.shop_profile.save()
+        self.client.force_login(self.user)
+
+    def profile_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(path)
+        return [q for q in queries.captured_queries if 'shop_userprofile' in q['sql']]
+
+    def test_profile_is_read_once_per_session(self):
+        self.assertEqual(len(self.profile_queries(reverse('shop:cart_count'))), 1)
+        self.assertEqual(self.client.session[CURRENCY_SESSION_KEY], 'EUR')
+        self.assertEqual(self.client.session[LANGUAGE_SESSION_KEY], 'de')
+
+        self.assertEqual(self.profile_queries(reverse('shop:cart_count')), [])
+
+    def test_set_currency_updates_session_and_profile(self):
+        self.client.post(reverse('shop:set_currency'), {'currency': 'GBP'})
+
+        self.assertEqual(self.client.session[CURRENCY_SESSION_KEY], 'GBP')
+        self.user.shop_profile.refresh_from_db()
+        self.assertEqual(self.user.shop_profile.currency, 'GBP')
+        self.assertEqual(self.profile_queries(reverse('shop:cart_count')), [])
+
+
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = Site.objects.get(is_default_site=True).root_page
+        self.events = EventsIndexPage(title='Events', slug='test-events')
+        root.add_child(instance=self.events)
+        self.event = EventPage(
+            title='Build Night', slug='build-night', description='<p>Bring bricks</p>',
+            start_date=timezone.now()
+        )
+        self.events.add_child(instance=self.event)
+        self.event.save_revision().publish()
+        self.url = self.event.url
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', first)
+
+        second = self.client.get(self.url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertNotIn('csrftoken', second.cookies)
+        self.assertContains(second, reverse('page_state'))
+
+    def test_publishing_the_page_or_its_parent_invalidates(self):
+        self.client.get(self.url)
+
+        self.event.title = 'Build Night 2'
+        self.event.save_revision().publish()
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Build Night 2')
+
+        self.events.save_revision().publish()
+        self.assertNotIn('X-Page-Cache', self.client.get(self.url))
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+
+    def test_signed_in_users_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'pass12345'))
+
+        self.assertNotIn('X-Page-Cache', self.client.get(self.url))
+
+    def test_page_state_hydration(self):
+        data = self.client.get(reverse('page_state')).json()
+        self.assertTrue(data['csrf_token'])
+        self.assertEqual(data['cart_count'], 0)
+
+
+@override_settings(RENDITION_WORKERS=0)
+class RenditionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        root = Site.objects.get(is_default_site=True).root_page
+        self.events = EventsIndexPage(title='Events', slug='test-events')
+        root.add_child(instance=self.events)
+        for index in range(3):
+            image = get_image_model().objects.create(title=f'Event {index}', file=get_test_image_file())
+            self.events.add_child(instance=EventPage(
+                title=f'Event {index}', slug=f'event-{index}', description='<p>Bricks</p>',
+                start_date=timezone.now(), featured_image=image,
+            ))
+
+    def test_missing_rendition_is_a_placeholder_then_generated(self):
+        image = get_image_model().objects.first()
+        rendition = get_rendition_or_placeholder(image, 'fill-400x200')
+        self.assertIsInstance(rendition, PlaceholderRendition)
+        self.assertEqual((rendition.width, rendition.height), (400, 200))
+
+        self.assertTrue(image.renditions.filter(filter_spec='fill-400x200').exists())
+        image = get_image_model().objects.get(pk=image.pk)
+        self.assertNotIsInstance(get_rendition_or_placeholder(image, 'fill-400x200'), PlaceholderRendition)
+
+    def test_listing_renditions_load_in_bulk(self):
+        for image in get_image_model().objects.all():
+            image.get_rendition('fill-400x200')
+        events = list(self.events.get_children().live().specific())
+
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_page_images(events, 'featured_image', 'fill-400x200')
+            renditions = [get_rendition_or_placeholder(event.featured_image, 'fill-400x200') for event in events]
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any(isinstance(r, PlaceholderRendition) for r in renditions))
+
+    def test_events_index_renders_listing_images(self):
+        response = self.client.get(self.events.url)
+        self.assertContains(response, 'images/placeholder.svg', count=3)
+        self.assertContains(self.client.get(self.events.url), 'fill-400x200', count=3)
+
+    def test_upload_generates_role_renditions(self):
+        image = get_image_model()(title='Avatar', file=get_test_image_file())
+        image.upload_role = 'avatar'
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        specs = set(image.renditions.values_list('filter_spec', flat=True))
+        # Two sizes at 1x and 2x, each in the original and every modern format
+        self.assertEqual(len(specs), 4 * (1 + len(RESPONSIVE_FORMATS)))
+        self.assertIn('fill-48x48|format-webp', specs)
+
+    def test_failed_spec_backs_off_without_dropping_the_batch(self):
+        Image = get_image_model()
+        image = Image.objects.first()
+        get_rendition = Image.get_rendition
+
+        def fail_small(self, spec):
+            if spec == 'fill-50x50':
+                raise ValueError('Corrupt image')
+            return get_rendition(self, spec)
+
+        cache.add(get_pending_key(image.pk, 'fill-50x50'), True)
+        with mock.patch.object(Image, 'get_rendition', fail_small), self.assertLogs('apps.core.renditions', 'ERROR'):
+            renditions = generate_renditions(image.pk, ['fill-50x50', 'fill-60x60'])
+        self.assertEqual(list(renditions), ['fill-60x60'])
+        self.assertEqual(cache.get(get_pending_key(image.pk, 'fill-50x50')), 'failed')
+
+        # Not queued again until the back-off expires
+        with mock.patch('apps.core.renditions.generate_renditions') as generate:
+            schedule_renditions(image, ['fill-50x50'])
+        generate.assert_not_called()
+
+    def test_failed_spec_does_not_hold_pages_out_of_the_cache(self):
+        image = get_image_model().objects.first()
+        cache.set(get_pending_key(image.pk, 'fill-50x50'), 'failed')
+
+        renditions_pending.set(False)
+        self.assertIsInstance(get_rendition_or_placeholder(image, 'fill-50x50'), PlaceholderRendition)
+        self.assertFalse(renditions_pending.get())
+
+        specs = get_responsive_specs('fill-50x50')
+        cache.set_many({get_pending_key(image.pk, spec): 'failed' for spec in specs})
+        get_responsive_image(image, 'fill-50x50')
+        self.assertFalse(renditions_pending.get())
+
+    def test_srcset_offers_modern_formats_once_generated(self):
+        template = Template('{% load image_tags %}{% srcset image "fill-100x100" alt="Avatar" %}')
+        image = get_image_model().objects.first()
+
+        html = template.render(Context({'image': image}))
+        self.assertIn('images/placeholder.svg', html)
+        self.assertNotIn('<source', html)
+
+        html = template.render(Context({'image': get_image_model().objects.get(pk=image.pk)}))
+        if ('avif', 'image/avif') in RESPONSIVE_FORMATS:
+            self.assertIn('type="image/avif"', html)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('fill-200x200', html)
+        self.assertIn('width="100" height="100"', html)
+
+
+@override_settings(RENDITION_WORKERS=0)
+class BlockCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.image = get_image_model().objects.create(title='Slide', file=get_test_image_file())
+        root = Site.objects.get(is_default_site=True).root_page
+        self.home = HomePage(
+            title='Home', slug='test-home',
+            hero_slides=[('slide', {'title': 'Welcome', 'image': self.image})],
+            vision_content=[
+                ('vision', {'title': 'Build', 'description': '<p>Bricks</p>', 'image': self.image}),
+                ('vision', {'title': 'Play', 'description': '<p>Games</p>'}),
+            ],
+            achievements=[('achievement', {'title': 'Launch', 'description': 'Shipped', 'icon': 'bi-star'})],
+        )
+        root.add_child(instance=self.home)
+        self.template = Template(
+            '{% load block_tags %}'
+            '{% cached_streams page "hero_slides" "vision_content" "achievements" as blocks %}'
+            '{% for block in blocks.hero_slides %}{{ block }}{% endfor %}'
+            '{% for block in blocks.vision_content %}{{ block }}{% endfor %}'
+            '{% for block in blocks.achievements %}{{ block }}{% endfor %}'
+        )
+
+    def render(self):
+        return self.template.render(Context({'page': HomePage.objects.get(pk=self.home.pk)}))
+
+    def test_blocks_render_from_cache(self):
+        self.render()  # generates the hero renditions, so the slide is not stored yet
+        html = self.render()
+        self.assertIn('Welcome', html)
+        self.assertIn('type="image/webp"', html)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.render(), html)
+        self.assertFalse([q for q in queries.captured_queries if 'wagtailimages' in q['sql']])
+
+    def test_image_lookups_are_batched(self):
+        self.image.get_renditions(*get_responsive_specs('fill-1920x1080'))
+        with CaptureQueriesContext(connection) as queries:
+            self.render()
+        image_queries = [q for q in queries.captured_queries if 'FROM "wagtailimages_image"' in q['sql']]
+        self.assertEqual(len(image_queries), 1)
+
+    def test_page_with_placeholders_is_not_page_cached(self):
+        self.home.save_revision().publish()
+        first = self.client.get(self.home.url)
+        self.assertContains(first, 'images/placeholder.svg')
+
+        second = self.client.get(self.home.url)
+        self.assertNotIn('X-Page-Cache', second)
+        self.assertNotContains(second, 'images/placeholder.svg')
+        self.assertEqual(self.client.get(self.home.url)['X-Page-Cache'], 'hit')
+
+    def test_home_page_query_budget(self):
+        # Signed in, so the page cache is bypassed and the view itself is measured
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'pass12345'))
+        self.client.get(self.home.url)
+        with self.assertNumQueries(16):
+            self.client.get(self.home.url)
+
+    def test_image_change_invalidates(self):
+        self.render()
+        self.render()
+        self.image.title = 'New slide'
+        self.image.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.render()
+        self.assertTrue([q for q in queries.captured_queries if 'wagtailimages_image' in q['sql']])
+
+
+class VersionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_is_stable_until_bumped(self):
+        version = get_version('core:test_version')
+        self.assertEqual(get_version('core:test_version'), version)
+        bump_version('core:test_version')
+        self.assertNotEqual(get_version('core:test_version'), version)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_version_is_stable_when_the_cache_keeps_nothing(self):
+        version = get_version('core:test_version')
+        self.assertEqual(get_version('core:test_version'), version)
+        bump_version('core:test_version')
+        self.assertNotEqual(get_version('core:test_version'), version)
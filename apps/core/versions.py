@@ -0,0 +1,32 @@
+import time
+
+from django.core.cache import cache
+
+# Stamps of this process for caches that keep nothing, e.g. DummyCache in development
+_local_versions = {}
+
+
+def get_version(key):
+    """Shared version stamp stored under ``key``, for tables kept in-process.
+
+    A missing stamp is replaced by a fresh one, so no process keeps a table
+    under a version reused after eviction. When the cache cannot hold the
+    stamp, a stable stamp local to this process is used instead, so callers
+    still reload only after ``bump_version``.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+        if version is None:
+            version = _local_versions.setdefault(key, time.time_ns())
+    return version
+
+
+def bump_version(key):
+    """Move the stamp under ``key`` so every process reloads its table"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+    _local_versions.pop(key, None)
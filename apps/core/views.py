@@ -1,8 +1,13 @@
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
+from django.views.decorators.cache import never_cache
 from django.views.generic import TemplateView
 from django.utils import translation
 from wagtail.models import Page
+from apps.shop.cart import get_cached_cart_count
 from .models import ErrorPage
+from .preferences import set_preferences
 
 
 class SearchView(TemplateView):
@@ -29,6 +34,7 @@ def set_language(request):
         
         if language:
             translation.activate(language)
+            set_preferences(request, language=language)
             response = redirect(next_url)
             response.set_cookie('django_language', language)
             
@@ -42,6 +48,15 @@ def set_language(request):
     return redirect('/')
 
 
+@never_cache
+def page_state(request):
+    """Per-visitor values filled into pages served from the page cache"""
+    return JsonResponse({
+        'csrf_token': get_token(request),
+        'cart_count': get_cached_cart_count(request) or 0,
+    })
+
+
 def get_error_page(request, error_code):
     """Get custom error page from Wagtail or fallback to default"""
     try:
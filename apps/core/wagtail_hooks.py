@@ -2,6 +2,8 @@ from wagtail import hooks
 from wagtailmenus.models import FlatMenu, MainMenu
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel
 
+from .pagecache import prepare_page_cache
+
 
 @hooks.register('register_snippet')
 def register_custom_menus():
@@ -23,4 +25,10 @@ def register_custom_menus():
             FieldPanel('max_levels'),
             FieldPanel('use_specific'),
         ], heading="Settings"),
-    ]
\ No newline at end of file
+    ]
+
+
+@hooks.register('before_serve_page')
+def mark_page_cacheable(page, request, serve_args, serve_kwargs):
+    """Let the anonymous page cache store this render"""
+    prepare_page_cache(page, request)
@@ -3,6 +3,8 @@ from wagtail.models import Page
 from wagtail.fields import RichTextField
 from wagtail.admin.panels import FieldPanel
 
+from apps.core.renditions import RENDITION_SPECS, prefetch_page_images
+
 
 class EventsIndexPage(Page):
     """Events listing page"""
@@ -12,6 +14,14 @@ class EventsIndexPage(Page):
         FieldPanel('intro'),
     ]
 
+    def get_context(self, request):
+        context = super().get_context(request)
+        events = self.get_children().live().specific()
+        context['events'] = prefetch_page_images(
+            list(events), 'featured_image', *RENDITION_SPECS['events.EventPage']['featured_image']
+        )
+        return context
+
 
 class EventPage(Page):
     """Individual event page"""
@@ -9,6 +9,8 @@ from modelcluster.fields import ParentalKey, ParentalManyToManyField
 from modelcluster.contrib.taggit import ClusterTaggableManager
 from taggit.models import TaggedItemBase
 
+from apps.core.renditions import RENDITION_SPECS, prefetch_page_images
+
 
 class GameTag(TaggedItemBase):
     content_object = ParentalKey(
@@ -54,7 +56,9 @@ class GamesIndexPage(Page):
         if category:
             games = games.filter(gamepage__categories__name__iexact=category)
         
-        context['games'] = games
+        context['games'] = prefetch_page_images(
+            list(games.specific()), 'featured_image', *RENDITION_SPECS['games.GamePage']['featured_image']
+        )
         context['categories'] = GameCategory.objects.all()
         return context
 
@@ -3,7 +3,9 @@ from django.shortcuts import redirect
 from django.utils import translation
 from wagtail.models import Page, Locale
 
-LANGUAGE_SESSION_KEY = '_language'
+from apps.community.models import UserProfile as CommunityProfile
+from apps.core.preferences import set_preferences
+from apps.shop.models import UserProfile as ShopProfile
 
 
 def switch_language(request):
@@ -14,13 +16,11 @@ def switch_language(request):
         return HttpResponseBadRequest("Missing language parameter")
 
     translation.activate(lang_code)
-    request.session[LANGUAGE_SESSION_KEY] = lang_code
+    set_preferences(request, language=lang_code)
 
-    if request.user.is_authenticated and hasattr(request.user, 'userprofile'):
-        request.user.userprofile.language = lang_code
-        request.user.shop_profile.language = lang_code
-        request.user.userprofile.save(update_fields=['language'])
-        request.user.shop_profile.save(update_fields=['language'])
+    if request.user.is_authenticated:
+        CommunityProfile.objects.filter(user=request.user).update(language=lang_code)
+        ShopProfile.objects.filter(user=request.user).update(language=lang_code)
 
     if page_id:
         try:
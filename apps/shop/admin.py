@@ -4,7 +4,8 @@ from .models import (
     ProductCategory, Brand, ProductPage, ProductAttribute, ProductAttributeValue,
     ProductVariant, UserProfile, Address, Cart, CartItem, Coupon, Order, OrderItem,
     Payment, ShippingMethod, Shipment, LoyaltyTransaction, Wishlist, WishlistItem,
-    ProductReview
+    ProductReview, EmailNotification, OutboxEvent, ExchangeRate, ShippingZone, ShippingRate,
+    TaxRate
 )
 
 # Keep existing admin for Django admin
@@ -128,11 +129,58 @@ class PaymentAdmin(admin.ModelAdmin):
     readonly_fields = ['payment_id', 'created_at', 'processed_at']
 
 
+@admin.register(EmailNotification)
+class EmailNotificationAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'order', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['order__order_number', 'recipient', 'idempotency_key']
+    readonly_fields = ['idempotency_key', 'created_at', 'sent_at', 'last_error']
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'order', 'status', 'attempts', 'available_at', 'processed_at']
+    list_filter = ['topic', 'status', 'created_at']
+    search_fields = ['order__order_number', 'idempotency_key']
+    readonly_fields = ['idempotency_key', 'payload', 'created_at', 'processed_at', 'last_error']
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ['currency', 'rate', 'updated_at']
+    readonly_fields = ['updated_at']
+
+    def save_model(self, request, obj, form, change):
+        from .currency import bump_rates_version
+        super().save_model(request, obj, form, change)
+        # Derived prices follow on the next update_exchange_rates run
+        bump_rates_version()
+
+
+@admin.register(TaxRate)
+class TaxRateAdmin(admin.ModelAdmin):
+    list_display = ['country', 'region', 'tax_class', 'rate']
+    list_filter = ['tax_class', 'country']
+    search_fields = ['region']
+
+
+class ShippingRateInline(admin.TabularInline):
+    model = ShippingRate
+    extra = 0
+
+
 @admin.register(ShippingMethod)
 class ShippingMethodAdmin(admin.ModelAdmin):
     list_display = ['name', 'base_cost', 'min_delivery_days', 'max_delivery_days', 'is_active']
     list_filter = ['is_active']
     search_fields = ['name']
+    inlines = [ShippingRateInline]
+
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    list_display = ['name', 'countries']
+    search_fields = ['name']
 
 
 @admin.register(Shipment)
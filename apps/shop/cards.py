@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from .listing import get_listing_version
+
+PRODUCT_CARD_TEMPLATE = 'shop/includes/product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_card_cache_key(product, currency, language, version):
+    """Card fragments depend on the listing row, the price currency and the language.
+
+    The listing version moves on every publish and whenever a product goes
+    in or out of stock, so a key never outlives the data it was rendered from.
+    """
+    return f'shop:card:{version}:{product.pk}:{product.revision_id}:{currency}:{language}'
+
+
+def render_product_cards(context, products):
+    """Render the cards for ``products``, reusing cached fragments.
+
+    All keys are fetched with one ``get_many`` and the misses are rendered
+    and stored with one ``set_many``, so a warm page costs a single cache
+    round trip however many cards it shows.
+    """
+    currency = str(context.get('user_currency', 'USD'))
+    language = translation.get_language()
+    version = get_listing_version()
+
+    keys = [get_card_cache_key(product, currency, language, version) for product in products]
+    cached = cache.get_many(keys)
+
+    template = context.template.engine.get_template(PRODUCT_CARD_TEMPLATE)
+    parts = []
+    missing = {}
+    for product, key in zip(products, keys):
+        html = cached.get(key)
+        if html is None:
+            with context.push(product=product):
+                html = template.render(context)
+            missing[key] = html
+        parts.append(html)
+
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(parts))
@@ -0,0 +1,228 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, Count, DecimalField, F, Sum, When, Value
+from django.db.models.functions import Coalesce
+
+from apps.core.versions import bump_version, get_version
+from .models import CartItem
+
+SUPPORTED_CURRENCIES = ['USD', 'EUR', 'GBP', 'CAD', 'AUD']
+CART_SUMMARY_TIMEOUT = 60 * 60
+CART_COUNT_SESSION_KEY = 'cart_item_count'
+PRICES_VERSION_KEY = 'shop:prices_version'
+
+TWO_PLACES = Decimal('0.01')
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartSummary:
+    """Item count, per-currency subtotals and weight of a cart"""
+
+    def __init__(self, line_count=0, total_items=0, subtotals=None, total_weight=Decimal('0')):
+        self.line_count = line_count
+        self.total_items = total_items
+        self.subtotals = subtotals or {currency: Decimal('0.00') for currency in SUPPORTED_CURRENCIES}
+        self.total_weight = total_weight
+
+    @property
+    def subtotal(self):
+        return self.subtotals['USD']
+
+    def get_subtotal(self, currency='USD'):
+        """Get subtotal in specified currency"""
+        return self.subtotals.get(currency, self.subtotal)
+
+    @property
+    def is_empty(self):
+        return self.line_count == 0
+
+
+class CartLine:
+    """A cart line as pricing rules see it: product, categories, tax class and USD price"""
+    __slots__ = ('product_id', 'category_ids', 'quantity', 'unit_price', 'is_digital', 'tax_class')
+
+    def __init__(self, product_id, category_ids, quantity, unit_price, is_digital=False, tax_class='standard'):
+        self.product_id = product_id
+        self.category_ids = category_ids
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.is_digital = is_digital
+        self.tax_class = tax_class
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+
+def _unit_price_expression(currency):
+    """SQL equivalent of ``CartItem.get_unit_price(currency)``"""
+    if currency == 'USD':
+        variant_price = Coalesce('variant__sale_price', 'variant__price')
+        product_price = Coalesce('product__sale_price', 'product__price')
+    else:
+        suffix = currency.lower()
+        variant_price = Coalesce(
+            f'variant__sale_price_{suffix}', f'variant__price_{suffix}', 'variant__price'
+        )
+        product_price = Coalesce(
+            f'product__sale_price_{suffix}', f'product__price_{suffix}', 'product__price'
+        )
+    return Case(
+        When(variant__isnull=False, then=variant_price),
+        default=product_price,
+        output_field=MONEY,
+    )
+
+
+def compute_cart_summary(cart_id):
+    """Aggregate a cart's lines, subtotals and weight in a single query"""
+    aggregates = {
+        'line_count': Count('id'),
+        'total_items': Coalesce(Sum('quantity'), 0),
+        'total_weight': Coalesce(
+            Sum(F('quantity') * Case(
+                When(variant__isnull=False, then=Coalesce('variant__weight', Value(Decimal('0')))),
+                default=Coalesce('product__weight', Value(Decimal('0'))),
+                output_field=MONEY,
+            ), output_field=MONEY),
+            Value(Decimal('0')),
+            output_field=MONEY,
+        ),
+    }
+    for currency in SUPPORTED_CURRENCIES:
+        aggregates[f'subtotal_{currency}'] = Coalesce(
+            Sum(F('quantity') * _unit_price_expression(currency), output_field=MONEY),
+            Value(Decimal('0')),
+            output_field=MONEY,
+        )
+
+    totals = CartItem.objects.filter(cart_id=cart_id).aggregate(**aggregates)
+
+    return CartSummary(
+        line_count=totals['line_count'],
+        total_items=totals['total_items'],
+        subtotals={
+            currency: Decimal(totals[f'subtotal_{currency}']).quantize(TWO_PLACES)
+            for currency in SUPPORTED_CURRENCIES
+        },
+        total_weight=Decimal(totals['total_weight']),
+    )
+
+
+def get_cart_lines(cart):
+    """Load a cart's lines with their product categories in one query.
+
+    Used by the coupon and tax engines; memoized on the cart instance like
+    its summary.
+    """
+    lines = getattr(cart, '_lines', None)
+    if lines is None:
+        by_item = {}
+        rows = CartItem.objects.filter(cart_id=cart.pk).annotate(
+            line_unit_price=_unit_price_expression('USD')
+        ).values_list(
+            'id', 'product_id', 'quantity', 'line_unit_price', 'product__is_digital',
+            'product__tax_class', 'product__categories'
+        )
+        for item_id, product_id, quantity, unit_price, is_digital, tax_class, category_id in rows:
+            line = by_item.get(item_id)
+            if line is None:
+                line = by_item[item_id] = CartLine(
+                    product_id, set(), quantity, Decimal(unit_price), is_digital, tax_class
+                )
+            if category_id is not None:
+                line.category_ids.add(category_id)
+        lines = cart._lines = list(by_item.values())
+    return lines
+
+
+def get_prices_version():
+    return get_version(PRICES_VERSION_KEY)
+
+
+def bump_prices_version():
+    """Retire every cached cart summary and tax after product prices change"""
+    bump_version(PRICES_VERSION_KEY)
+
+
+def get_cart_summary_cache_key(cart_id, prices_version=None):
+    return f'shop:cart_summary:{cart_id}:{prices_version or get_prices_version()}'
+
+
+def get_cart_tax_cache_key(cart_id, prices_version=None):
+    return f'shop:cart_tax:{cart_id}:{prices_version or get_prices_version()}'
+
+
+def get_cart_summary(cart):
+    """Return the cart summary, memoized on the cart instance and in the cache.
+
+    Views fetch a fresh Cart per request, so the instance memo lasts exactly
+    one request. The shared cache entry is dropped on every CartItem write
+    and keyed by the prices version, which moves whenever prices change.
+    """
+    summary = getattr(cart, '_summary', None)
+    if summary is None:
+        cache_key = get_cart_summary_cache_key(cart.pk)
+        summary = cache.get(cache_key)
+        if summary is None:
+            summary = compute_cart_summary(cart.pk)
+            cache.set(cache_key, summary, CART_SUMMARY_TIMEOUT)
+        cart._summary = summary
+    return summary
+
+
+def invalidate_cart_summary(cart_id, cart=None):
+    """Drop the cached summary and tax after a cart's items change"""
+    prices_version = get_prices_version()
+    cache.delete_many([
+        get_cart_summary_cache_key(cart_id, prices_version),
+        get_cart_tax_cache_key(cart_id, prices_version),
+    ])
+    if cart is not None:
+        # Along with the per-request lines and quotes derived from the cart
+        cart._summary = None
+        cart._lines = None
+        cart._shipping_quotes = None
+
+
+# ============================================================================
+# HEADER CART BADGE
+# ============================================================================
+
+def get_cart_count_cache_key(user_id):
+    return f'shop:cart_count:user:{user_id}'
+
+
+def remember_cart_count(request, count):
+    """Store the cart item count for the header badge.
+
+    Called by the cart mutation views, which already know the new count. The
+    session covers guests; signed-in users also get a cache entry so the
+    badge survives a new session on another device.
+    """
+    request.session[CART_COUNT_SESSION_KEY] = count
+    if request.user.is_authenticated:
+        cache.set(get_cart_count_cache_key(request.user.pk), count, None)
+
+
+def forget_cart_count(request):
+    """Drop the session's count when the visitor signs in or out.
+
+    The signed-in and guest carts are different carts, so a count kept in
+    the session would show the other cart's badge.
+    """
+    request.session.pop(CART_COUNT_SESSION_KEY, None)
+
+
+def get_cached_cart_count(request):
+    """Return the remembered cart item count, or None if it is unknown.
+
+    Never queries the Cart tables.
+    """
+    count = request.session.get(CART_COUNT_SESSION_KEY)
+    if count is None and request.user.is_authenticated:
+        count = cache.get(get_cart_count_cache_key(request.user.pk))
+        if count is not None:
+            request.session[CART_COUNT_SESSION_KEY] = count
+    return count
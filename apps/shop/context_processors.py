@@ -1,15 +1,11 @@
-def user_preferences(request):
-    """Add user's preferred currency and language to context"""
-    currency = request.session.get('currency', 'USD')
-    language = 'en'
-    
-    if request.user.is_authenticated:
-        try:
-            profile = request.user.shop_profile
-            currency = profile.currency
-            language = profile.language
-        except:
-            pass
+from apps.core.lazy import lazy_context
+from apps.core.preferences import get_preferences
+from .cart import get_cached_cart_count, SUPPORTED_CURRENCIES
+
+
+def get_user_preferences(request):
+    """Resolve the user's preferred currency and language"""
+    preferences = get_preferences(request)
     
     currency_symbols = {
         'USD': '$',
@@ -20,8 +16,27 @@ def user_preferences(request):
     }
     
     return {
-        'user_currency': currency,
-        'currency_symbol': currency_symbols.get(currency, '$'),
-        'user_language': language,
-        'available_currencies': ['USD', 'EUR', 'GBP', 'CAD', 'AUD'],
+        'user_currency': preferences.currency,
+        'currency_symbol': currency_symbols.get(preferences.currency, '$'),
+        'user_language': preferences.language or 'en',
     }
+
+
+def user_preferences(request):
+    """Add user's preferred currency and language to context, loaded on first use"""
+    context = lazy_context(
+        lambda: get_user_preferences(request),
+        ['user_currency', 'currency_symbol', 'user_language'],
+    )
+    context['available_currencies'] = SUPPORTED_CURRENCIES
+    return context
+
+
+def cart_count(request):
+    """Add the cached header cart badge count to context"""
+    if not hasattr(request, 'session'):
+        return {}
+    return lazy_context(
+        lambda: {'cart_item_count': get_cached_cart_count(request)},
+        ['cart_item_count'],
+    )
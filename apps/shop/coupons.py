@@ -0,0 +1,268 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from apps.core.versions import bump_version, get_version
+from .cart import TWO_PLACES, get_cart_lines, get_cart_summary
+from .models import Coupon, CouponRedemption, Order
+
+COUPONS_VERSION_KEY = 'shop:coupons_version'
+
+ZERO = Decimal('0.00')
+
+# (version, {code: CouponRule}) for this process
+_rules = (None, {})
+
+
+class CouponUnavailable(Exception):
+    """Raised when a coupon can no longer be redeemed at checkout"""
+
+
+class CouponQuote:
+    """The discount one coupon gives a cart"""
+    __slots__ = ('coupon_id', 'code', 'discount', 'free_shipping')
+
+    def __init__(self, coupon_id, code, discount, free_shipping=False):
+        self.coupon_id = coupon_id
+        self.code = code
+        self.discount = discount
+        self.free_shipping = free_shipping
+
+
+class CouponRule:
+    """A coupon compiled down to plain values and id sets.
+
+    Evaluating a rule never touches the database; the cart lines and the
+    user's order counts are loaded once by the caller and shared by every
+    rule checked against the same cart.
+    """
+    __slots__ = (
+        'id', 'code', 'discount_type', 'discount_value', 'minimum_amount',
+        'maximum_discount', 'usage_limit', 'usage_limit_per_user', 'used_count',
+        'valid_from', 'valid_until', 'first_order_only', 'is_active',
+        'product_ids', 'category_ids',
+    )
+
+    def __init__(self, coupon, product_ids=(), category_ids=()):
+        self.id = coupon.id
+        self.code = coupon.code
+        self.discount_type = coupon.discount_type
+        self.discount_value = coupon.discount_value
+        self.minimum_amount = coupon.minimum_amount
+        self.maximum_discount = coupon.maximum_discount
+        self.usage_limit = coupon.usage_limit
+        self.usage_limit_per_user = coupon.usage_limit_per_user
+        self.used_count = coupon.used_count
+        self.valid_from = coupon.valid_from
+        self.valid_until = coupon.valid_until
+        self.first_order_only = coupon.first_order_only
+        self.is_active = coupon.is_active
+        self.product_ids = frozenset(product_ids)
+        self.category_ids = frozenset(category_ids)
+
+    @property
+    def is_restricted(self):
+        return bool(self.product_ids or self.category_ids)
+
+    def applies_to(self, line):
+        """Whether a cart line counts towards the discount"""
+        return (
+            not self.is_restricted
+            or line.product_id in self.product_ids
+            or not self.category_ids.isdisjoint(line.category_ids)
+        )
+
+    def evaluate(self, subtotal, lines=None, usage=None, now=None):
+        """Return ``(quote, message)``; ``quote`` is None when the coupon does not apply.
+
+        ``lines`` is None when only the cart total is known, in which case
+        product and category restrictions are not checked. ``usage`` is the
+        result of ``get_user_usage`` and is None for guests.
+        """
+        now = now or timezone.now()
+
+        if not self.is_active:
+            return None, "Coupon is not active"
+
+        if now < self.valid_from or now > self.valid_until:
+            return None, "Coupon has expired"
+
+        if self.usage_limit and self.used_count >= self.usage_limit:
+            return None, "Coupon usage limit reached"
+
+        if subtotal < self.minimum_amount:
+            return None, f"Minimum order amount is ${self.minimum_amount}"
+
+        if usage is not None:
+            order_count, coupon_counts = usage
+            if self.first_order_only and order_count:
+                return None, "Coupon is for first orders only"
+            if self.usage_limit_per_user and coupon_counts.get(self.id, 0) >= self.usage_limit_per_user:
+                return None, "You have already used this coupon"
+
+        if lines is None:
+            eligible = None
+            eligible_total = subtotal
+        else:
+            eligible = [line for line in lines if self.applies_to(line)]
+            eligible_total = sum((line.total_price for line in eligible), ZERO)
+            if not eligible:
+                return None, "Coupon does not apply to any items in your cart"
+
+        discount = self.get_discount(eligible_total, eligible)
+        if self.maximum_discount is not None:
+            discount = min(discount, self.maximum_discount)
+        discount = min(discount, eligible_total).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+        return CouponQuote(
+            self.id, self.code, discount, free_shipping=self.discount_type == 'free_shipping'
+        ), "Valid"
+
+    def get_discount(self, eligible_total, eligible_lines):
+        """Discount before the ``maximum_discount`` cap"""
+        if self.discount_type == 'percentage':
+            return eligible_total * self.discount_value / 100
+        if self.discount_type == 'fixed':
+            return self.discount_value
+        if self.discount_type == 'buy_x_get_y' and eligible_lines:
+            # Buy ``discount_value`` units of a line, get the next one free
+            group = int(self.discount_value) + 1
+            return sum(
+                (line.unit_price * (line.quantity // group) for line in eligible_lines), ZERO
+            )
+        return ZERO
+
+
+# ============================================================================
+# COMPILED RULES
+# ============================================================================
+
+def get_coupons_version():
+    return get_version(COUPONS_VERSION_KEY)
+
+
+def invalidate_coupon_rules():
+    """Make every process recompile its coupon rules"""
+    bump_version(COUPONS_VERSION_KEY)
+
+
+def compile_coupons(coupons):
+    """Compile coupons into ``{code: CouponRule}`` with one query per restriction table"""
+    coupons = list(coupons)
+    ids = [coupon.id for coupon in coupons]
+    product_ids = {}
+    for coupon_id, product_id in Coupon.products.through.objects.filter(
+        coupon_id__in=ids
+    ).values_list('coupon_id', 'productpage_id'):
+        product_ids.setdefault(coupon_id, set()).add(product_id)
+    category_ids = {}
+    for coupon_id, category_id in Coupon.categories.through.objects.filter(
+        coupon_id__in=ids
+    ).values_list('coupon_id', 'productcategory_id'):
+        category_ids.setdefault(coupon_id, set()).add(category_id)
+
+    return {
+        coupon.code: CouponRule(
+            coupon, product_ids.get(coupon.id, ()), category_ids.get(coupon.id, ())
+        )
+        for coupon in coupons
+    }
+
+
+def get_coupon_rules():
+    """Rules of every active, unexpired coupon, kept in-process until the shared version moves"""
+    global _rules
+    version = get_coupons_version()
+    if _rules[0] != version:
+        coupons = Coupon.objects.filter(is_active=True, valid_until__gte=timezone.now())
+        _rules = (version, compile_coupons(coupons))
+    return _rules[1]
+
+
+def get_coupon_rule(code):
+    return get_coupon_rules().get(str(code).strip().upper())
+
+
+# ============================================================================
+# CART EVALUATION
+# ============================================================================
+
+def get_user_usage(user):
+    """``(order count, {coupon id: orders using it})`` for a user, in one query"""
+    if user is None or not user.is_authenticated:
+        return None
+    counts = dict(
+        Order.objects.filter(user=user).values_list('coupon_id').annotate(orders=Count('id')).order_by()
+    )
+    return sum(counts.values()), counts
+
+
+def check_coupon(code, cart, user=None):
+    """Return ``(quote, message)`` for a coupon code against a cart"""
+    rule = get_coupon_rule(code)
+    if rule is None:
+        return None, "Invalid coupon code"
+    return rule.evaluate(get_cart_summary(cart).subtotal, get_cart_lines(cart), get_user_usage(user))
+
+
+def rank_coupons(cart, user=None):
+    """Quotes for every coupon that applies to a cart, best discount first.
+
+    The cart and the user's order counts are loaded once; each rule is then
+    evaluated in memory.
+    """
+    subtotal = get_cart_summary(cart).subtotal
+    lines = get_cart_lines(cart)
+    usage = get_user_usage(user)
+    now = timezone.now()
+
+    quotes = []
+    for rule in get_coupon_rules().values():
+        quote, message = rule.evaluate(subtotal, lines, usage, now)
+        if quote is not None:
+            quotes.append(quote)
+    quotes.sort(key=lambda quote: (quote.discount, quote.free_shipping), reverse=True)
+    return quotes
+
+
+# ============================================================================
+# REDEMPTION
+# ============================================================================
+
+def redeem_coupon(quote, order):
+    """Record a coupon use for ``order`` inside the caller's transaction.
+
+    The per-user limit is held by the ledger's unique ``(coupon, user,
+    sequence)`` constraint. The global limit is claimed with one conditional
+    UPDATE (``used_count < usage_limit``), so concurrent checkouts can never
+    redeem more than the limit. Call it last in the checkout transaction so
+    the coupon row stays locked for as short a time as possible.
+    """
+    rule = get_coupon_rule(quote.code)
+    if rule is None or rule.id != quote.coupon_id:
+        raise CouponUnavailable("Coupon is no longer available")
+
+    redeemed = CouponRedemption.objects.filter(coupon_id=rule.id, user_id=order.user_id).aggregate(
+        count=Count('id'), last_sequence=Max('sequence')
+    )
+    if rule.usage_limit_per_user and redeemed['count'] >= rule.usage_limit_per_user:
+        raise CouponUnavailable("You have already used this coupon")
+    try:
+        with transaction.atomic():
+            # Numbered past the highest sequence, so deleted redemptions leave no clash
+            CouponRedemption.objects.create(
+                coupon_id=rule.id, user_id=order.user_id, order=order,
+                sequence=(redeemed['last_sequence'] or 0) + 1,
+            )
+    except IntegrityError:
+        raise CouponUnavailable("This coupon is already being redeemed for your account")
+
+    claimed = Coupon.objects.filter(pk=rule.id, is_active=True).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).update(used_count=F('used_count') + 1)
+    if not claimed:
+        # Stop offering the coupon; the compiled rule still has the old count
+        invalidate_coupon_rules()
+        raise CouponUnavailable("Coupon usage limit reached")
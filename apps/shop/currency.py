@@ -0,0 +1,183 @@
+import json
+from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.core.pagecache import invalidate_pages
+from apps.core.versions import bump_version, get_version
+from .cart import SUPPORTED_CURRENCIES, bump_prices_version
+from .listing import PRICE_FIELDS, bump_listing_version
+from .models import ExchangeRate, ProductListing, ProductPage, ProductVariant
+
+BASE_CURRENCY = 'USD'
+DERIVED_CURRENCIES = [currency for currency in SUPPORTED_CURRENCIES if currency != BASE_CURRENCY]
+RATES_VERSION_KEY = 'shop:rates_version'
+
+TWO_PLACES = Decimal('0.01')
+
+# Derived prices of a unit or more get a retail ending: 42.32 becomes 42.99
+PRICE_ENDINGS = {
+    'EUR': Decimal('0.99'),
+    'GBP': Decimal('0.99'),
+    'CAD': Decimal('0.99'),
+    'AUD': Decimal('0.99'),
+}
+
+# (field, base field) for every foreign price column
+DERIVED_FIELDS = [
+    (f'{base_field}_{currency.lower()}', base_field, currency)
+    for currency in DERIVED_CURRENCIES
+    for base_field in ('price', 'sale_price')
+]
+
+# (version, rates) for this process
+_rates = (None, {})
+
+
+# ============================================================================
+# RATES
+# ============================================================================
+
+def get_rates_version():
+    return get_version(RATES_VERSION_KEY)
+
+
+def bump_rates_version():
+    bump_version(RATES_VERSION_KEY)
+
+
+def get_rates():
+    """Rates per US dollar, kept in-process until the shared version moves"""
+    global _rates
+    version = get_rates_version()
+    if _rates[0] != version:
+        rates = dict(ExchangeRate.objects.values_list('currency', 'rate'))
+        rates[BASE_CURRENCY] = Decimal('1')
+        _rates = (version, rates)
+    return _rates[1]
+
+
+def load_rates(path=None):
+    """Store the rates from a JSON feed file: ``{"base": "USD", "rates": {"EUR": "0.92"}}``"""
+    path = path or settings.EXCHANGE_RATES_FILE
+    with open(path) as f:
+        feed = json.load(f)
+    if feed.get('base', BASE_CURRENCY) != BASE_CURRENCY:
+        raise ValueError(f'Exchange rates must be quoted against {BASE_CURRENCY}')
+
+    rates = {
+        currency: Decimal(str(rate))
+        for currency, rate in feed['rates'].items() if currency in DERIVED_CURRENCIES
+    }
+    with transaction.atomic():
+        for currency, rate in rates.items():
+            ExchangeRate.objects.update_or_create(currency=currency, defaults={'rate': rate})
+        transaction.on_commit(bump_rates_version)
+    return rates
+
+
+# ============================================================================
+# CONVERSION
+# ============================================================================
+
+def round_price(amount, currency):
+    """Round a converted amount to cents, then to the currency's price ending"""
+    price = amount.quantize(TWO_PLACES, ROUND_HALF_UP)
+    ending = PRICE_ENDINGS.get(currency)
+    if ending is not None and price >= 1:
+        price = price.to_integral_value(ROUND_FLOOR) + ending
+    return price
+
+
+def price_below(price, currency):
+    """The nearest price of ``currency`` strictly below ``price``, or None if there is none"""
+    below = round_price(price - 1, currency)
+    if below <= 0:
+        below = price - TWO_PLACES
+    return below if below > 0 else None
+
+
+def convert(amount, currency, rates=None):
+    """Convert a US dollar amount; amounts are returned unchanged if there is no rate"""
+    if amount is None or currency == BASE_CURRENCY:
+        return amount
+    rate = (rates or get_rates()).get(currency)
+    if rate is None:
+        return amount
+    return round_price(Decimal(amount) * rate, currency)
+
+
+def derive_prices(obj, rates):
+    """Fill the foreign prices of a product or variant that editors left empty.
+
+    A value derived earlier is recomputed unless an editor has since changed
+    it, which ``derived_prices`` (field: value derived) lets us tell. A
+    derived sale price is kept strictly below the regular price in the same
+    currency. Returns whether any field changed.
+    """
+    derived = dict(obj.derived_prices)
+    changed = False
+    for field, base_field, currency in DERIVED_FIELDS:
+        current = getattr(obj, field)
+        previous = derived.get(field)
+        if current is not None and (previous is None or Decimal(previous) != current):
+            derived.pop(field, None)  # entered by an editor
+            continue
+
+        base = getattr(obj, base_field)
+        value = convert(base, currency, rates) if base is not None and currency in rates else None
+        if base_field == 'sale_price' and value is not None:
+            # Both prices may round to the same ending; a sale must stay below the regular price
+            price = getattr(obj, field.replace('sale_price', 'price', 1))
+            if price is not None and value >= price:
+                value = price_below(price, currency)
+        if value is None:
+            derived.pop(field, None)
+        else:
+            derived[field] = str(value)
+        if value != current:
+            setattr(obj, field, value)
+            changed = True
+
+    if derived != obj.derived_prices:
+        obj.derived_prices = derived
+        changed = True
+    return changed
+
+
+def reprice_catalog(batch_size=500):
+    """Recompute the derived prices of every product, variant and listing row.
+
+    Runs as one pass over each table with bulk updates, so a rate change
+    costs a handful of queries per ``batch_size`` rows rather than a save
+    per product. Returns the number of rows changed.
+    """
+    rates = get_rates()
+    fields = [field for field, _, _ in DERIVED_FIELDS] + ['derived_prices']
+    only = ['id', 'price', 'sale_price'] + fields
+    changed_products = {}
+
+    with transaction.atomic():
+        variants = [
+            variant for variant in ProductVariant.objects.only(*only) if derive_prices(variant, rates)
+        ]
+        ProductVariant.objects.bulk_update(variants, fields, batch_size=batch_size)
+
+        for product in ProductPage.objects.only(*only):
+            if derive_prices(product, rates):
+                changed_products[product.pk] = product
+        ProductPage.objects.bulk_update(changed_products.values(), fields, batch_size=batch_size)
+
+        listings = list(ProductListing.objects.filter(product_id__in=changed_products))
+        for listing in listings:
+            for field in PRICE_FIELDS:
+                setattr(listing, field, getattr(changed_products[listing.product_id], field))
+        ProductListing.objects.bulk_update(listings, PRICE_FIELDS, batch_size=batch_size)
+
+    if variants or changed_products:
+        bump_prices_version()
+    if changed_products:
+        bump_listing_version()
+        invalidate_pages(changed_products)
+    return len(variants) + len(changed_products)
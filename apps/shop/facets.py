@@ -0,0 +1,95 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .listing import filter_listings, get_listing_version, FILTER_PARAMS
+from .models import ProductListing
+
+FACET_CACHE_TIMEOUT = 60 * 15
+
+# (label, min_price, max_price) in the base currency; max is exclusive
+PRICE_BUCKETS = [
+    ('0-25', None, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100+', 100, None),
+]
+
+
+def get_facet_cache_key(shop_page, filters):
+    """Build a cache key from the normalized (non-empty, sorted) filter set"""
+    normalized = sorted(
+        (param, str(filters[param])) for param in FILTER_PARAMS if filters.get(param)
+    )
+    digest = hashlib.md5(json.dumps(normalized).encode()).hexdigest()
+    return f'shop:facets:{shop_page.id}:{get_listing_version()}:{digest}'
+
+
+def _bucket_filter(min_price, max_price):
+    condition = Q()
+    if min_price is not None:
+        condition &= Q(price__gte=min_price)
+    if max_price is not None:
+        condition &= Q(price__lt=max_price)
+    return condition
+
+
+def compute_facets(shop_page, filters):
+    """Compute facet counts for the current filter set.
+
+    Each facet is counted against the other active filters, so selecting a
+    category still shows the counts for its sibling categories. Category and
+    brand counts are one GROUP BY each; price buckets and the stock/sale flags
+    share a single conditional aggregate.
+    """
+    listings = ProductListing.objects.filter(shop_page=shop_page)
+
+    category_rows = filter_listings(listings, filters, exclude=['category']).filter(
+        categories__isnull=False
+    ).values('categories').annotate(count=Count('pk'))
+
+    brand_rows = filter_listings(listings, filters, exclude=['brand']).filter(
+        brand__isnull=False
+    ).values('brand').annotate(count=Count('pk'))
+
+    aggregates = {
+        f'bucket_{index}': Count('pk', filter=_bucket_filter(min_price, max_price))
+        for index, (label, min_price, max_price) in enumerate(PRICE_BUCKETS)
+    }
+    aggregates['in_stock'] = Count('pk', filter=Q(stock_quantity__gt=0))
+    aggregates['on_sale'] = Count('pk', filter=Q(sale_price__isnull=False))
+    aggregates['featured'] = Count('pk', filter=Q(is_featured=True))
+    totals = filter_listings(
+        listings, filters, exclude=['min_price', 'max_price']
+    ).aggregate(**aggregates)
+
+    return {
+        'categories': {row['categories']: row['count'] for row in category_rows},
+        'brands': {row['brand']: row['count'] for row in brand_rows},
+        'price_buckets': [
+            {
+                'label': label,
+                'min_price': min_price,
+                # Inclusive bound for the max_price filter link
+                'max_price': Decimal(max_price) - Decimal('0.01') if max_price else None,
+                'count': totals[f'bucket_{index}'],
+            }
+            for index, (label, min_price, max_price) in enumerate(PRICE_BUCKETS)
+        ],
+        'in_stock': totals['in_stock'],
+        'on_sale': totals['on_sale'],
+        'featured': totals['featured'],
+    }
+
+
+def get_facets(shop_page, filters):
+    """Return facet counts for the filter set, cached per listing version"""
+    cache_key = get_facet_cache_key(shop_page, filters)
+    facets = cache.get(cache_key)
+    if facets is None:
+        facets = compute_facets(shop_page, filters)
+        cache.set(cache_key, facets, FACET_CACHE_TIMEOUT)
+    return facets
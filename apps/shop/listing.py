@@ -0,0 +1,237 @@
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.db.models import Case, IntegerField, OuterRef, Q, Subquery, Value, When
+from wagtail.images.models import SourceImageIOError
+
+from apps.core.pagecache import invalidate_pages
+from apps.core.versions import bump_version, get_version
+from .models import ProductListing, ProductPage, ShopIndexPage
+
+LISTING_IMAGE_FILTER = 'fill-300x250'
+LISTING_VERSION_KEY = 'shop:listing_version'
+
+FILTER_PARAMS = [
+    'category', 'brand', 'min_price', 'max_price', 'in_stock', 'on_sale', 'featured',
+]
+INTEGER_FILTERS = ['category', 'brand']
+PRICE_FILTERS = ['min_price', 'max_price']
+
+# Search matches considered, best first, before listing filters apply
+SEARCH_RESULTS_LIMIT = 500
+
+# Each ordering ends with the pk so keyset cursors see a total order
+SORT_OPTIONS = {
+    'price_asc': ('price', 'pk'),
+    'price_desc': ('-price', '-pk'),
+    'name_asc': ('title', 'pk'),
+    'name_desc': ('-title', '-pk'),
+    'newest': ('-first_published_at', '-pk'),
+}
+
+PRICE_FIELDS = [
+    'price', 'sale_price',
+    'price_eur', 'price_gbp', 'price_cad', 'price_aud',
+    'sale_price_eur', 'sale_price_gbp', 'sale_price_cad', 'sale_price_aud',
+]
+
+
+def get_listing_version():
+    """Return the current listing version stamp used in derived cache keys"""
+    return get_version(LISTING_VERSION_KEY)
+
+
+def bump_listing_version():
+    """Invalidate every cache derived from the listing index"""
+    bump_version(LISTING_VERSION_KEY)
+
+
+def get_listing_filters(request):
+    """Read the listing filter set from the query string"""
+    filters = {param: request.GET.get(param) for param in FILTER_PARAMS}
+    filters['sort'] = request.GET.get('sort', '-first_published_at')
+    return filters
+
+
+def get_filter_query(filters):
+    """Encode the active filters and sort as a query string"""
+    return urlencode([(key, value) for key, value in filters.items() if value])
+
+
+class InvalidFilter(ValueError):
+    """Raised when a listing filter value cannot be used"""
+
+
+def clean_filter_value(param, value):
+    """One filter value as an int id or Decimal price, raising InvalidFilter if it is neither"""
+    if param in INTEGER_FILTERS:
+        try:
+            return int(value)
+        except ValueError:
+            raise InvalidFilter(f'{param} must be a whole number')
+    if param in PRICE_FILTERS:
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            raise InvalidFilter(f'{param} must be a number')
+        return price
+    return value
+
+
+def clean_listing_filters(filters, drop_invalid=False):
+    """Return ``filters`` with ids as ints and prices as Decimals.
+
+    Bad values raise InvalidFilter, or are dropped with ``drop_invalid`` so
+    a page can still render with the rest.
+    """
+    cleaned = dict(filters)
+    for param in INTEGER_FILTERS + PRICE_FILTERS:
+        if filters.get(param):
+            try:
+                cleaned[param] = clean_filter_value(param, filters[param])
+            except InvalidFilter:
+                if not drop_invalid:
+                    raise
+                cleaned[param] = None
+    return cleaned
+
+
+def search_listings(products, query, limit=SEARCH_RESULTS_LIMIT):
+    """Restrict listings to the search backend's best matches for ``query``.
+
+    Returns ``(products, truncated)``. Each listing is annotated with its
+    ``search_rank`` in the backend's relevance order (0 is the best match),
+    so filters and sorting still run on the listing table. ``truncated``
+    tells whether matches beyond the ``limit`` best were left out.
+    """
+    matches = [page.pk for page in ProductPage.objects.live().search(query)[:limit + 1]]
+    truncated = len(matches) > limit
+    matches = matches[:limit]
+    if not matches:
+        return products.none(), False
+    search_rank = Case(
+        *[When(product_id=product_id, then=Value(rank)) for rank, product_id in enumerate(matches)],
+        output_field=IntegerField(),
+    )
+    return products.filter(product_id__in=matches).annotate(search_rank=search_rank), truncated
+
+
+def filter_listings(products, filters, exclude=()):
+    """Apply the listing filters, skipping any parameter named in ``exclude``"""
+    active = {key: value for key, value in filters.items() if value and key not in exclude}
+
+    if 'category' in active:
+        products = products.filter(categories__id=active['category'])
+    if 'brand' in active:
+        products = products.filter(brand_id=active['brand'])
+    if 'min_price' in active:
+        products = products.filter(price__gte=active['min_price'])
+    if 'max_price' in active:
+        products = products.filter(price__lte=active['max_price'])
+    if 'in_stock' in active:
+        products = products.filter(stock_quantity__gt=0)
+    if 'on_sale' in active:
+        products = products.filter(sale_price__isnull=False)
+    if 'featured' in active:
+        products = products.filter(is_featured=True)
+    return products
+
+
+def get_sort_ordering(sort):
+    """Return the ordering for a sort option, defaulting to newest first"""
+    return SORT_OPTIONS.get(sort, SORT_OPTIONS['newest'])
+
+
+def sort_listings(products, sort):
+    """Order listings by one of the supported sort options"""
+    return products.order_by(*get_sort_ordering(sort))
+
+
+def get_listing_image_url(product):
+    """Return the listing rendition URL for a product, or '' if unavailable"""
+    if not product.featured_image_id:
+        return ''
+    try:
+        return product.featured_image.get_rendition(LISTING_IMAGE_FILTER).url
+    except SourceImageIOError:
+        return ''
+
+
+def sync_product_listing(product):
+    """Create or refresh the listing row for a live product page"""
+    if not product.live:
+        remove_product_listing(product)
+        return None
+
+    parent = product.get_parent().specific
+    if not isinstance(parent, ShopIndexPage):
+        # e.g. moved out of the shop
+        remove_product_listing(product)
+        return None
+
+    defaults = {field: getattr(product, field) for field in PRICE_FIELDS}
+    defaults.update({
+        'shop_page': parent,
+        'title': product.title,
+        'short_description': product.short_description,
+        'url': product.url or '',
+        'image_url': get_listing_image_url(product),
+        'sku': product.sku,
+        'stock_quantity': product.stock_quantity,
+        'brand_id': product.brand_id,
+        'is_featured': product.is_featured,
+        'is_on_sale': product.is_on_sale,
+        'discount_percentage': product.discount_percentage,
+        'first_published_at': product.first_published_at,
+        'revision_id': product.live_revision_id,
+    })
+
+    listing, created = ProductListing.objects.update_or_create(
+        product_id=product.id,
+        defaults=defaults
+    )
+    listing.categories.set(product.categories.all())
+    bump_listing_version()
+    return listing
+
+
+def remove_product_listing(product):
+    """Drop the listing row for an unpublished product"""
+    ProductListing.objects.filter(product_id=product.id).delete()
+    bump_listing_version()
+
+
+def refresh_listing_stock(product_ids):
+    """Copy current stock levels onto the listing rows of the given products in one UPDATE.
+
+    Cards, facets and the in-stock filter only tell in stock from sold out,
+    so the listing version moves only when a product crosses zero, not on
+    every checkout.
+    """
+    listings = ProductListing.objects.filter(product_id__in=product_ids)
+    flipped = listings.filter(
+        Q(stock_quantity__gt=0, product__stock_quantity__lte=0)
+        | Q(stock_quantity__lte=0, product__stock_quantity__gt=0)
+    ).exists()
+    listings.update(
+        stock_quantity=Subquery(
+            ProductPage.objects.filter(pk=OuterRef('product_id')).values('stock_quantity')[:1]
+        )
+    )
+    if flipped:
+        bump_listing_version()
+    # Product pages show the stock level too
+    invalidate_pages(product_ids)
+
+
+def rebuild_product_listings():
+    """Rebuild the whole listing index from live product pages"""
+    ProductListing.objects.exclude(product__live=True).delete()
+    count = 0
+    for product in ProductPage.objects.live().select_related('featured_image'):
+        if sync_product_listing(product):
+            count += 1
+    bump_listing_version()
+    return count
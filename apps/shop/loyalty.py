@@ -0,0 +1,45 @@
+from django.conf import settings
+
+from .models import LoyaltyTransaction, UserProfile
+
+
+def award_loyalty_points(order):
+    """Award loyalty points for a delivered order, at most once per order"""
+    if LoyaltyTransaction.objects.filter(order=order, type='earned').exists():
+        return None
+
+    profile = UserProfile.objects.select_for_update().filter(user=order.user).first()
+    if profile is None:
+        return None
+
+    points = int(order.total_amount * settings.LOYALTY_POINTS_PER_DOLLAR)
+
+    # Add points to user profile
+    profile.loyalty_points += points
+
+    # Update loyalty tier
+    update_loyalty_tier(profile)
+    profile.save(update_fields=['loyalty_points', 'loyalty_tier'])
+
+    # Create loyalty transaction record
+    return LoyaltyTransaction.objects.create(
+        user=order.user,
+        type='earned',
+        points=points,
+        description=f'Order #{order.order_number}',
+        order=order
+    )
+
+
+def update_loyalty_tier(profile):
+    """Update user's loyalty tier based on points"""
+    points = profile.loyalty_points
+
+    if points >= settings.LOYALTY_TIERS['platinum']['min_points']:
+        profile.loyalty_tier = 'platinum'
+    elif points >= settings.LOYALTY_TIERS['gold']['min_points']:
+        profile.loyalty_tier = 'gold'
+    elif points >= settings.LOYALTY_TIERS['silver']['min_points']:
+        profile.loyalty_tier = 'silver'
+    else:
+        profile.loyalty_tier = 'bronze'
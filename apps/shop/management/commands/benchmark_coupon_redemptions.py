@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.shop.coupons import CouponQuote, CouponUnavailable, redeem_coupon
+from apps.shop.models import Coupon, Order
+
+
+class Command(BaseCommand):
+    help = 'Race concurrent checkouts for a limited coupon and check the limits hold'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--buyers',
+            type=int,
+            default=500,
+            help='Buyers racing for the coupon; each tries to use it twice (default: 500)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Global usage limit of the coupon (default: 50)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=20,
+            help='Concurrent checkouts (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        buyers, limit = options['buyers'], options['limit']
+        prefix = f'benchmark-{time.time_ns()}'
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code=prefix.upper(),
+            name='Redemption benchmark',
+            discount_type='fixed',
+            discount_value=Decimal('5.00'),
+            usage_limit=limit,
+            usage_limit_per_user=1,
+            valid_from=now,
+            valid_until=now + timedelta(hours=1),
+        )
+        User.objects.bulk_create([User(username=f'{prefix}-{index}') for index in range(buyers)])
+        users = list(User.objects.filter(username__startswith=prefix))
+        quote = CouponQuote(coupon.id, coupon.code, coupon.discount_value)
+        self.stdout.write(
+            f'{buyers} buyers x 2 checkouts race for {limit} redemptions '
+            f'on {options["workers"]} workers...'
+        )
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(lambda user: self.checkout(user, quote), users * 2))
+            elapsed = time.perf_counter() - started
+
+            coupon.refresh_from_db()
+            redeemed = results.count(True)
+            per_user_max = max(
+                coupon.redemptions.values('user').annotate(uses=Count('id')).values_list('uses', flat=True),
+                default=0,
+            )
+            self.stdout.write(f'  checkouts     {len(results):,} in {elapsed:.2f}s '
+                              f'({len(results) / elapsed:,.0f}/s)')
+            self.stdout.write(f'  redeemed      {redeemed} (used_count {coupon.used_count})')
+            self.stdout.write(f'  max per user  {per_user_max}')
+
+            if not (redeemed == coupon.used_count == coupon.redemptions.count() <= limit and per_user_max <= 1):
+                raise CommandError('Coupon limits were exceeded')
+        finally:
+            Order.objects.filter(user__username__startswith=prefix).delete()
+            coupon.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write(self.style.SUCCESS('Successfully ran coupon redemption benchmark'))
+
+    def checkout(self, user, quote):
+        """One checkout transaction: create the order, then redeem the coupon"""
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=user,
+                    subtotal=Decimal('10.00'),
+                    discount_amount=quote.discount,
+                    total_amount=Decimal('5.00'),
+                    billing_address={},
+                    shipping_address={},
+                    coupon_id=quote.coupon_id,
+                )
+                redeem_coupon(quote, order)
+            return True
+        except CouponUnavailable:
+            return False
+        finally:
+            connection.close()
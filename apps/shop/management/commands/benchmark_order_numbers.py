@@ -0,0 +1,59 @@
+import random
+import string
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.shop.models import Order
+
+
+def random_order_number():
+    """The previous scheme: ten random characters, no collision check"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+class Command(BaseCommand):
+    help = 'Compare order insert throughput of sequence-allocated and random order numbers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=5000,
+            help='Orders to insert per scheme (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        self.stdout.write(f'Inserting {count} orders per scheme (rolled back afterwards)...')
+
+        for label, number_factory in [
+            ('random', random_order_number),
+            ('sequence', lambda: ''),
+        ]:
+            rate = self.measure(count, number_factory)
+            self.stdout.write(f'  {label:<10} {rate:,.0f} orders/s')
+
+        self.stdout.write(self.style.SUCCESS('Successfully ran order number benchmark'))
+
+    def measure(self, count, number_factory):
+        """Insert ``count`` orders one by one and return orders per second"""
+        with transaction.atomic():
+            user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+            started = time.perf_counter()
+            for _ in range(count):
+                # An empty order number makes Order.save allocate one
+                Order.objects.create(
+                    user=user,
+                    order_number=number_factory(),
+                    subtotal=Decimal('10.00'),
+                    total_amount=Decimal('10.00'),
+                    billing_address={},
+                    shipping_address={},
+                )
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return count / elapsed
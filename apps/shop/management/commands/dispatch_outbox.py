@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.shop.outbox import dispatch_outbox_batch, OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Apply pending order and payment outbox events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help=f'Events to claim per batch (default: {OUTBOX_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to sleep between polls when the outbox is empty (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = dispatch_outbox_batch(options['batch_size'])
+            total += handled
+            if handled:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully dispatched {total} outbox events')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.listing import rebuild_product_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product listing index from live product pages'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product listings...')
+
+        count = rebuild_product_listings()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {count} live products')
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Release stock reservations whose checkout window has expired'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully released {released} expired stock reservations')
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.shop.notifications import send_notification_batch, NOTIFICATION_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Send queued customer email notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=NOTIFICATION_BATCH_SIZE,
+            help=f'Notifications to send per batch (default: {NOTIFICATION_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting once it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep between polls when the queue is empty (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            sent = send_notification_batch(options['batch_size'])
+            total += sent
+            if sent:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully processed {total} notifications')
+        )
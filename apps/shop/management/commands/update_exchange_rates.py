@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.currency import load_rates, reprice_catalog
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from the rates file and recompute derived catalog prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='JSON rates file to load (default: settings.EXCHANGE_RATES_FILE)',
+        )
+
+    def handle(self, *args, **options):
+        rates = load_rates(options['file'])
+        for currency, rate in sorted(rates.items()):
+            self.stdout.write(f'USD/{currency} {rate}')
+
+        changed = reprice_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Successfully loaded {len(rates)} rates and repriced {changed} rows'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Fold new order, cart and wishlist lines into the "frequently bought together" recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute the co-occurrence counts from the full history',
+        )
+
+    def handle(self, *args, **options):
+        products = update_recommendations(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated recommendations for {products} products'))
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_productpage_price_aud_productpage_price_cad_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='shop.productpage')),
+                ('title', models.CharField(max_length=255)),
+                ('short_description', models.TextField(blank=True)),
+                ('url', models.CharField(blank=True, max_length=255)),
+                ('image_url', models.CharField(blank=True, max_length=255)),
+                ('sku', models.CharField(max_length=50)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sale_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_eur', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_gbp', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_cad', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_aud', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('sale_price_eur', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('sale_price_gbp', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('sale_price_cad', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('sale_price_aud', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('stock_quantity', models.PositiveIntegerField(default=0)),
+                ('is_featured', models.BooleanField(default=False)),
+                ('is_on_sale', models.BooleanField(default=False)),
+                ('discount_percentage', models.PositiveIntegerField(default=0)),
+                ('first_published_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.brand')),
+                ('categories', models.ManyToManyField(blank=True, related_name='+', to='shop.productcategory')),
+                ('shop_page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_listings', to='shop.shopindexpage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop_page', 'price'], name='shop_produc_shop_pa_824860_idx'), models.Index(fields=['shop_page', 'title'], name='shop_produc_shop_pa_0f46e5_idx'), models.Index(fields=['shop_page', 'first_published_at'], name='shop_produc_shop_pa_19c191_idx')],
+            },
+        ),
+    ]
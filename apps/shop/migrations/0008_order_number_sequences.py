@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:29
+
+from django.db import migrations, models
+
+SEQUENCES = ['shop_order_number_seq', 'shop_payment_id_seq']
+
+
+def create_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in SEQUENCES:
+            schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {name}')
+    else:
+        NumberSequence = apps.get_model('shop', 'NumberSequence')
+        for name in ['order_number', 'payment_id']:
+            NumberSequence.objects.get_or_create(name=name)
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in SEQUENCES:
+            schema_editor.execute(f'DROP SEQUENCE IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
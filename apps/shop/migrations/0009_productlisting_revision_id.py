@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_order_number_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productlisting',
+            name='revision_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# The rates convert_currency used to hardcode
+INITIAL_RATES = {
+    'EUR': Decimal('0.92'),
+    'GBP': Decimal('0.79'),
+    'CAD': Decimal('1.36'),
+    'AUD': Decimal('1.52'),
+}
+
+
+def seed_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('shop', 'ExchangeRate')
+    for currency, rate in INITIAL_RATES.items():
+        ExchangeRate.objects.get_or_create(currency=currency, defaults={'rate': rate})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, unique=True)),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['currency'],
+            },
+        ),
+        migrations.AddField(
+            model_name='productpage',
+            name='derived_prices',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='derived_prices',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(seed_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_countries.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_coupon_redemptions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('countries', django_countries.fields.CountryField(max_length=746, multiple=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShippingRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cost_per_kg', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('method', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='shop.shippingmethod')),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='shop.shippingzone')),
+            ],
+            options={
+                'unique_together': {('method', 'zone')},
+            },
+        ),
+    ]
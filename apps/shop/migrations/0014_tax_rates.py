@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:20
+
+from django.db import migrations, models
+import django_countries.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_shipping_zones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpage',
+            name='tax_class',
+            field=models.CharField(choices=[('standard', 'Standard'), ('reduced', 'Reduced'), ('zero', 'Zero-rated')], default='standard', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', django_countries.fields.CountryField(max_length=2)),
+                ('region', models.CharField(blank=True, help_text='State or province, as entered in addresses', max_length=100)),
+                ('tax_class', models.CharField(choices=[('standard', 'Standard'), ('reduced', 'Reduced'), ('zero', 'Zero-rated'), ('digital', 'Digital goods')], default='standard', max_length=20)),
+                ('rate', models.DecimalField(decimal_places=4, help_text='0.0825 for 8.25%', max_digits=6)),
+            ],
+            options={
+                'unique_together': {('country', 'region', 'tax_class')},
+            },
+        ),
+    ]
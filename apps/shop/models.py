@@ -1,6 +1,8 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django_countries.fields import CountryField
 from modelcluster.contrib.taggit import ClusterTaggableManager
@@ -13,6 +15,14 @@ from wagtail.models import Page
 from wagtail.snippets.models import register_snippet
 
 
+# Product tax classes; digital products are taxed under 'digital' whatever their class
+TAX_CLASS_CHOICES = [
+    ('standard', 'Standard'),
+    ('reduced', 'Reduced'),
+    ('zero', 'Zero-rated'),
+]
+
+
 class ProductTag(TaggedItemBase):
     content_object = ParentalKey(
         'shop.ProductPage',
@@ -69,57 +79,41 @@ class ShopIndexPage(Page):
     ]
 
     def get_context(self, request):
+        from .facets import get_facets
+        from .listing import (
+            clean_listing_filters, filter_listings, get_filter_query, get_listing_filters, get_sort_ordering
+        )
+        from .pagination import keyset_page, InvalidCursor
+
         context = super().get_context(request)
-        products = self.get_children().live().specific()
-
-        # Filters
-        category = request.GET.get('category')
-        brand = request.GET.get('brand')
-        min_price = request.GET.get('min_price')
-        max_price = request.GET.get('max_price')
-        in_stock = request.GET.get('in_stock')
-        on_sale = request.GET.get('on_sale')
-        featured = request.GET.get('featured')
-        sort = request.GET.get('sort', '-first_published_at')
-
-        if category:
-            products = products.filter(productpage__categories__id=category)
-        if brand:
-            products = products.filter(productpage__brand__id=brand)
-        if min_price:
-            products = products.filter(productpage__price__gte=min_price)
-        if max_price:
-            products = products.filter(productpage__price__lte=max_price)
-        if in_stock:
-            products = products.filter(productpage__stock_quantity__gt=0)
-        if on_sale:
-            products = products.filter(productpage__sale_price__isnull=False)
-        if featured:
-            products = products.filter(productpage__is_featured=True)
-
-        # Sorting
-        sort_options = {
-            'price_asc': 'productpage__price',
-            'price_desc': '-productpage__price',
-            'name_asc': 'title',
-            'name_desc': '-title',
-            'newest': '-first_published_at',
-        }
-        products = products.order_by(sort_options.get(sort, '-first_published_at'))
-
-        context['products'] = products
-        context['categories'] = ProductCategory.objects.all()
-        context['brands'] = Brand.objects.all()
-        context['filters'] = {
-            'category': category,
-            'brand': brand,
-            'min_price': min_price,
-            'max_price': max_price,
-            'in_stock': in_stock,
-            'on_sale': on_sale,
-            'featured': featured,
-            'sort': sort,
-        }
+        filters = clean_listing_filters(get_listing_filters(request), drop_invalid=True)
+        listings = ProductListing.objects.filter(shop_page=self)
+        products = filter_listings(listings, filters)
+        facets = get_facets(self, filters)
+
+        # Keyset pagination; the total is only counted for the first page
+        cursor = request.GET.get('cursor')
+        try:
+            page_items, next_cursor = keyset_page(products, get_sort_ordering(filters['sort']), cursor)
+        except InvalidCursor:
+            cursor = None
+            page_items, next_cursor = keyset_page(products, get_sort_ordering(filters['sort']))
+
+        categories = list(ProductCategory.objects.all())
+        for category in categories:
+            category.facet_count = facets['categories'].get(category.id, 0)
+        brands = list(Brand.objects.all())
+        for brand in brands:
+            brand.facet_count = facets['brands'].get(brand.id, 0)
+
+        context['products'] = page_items
+        context['product_count'] = None if cursor else products.count()
+        context['next_cursor'] = next_cursor
+        context['categories'] = categories
+        context['brands'] = brands
+        context['facets'] = facets
+        context['filters'] = filters
+        context['filter_query'] = get_filter_query(filters)
         return context
 
 
@@ -141,6 +135,8 @@ class ProductPage(Page):
     sale_price_gbp = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     sale_price_cad = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     sale_price_aud = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Foreign prices filled from exchange rates, by field (see apps.shop.currency)
+    derived_prices = models.JSONField(default=dict, blank=True, editable=False)
 
     # Product details
     sku = models.CharField(max_length=50, unique=True)
@@ -165,6 +161,7 @@ class ProductPage(Page):
     # Status
     is_featured = models.BooleanField(default=False)
     is_digital = models.BooleanField(default=False, help_text="Digital product (no shipping)")
+    tax_class = models.CharField(max_length=20, choices=TAX_CLASS_CHOICES, default='standard')
 
     content_panels = Page.content_panels + [
         FieldPanel('short_description'),
@@ -194,6 +191,7 @@ class ProductPage(Page):
         MultiFieldPanel([
             FieldPanel('is_featured'),
             FieldPanel('is_digital'),
+            FieldPanel('tax_class'),
         ], heading="Status"),
     ]
 
@@ -203,7 +201,8 @@ class ProductPage(Page):
         """Get price in specified currency"""
         if currency == 'USD':
             return self.price
-        return getattr(self, f'price_{currency.lower()}', None) or self.price
+        from .currency import convert
+        return getattr(self, f'price_{currency.lower()}', None) or convert(self.price, currency)
     
     def get_sale_price(self, currency='USD'):
         """Get sale price in specified currency"""
@@ -238,6 +237,148 @@ class ProductPage(Page):
         """Check if product is in stock"""
         return self.stock_quantity > 0
 
+    # Stock is kept by orders, not by the revision history: publishing or
+    # restoring a revision keeps the live level, and a level an editor
+    # changes is written straight to the live row.
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock_quantity = instance.__dict__.get('stock_quantity')
+        return instance
+
+    def with_content_json(self, content):
+        obj = super().with_content_json(content)
+        # ``self`` may be an instance an editor has held since before a checkout
+        live_stock = ProductPage.objects.filter(pk=self.pk).values_list('stock_quantity', flat=True).first()
+        if live_stock is None:
+            live_stock = self.stock_quantity
+        obj.stock_quantity = obj._loaded_stock_quantity = live_stock
+        return obj
+
+    def save_revision(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_stock_quantity', None)
+        if loaded is not None and self.stock_quantity != loaded:
+            from .listing import refresh_listing_stock
+            ProductPage.objects.filter(pk=self.pk).update(stock_quantity=self.stock_quantity)
+            self._loaded_stock_quantity = self.stock_quantity
+            product_id = self.pk
+            transaction.on_commit(lambda: refresh_listing_stock([product_id]))
+        return super().save_revision(*args, **kwargs)
+
+    def get_context(self, request):
+        context = super().get_context(request)
+        # Precomputed by apps.shop.recommendations
+        context['recommended_products'] = ProductListing.objects.filter(
+            product__recommended_by__product=self
+        ).order_by('product__recommended_by__rank')
+        return context
+
+
+# ============================================================================
+# PRODUCT LISTING INDEX
+# ============================================================================
+
+class ProductListing(models.Model):
+    """Denormalized listing row for a live product.
+
+    Maintained from page publish/unpublish and stock changes (see
+    ``apps.shop.listing``) so the shop listing and search never need to join
+    through the page tree or call ``specific()``.
+    """
+    product = models.OneToOneField(
+        ProductPage,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='listing'
+    )
+    shop_page = models.ForeignKey(
+        ShopIndexPage,
+        on_delete=models.CASCADE,
+        related_name='product_listings'
+    )
+
+    title = models.CharField(max_length=255)
+    short_description = models.TextField(blank=True)
+    url = models.CharField(max_length=255, blank=True)
+    image_url = models.CharField(max_length=255, blank=True)
+    sku = models.CharField(max_length=50)
+
+    # Pricing
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_eur = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_gbp = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_cad = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_aud = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sale_price_eur = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sale_price_gbp = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sale_price_cad = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sale_price_aud = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    # Stock & categorization
+    stock_quantity = models.PositiveIntegerField(default=0)
+    brand = models.ForeignKey(Brand, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    categories = models.ManyToManyField(ProductCategory, blank=True, related_name='+')
+
+    # Flags
+    is_featured = models.BooleanField(default=False)
+    is_on_sale = models.BooleanField(default=False)
+    discount_percentage = models.PositiveIntegerField(default=0)
+
+    first_published_at = models.DateTimeField(null=True, blank=True)
+    revision_id = models.PositiveIntegerField(null=True, blank=True)  # live revision, for card cache keys
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop_page', 'price']),
+            models.Index(fields=['shop_page', 'title']),
+            models.Index(fields=['shop_page', 'first_published_at']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def get_price(self, currency='USD'):
+        """Get price in specified currency"""
+        if currency == 'USD':
+            return self.price
+        from .currency import convert
+        return getattr(self, f'price_{currency.lower()}', None) or convert(self.price, currency)
+
+    def get_sale_price(self, currency='USD'):
+        """Get sale price in specified currency"""
+        if currency == 'USD':
+            return self.sale_price
+        return getattr(self, f'sale_price_{currency.lower()}', None)
+
+    def get_current_price(self, currency='USD'):
+        """Get current price in specified currency"""
+        sale = self.get_sale_price(currency)
+        return sale if sale else self.get_price(currency)
+
+    @property
+    def is_in_stock(self):
+        return self.stock_quantity > 0
+
+
+# ============================================================================
+# EXCHANGE RATES
+# ============================================================================
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` per US dollar, loaded by ``update_exchange_rates``"""
+    currency = models.CharField(max_length=3, unique=True)
+    rate = models.DecimalField(max_digits=12, decimal_places=6)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['currency']
+
+    def __str__(self):
+        return f"USD/{self.currency} {self.rate}"
+
 
 # ============================================================================
 # USER MANAGEMENT & PROFILES
@@ -365,6 +506,7 @@ class ProductVariant(models.Model):
     sale_price_gbp = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     sale_price_cad = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     sale_price_aud = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    derived_prices = models.JSONField(default=dict, blank=True, editable=False)
     stock_quantity = models.PositiveIntegerField(default=0)
     weight = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
 
@@ -378,7 +520,8 @@ class ProductVariant(models.Model):
         """Get price in specified currency"""
         if currency == 'USD':
             return self.price
-        return getattr(self, f'price_{currency.lower()}', None) or self.price
+        from .currency import convert
+        return getattr(self, f'price_{currency.lower()}', None) or convert(self.price, currency)
     
     def get_sale_price(self, currency='USD'):
         """Get sale price in specified currency"""
@@ -410,17 +553,23 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart {self.id} - {self.user or 'Guest'}"
 
+    @property
+    def summary(self):
+        """Aggregated totals for this cart (see ``apps.shop.cart``)"""
+        from .cart import get_cart_summary
+        return get_cart_summary(self)
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.summary.total_items
 
     @property
     def subtotal(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.summary.subtotal
 
     @property
     def total_weight(self):
-        return sum(item.total_weight for item in self.items.all())
+        return self.summary.total_weight
 
 
 class CartItem(models.Model):
@@ -454,6 +603,30 @@ class CartItem(models.Model):
         return (weight or 0) * self.quantity
 
 
+class StockReservation(models.Model):
+    """Short-lived hold on stock taken when checkout starts.
+
+    A reservation does not change ``stock_quantity``; it lowers the stock other
+    carts see as available until it expires, is released, or is converted by
+    ``apps.shop.orders.place_order``.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(ProductPage, on_delete=models.CASCADE, related_name='reservations')
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for cart {self.cart_id}"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+
 # ============================================================================
 # COUPONS & DISCOUNTS
 # ============================================================================
@@ -500,32 +673,46 @@ class Coupon(models.Model):
         return f"{self.code} - {self.name}"
 
     def is_valid(self, user=None, cart_total=0):
-        """Check if coupon is valid"""
-        now = timezone.now()
-
-        if not self.is_active:
-            return False, "Coupon is not active"
-
-        if now < self.valid_from or now > self.valid_until:
-            return False, "Coupon has expired"
-
-        if self.usage_limit and self.used_count >= self.usage_limit:
-            return False, "Coupon usage limit reached"
-
-        if cart_total < self.minimum_amount:
-            return False, f"Minimum order amount is ${self.minimum_amount}"
+        """Check if coupon is valid for a cart total (see ``apps.shop.coupons``)"""
+        from .coupons import CouponRule, compile_coupons, get_user_usage
+        rule = compile_coupons([self])[self.code] if self.pk else CouponRule(self)
+        quote, message = rule.evaluate(Decimal(str(cart_total)), usage=get_user_usage(user))
+        return quote is not None, message
+
+
+class CouponRedemption(models.Model):
+    """One use of a coupon by an order; the ledger behind ``Coupon.used_count``"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='coupon_redemptions')
+    order = models.OneToOneField('shop.Order', on_delete=models.CASCADE, related_name='coupon_redemption')
+    # Nth use of the coupon by this user; unique, so two checkouts cannot take the same slot
+    sequence = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
 
-        if user and self.first_order_only:
-            if Order.objects.filter(user=user).exists():
-                return False, "Coupon is for first orders only"
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['coupon', 'user', 'sequence'], name='unique_coupon_redemption_per_user'
+            ),
+        ]
 
-        return True, "Valid"
+    def __str__(self):
+        return f"{self.coupon.code} - {self.user} #{self.sequence}"
 
 
 # ============================================================================
 # ORDERS & PAYMENTS
 # ============================================================================
 
+class NumberSequence(models.Model):
+    """Counter behind order numbers and payment ids on databases without sequences"""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
 class Order(models.Model):
     """Customer orders"""
     ORDER_STATUS_CHOICES = [
@@ -574,13 +761,14 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if not self.order_number:
             self.order_number = self.generate_order_number()
-        super().save(*args, **kwargs)
+        # post_save receivers write outbox events; keep them in this transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def generate_order_number(self):
         """Generate unique order number"""
-        import random
-        import string
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        from .numbering import next_order_number
+        return next_order_number(self._state.db or 'default')
 
 
 class OrderItem(models.Model):
@@ -641,6 +829,117 @@ class Payment(models.Model):
     def __str__(self):
         return f"Payment {self.payment_id} - {self.amount}"
 
+    def save(self, *args, **kwargs):
+        if not self.payment_id:
+            from .numbering import next_payment_id
+            self.payment_id = next_payment_id(kwargs.get('using') or 'default')
+        # post_save receivers update the order and write outbox events
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class EmailNotification(models.Model):
+    """Queued customer email, rendered and sent by the send_notifications worker"""
+    KIND_CHOICES = [
+        ('order_confirmation', 'Order Confirmation'),
+        ('order_shipped', 'Order Shipped'),
+        ('order_delivered', 'Order Delivered'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    recipient = models.EmailField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.recipient} ({self.status})"
+
+
+class OutboxEvent(models.Model):
+    """Domain event written in the same transaction as the change that raised it.
+
+    The dispatch_outbox worker applies the side effects (emails, loyalty
+    points) after commit, so they are neither lost nor repeated.
+    """
+    TOPIC_CHOICES = [
+        ('order.paid', 'Order Paid'),
+        ('order.shipped', 'Order Shipped'),
+        ('order.delivered', 'Order Delivered'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    topic = models.CharField(max_length=50, choices=TOPIC_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='events')
+    payload = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} ({self.status})"
+
+
+# ============================================================================
+# TAXES
+# ============================================================================
+
+class TaxRate(models.Model):
+    """Sales tax rate for a destination and product tax class.
+
+    A blank region covers the whole country; rates for a region take
+    precedence over the country's.
+    """
+    country = CountryField()
+    region = models.CharField(max_length=100, blank=True, help_text="State or province, as entered in addresses")
+    tax_class = models.CharField(
+        max_length=20,
+        choices=TAX_CLASS_CHOICES + [('digital', 'Digital goods')],
+        default='standard'
+    )
+    rate = models.DecimalField(max_digits=6, decimal_places=4, help_text="0.0825 for 8.25%")
+
+    class Meta:
+        unique_together = ['country', 'region', 'tax_class']
+
+    def __str__(self):
+        region = f"/{self.region}" if self.region else ""
+        return f"{self.country}{region} {self.tax_class}: {self.rate}"
+
 
 # ============================================================================
 # SHIPPING
@@ -677,6 +976,33 @@ class ShippingMethod(models.Model):
         return self.base_cost + (self.cost_per_kg * weight)
 
 
+class ShippingZone(models.Model):
+    """Destination countries that share shipping prices"""
+    name = models.CharField(max_length=100)
+    countries = CountryField(multiple=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ShippingRate(models.Model):
+    """A shipping method's price in one zone.
+
+    Methods with rates only ship to the countries of their zones; methods
+    without any ship everywhere at their own base price.
+    """
+    method = models.ForeignKey(ShippingMethod, on_delete=models.CASCADE, related_name='rates')
+    zone = models.ForeignKey(ShippingZone, on_delete=models.CASCADE, related_name='rates')
+    base_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    cost_per_kg = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['method', 'zone']
+
+    def __str__(self):
+        return f"{self.method} - {self.zone}"
+
+
 class Shipment(models.Model):
     """Order shipments"""
     SHIPMENT_STATUS_CHOICES = [
@@ -781,3 +1107,49 @@ class ProductReview(models.Model):
 
     def __str__(self):
         return f"{self.product.title} - {self.rating} stars by {self.user.username}"
+
+
+# ============================================================================
+# RECOMMENDATIONS
+# ============================================================================
+
+class ProductCooccurrence(models.Model):
+    """Weighted number of baskets holding both products.
+
+    Rows are stored in both directions; the diagonal (``product == other``)
+    holds each product's own weighted basket count. Maintained by
+    ``apps.shop.recommendations``.
+    """
+    product = models.ForeignKey(ProductPage, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(ProductPage, on_delete=models.CASCADE, related_name='+')
+    weight = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['product', 'other']
+
+    def __str__(self):
+        return f"{self.product_id} & {self.other_id}: {self.weight}"
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed top-N "frequently bought together" entry for a product"""
+    product = models.ForeignKey(ProductPage, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(ProductPage, on_delete=models.CASCADE, related_name='recommended_by')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'recommended']
+
+    def __str__(self):
+        return f"{self.product} -> {self.recommended} ({self.score:.2f})"
+
+
+class RecommendationCursor(models.Model):
+    """Last basket line folded into the co-occurrence counts, per source"""
+    source = models.CharField(max_length=20, unique=True)
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.source}: {self.last_id}"
@@ -0,0 +1,198 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone, translation
+
+from .models import EmailNotification
+
+NOTIFICATION_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# How long a claimed batch stays hidden from other workers while it is sent
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'CAD': 'CA$', 'AUD': 'A$'}
+
+
+def get_user_language(user):
+    if hasattr(user, 'shop_profile'):
+        return user.shop_profile.language or 'en'
+    return 'en'
+
+
+def render_order_confirmation_email(order):
+    """Render order confirmation email"""
+    currency = 'USD'
+    if hasattr(order.user, 'shop_profile'):
+        currency = order.user.shop_profile.currency or 'USD'
+    symbol = CURRENCY_SYMBOLS.get(currency, '$')
+
+    subject = f'Order Confirmation - #{order.order_number}'
+    message = f'''
+    Dear {order.user.get_full_name() or order.user.username},
+
+    Thank you for your order! Your order #{order.order_number} has been confirmed.
+
+    Order Total: {symbol}{order.total_amount}
+
+    We'll send you another email when your order ships.
+
+    Best regards,
+    The Brickaria Team
+    '''
+    return subject, message
+
+
+def render_order_shipped_email(order):
+    """Render order shipped email"""
+    subject = f'Your Order Has Shipped - #{order.order_number}'
+    message = f'''
+    Dear {order.user.get_full_name() or order.user.username},
+
+    Great news! Your order #{order.order_number} has been shipped.
+
+    You can track your order using the tracking information provided.
+
+    Best regards,
+    The Brickaria Team
+    '''
+    return subject, message
+
+
+def render_order_delivered_email(order):
+    """Render order delivered email"""
+    subject = f'Order Delivered - #{order.order_number}'
+    message = f'''
+    Dear {order.user.get_full_name() or order.user.username},
+
+    Your order #{order.order_number} has been delivered!
+
+    We hope you love your purchase. Don't forget to leave a review!
+
+    You've earned {int(order.total_amount)} loyalty points for this order.
+
+    Best regards,
+    The Brickaria Team
+    '''
+    return subject, message
+
+
+RENDERERS = {
+    'order_confirmation': render_order_confirmation_email,
+    'order_shipped': render_order_shipped_email,
+    'order_delivered': render_order_delivered_email,
+}
+
+
+def queue_order_email(order, kind):
+    """Queue an order email; the idempotency key makes repeat calls no-ops"""
+    if not order.user.email:
+        return None
+    notification, created = EmailNotification.objects.get_or_create(
+        idempotency_key=f'{kind}:{order.pk}',
+        defaults={
+            'kind': kind,
+            'order': order,
+            'recipient': order.user.email,
+        }
+    )
+    return notification
+
+
+def render_notification(notification):
+    """Render a queued notification in the recipient's language"""
+    order = notification.order
+    with translation.override(get_user_language(order.user)):
+        return RENDERERS[notification.kind](order)
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff: 1, 2, 4 ... minutes, capped at an hour"""
+    return timedelta(minutes=min(2 ** (attempts - 1), 60))
+
+
+def record_failure(notification, error, now):
+    """Note a failed attempt and schedule the retry, or give up after MAX_ATTEMPTS"""
+    notification.last_error = str(error)
+    if notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'failed'
+    else:
+        notification.next_attempt_at = now + get_retry_delay(notification.attempts)
+
+
+def claim_notifications(batch_size, now):
+    """Claim a batch of due notifications and count the attempt.
+
+    Rows are picked with SELECT ... FOR UPDATE SKIP LOCKED where the
+    database supports it, and leased by moving ``next_attempt_at`` past
+    ``CLAIM_TIMEOUT``, so the locks are released before any mail is sent. A
+    worker that dies mid-batch leaves its rows to be retried once the lease
+    runs out.
+    """
+    with transaction.atomic():
+        notifications = EmailNotification.objects.filter(
+            status='pending',
+            next_attempt_at__lte=now,
+        ).select_related('order__user').order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            notifications = notifications.select_for_update(skip_locked=True, of=('self',))
+        batch = list(notifications[:batch_size])
+        if batch:
+            lease = now + CLAIM_TIMEOUT
+            EmailNotification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                attempts=F('attempts') + 1, next_attempt_at=lease
+            )
+            for notification in batch:
+                notification.attempts += 1
+                notification.next_attempt_at = lease
+    return batch
+
+
+def send_notification_batch(batch_size=NOTIFICATION_BATCH_SIZE):
+    """Send one batch of due notifications over a single mail connection.
+
+    The batch is claimed in a short transaction and sent outside it, so no
+    row lock is held while talking to the mail server and several workers
+    can drain the queue side by side. If the mail server cannot be reached,
+    every claimed notification backs off as a failed attempt. Returns the
+    number of notifications processed.
+    """
+    now = timezone.now()
+    batch = claim_notifications(batch_size, now)
+    if not batch:
+        return 0
+
+    update_fields = ['status', 'last_error', 'next_attempt_at', 'sent_at']
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception as e:
+        for notification in batch:
+            record_failure(notification, e, now)
+        EmailNotification.objects.bulk_update(batch, update_fields)
+        return len(batch)
+
+    try:
+        for notification in batch:
+            try:
+                subject, message = render_notification(notification)
+                EmailMessage(
+                    subject,
+                    message,
+                    settings.DEFAULT_FROM_EMAIL,
+                    [notification.recipient],
+                    connection=mail_connection,
+                ).send()
+            except Exception as e:
+                record_failure(notification, e, now)
+            else:
+                notification.status = 'sent'
+                notification.sent_at = timezone.now()
+                notification.last_error = ''
+            notification.save(update_fields=update_fields)
+    finally:
+        mail_connection.close()
+
+    return len(batch)
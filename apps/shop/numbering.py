@@ -0,0 +1,63 @@
+from django.db import connections, transaction
+from django.db.models import F
+
+from .models import NumberSequence
+
+# Crockford base32: no I, L, O or U, so numbers survive being read aloud
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+# PostgreSQL sequences backing each counter, created by migration 0008
+SEQUENCES = {
+    'order_number': 'shop_order_number_seq',
+    'payment_id': 'shop_payment_id_seq',
+}
+
+ORDER_NUMBER_PREFIX = 'BR-'
+ORDER_NUMBER_WIDTH = 8
+PAYMENT_ID_PREFIX = 'PAY-'
+PAYMENT_ID_WIDTH = 10
+
+
+def encode_crockford(value, width):
+    """Encode a non-negative integer as zero-padded Crockford base32"""
+    chars = []
+    while value:
+        value, remainder = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[remainder])
+    return ''.join(reversed(chars)).rjust(width, '0')
+
+
+def next_value(name, using='default'):
+    """Allocate the next value of counter ``name``.
+
+    On PostgreSQL this is ``nextval()``, which never blocks and is never
+    rolled back, so concurrent checkouts get distinct values without retries.
+    Other backends bump a NumberSequence row inside the caller's transaction.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s)', [SEQUENCES[name]])
+            return cursor.fetchone()[0]
+
+    sequences = NumberSequence.objects.using(using)
+    with transaction.atomic(using=using):
+        if not sequences.filter(name=name).update(last_value=F('last_value') + 1):
+            sequences.get_or_create(name=name)
+            sequences.filter(name=name).update(last_value=F('last_value') + 1)
+        return sequences.get(name=name).last_value
+
+
+def next_order_number(using='default'):
+    """Allocate an order number such as ``BR-0000001Z``.
+
+    Numbers are fixed width, so string order matches allocation order and new
+    rows land at the right edge of the unique index. The hyphen keeps them
+    apart from the ten-character random numbers issued before.
+    """
+    return ORDER_NUMBER_PREFIX + encode_crockford(next_value('order_number', using), ORDER_NUMBER_WIDTH)
+
+
+def next_payment_id(using='default'):
+    """Allocate a payment reference such as ``PAY-000000004K``"""
+    return PAYMENT_ID_PREFIX + encode_crockford(next_value('payment_id', using), PAYMENT_ID_WIDTH)
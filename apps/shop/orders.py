@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .coupons import redeem_coupon
+from .listing import refresh_listing_stock
+from .models import Order, OrderItem, Payment, ProductPage, ProductVariant
+from .stock import claim_stock, split_cart_quantities
+from .tax import compute_items_tax
+
+
+def address_snapshot(address):
+    """Copy the address fields an order keeps after the address is edited"""
+    return {
+        'first_name': address.first_name,
+        'last_name': address.last_name,
+        'address_line_1': address.address_line_1,
+        'city': address.city,
+        'country': str(address.country),
+    }
+
+
+def place_order(cart, user, billing_address, shipping_address, payment_method,
+                shipping_cost, coupon=None, tax_amount=None):
+    """Turn a cart into an order inside a single transaction.
+
+    Cart lines are loaded once with their product and variant and order items
+    are written with one bulk INSERT. Stock is claimed with one conditional
+    UPDATE per table (``stock_quantity >= n``), so concurrent checkouts can
+    never sell more units than exist; the cart's reservation is converted in
+    the same transaction. ``coupon`` is the ``CouponQuote`` checkout showed;
+    it is redeemed last, once everything else has succeeded. Unless
+    ``tax_amount`` is given, tax is computed from the same lines as the
+    subtotal, after the discount.
+    """
+    with transaction.atomic():
+        lines = list(cart.items.select_related('product', 'variant'))
+        if not lines:
+            raise ValueError('Cart is empty')
+
+        product_quantities, variant_quantities = split_cart_quantities(lines)
+        claim_stock(ProductPage, product_quantities, cart)
+        claim_stock(ProductVariant, variant_quantities, cart)
+        cart.reservations.all().delete()
+
+        subtotal = sum(line.total_price for line in lines)
+        discount_amount = min(coupon.discount, subtotal) if coupon else Decimal('0.00')
+        if tax_amount is None:
+            tax_amount = compute_items_tax(lines, shipping_address, discount_amount).total
+        total_amount = subtotal - discount_amount + tax_amount + shipping_cost
+
+        order = Order.objects.create(
+            user=user,
+            subtotal=subtotal,
+            tax_amount=tax_amount,
+            shipping_cost=shipping_cost,
+            discount_amount=discount_amount,
+            total_amount=total_amount,
+            coupon_id=coupon.coupon_id if coupon else None,
+            billing_address=address_snapshot(billing_address),
+            shipping_address=address_snapshot(shipping_address),
+        )
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=line.product,
+                variant=line.variant,
+                quantity=line.quantity,
+                unit_price=line.unit_price,
+                total_price=line.total_price,
+                product_name=line.product.title,
+                product_sku=line.variant.sku if line.variant else line.product.sku,
+            )
+            for line in lines
+        ])
+
+        Payment.objects.create(
+            order=order,
+            method=payment_method,
+            amount=total_amount,
+            gateway='manual'
+        )
+
+        cart.items.all().delete()
+
+        if coupon:
+            redeem_coupon(coupon, order)
+
+        if product_quantities:
+            transaction.on_commit(lambda: refresh_listing_stock(list(product_quantities)))
+
+    return order
@@ -0,0 +1,87 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .loyalty import award_loyalty_points
+from .models import OutboxEvent
+from .notifications import queue_order_email, get_retry_delay
+
+OUTBOX_BATCH_SIZE = 100
+MAX_ATTEMPTS = 10
+
+
+def record_event(topic, order, payload=None):
+    """Write an outbox event in the caller's transaction.
+
+    The idempotency key is ``topic:order_id``, so saving an order in the same
+    state again does not raise the event twice.
+    """
+    event, created = OutboxEvent.objects.get_or_create(
+        idempotency_key=f'{topic}:{order.pk}',
+        defaults={
+            'topic': topic,
+            'order': order,
+            'payload': payload or {},
+        }
+    )
+    return event
+
+
+def handle_order_paid(event):
+    queue_order_email(event.order, 'order_confirmation')
+
+
+def handle_order_shipped(event):
+    queue_order_email(event.order, 'order_shipped')
+
+
+def handle_order_delivered(event):
+    award_loyalty_points(event.order)
+    queue_order_email(event.order, 'order_delivered')
+
+
+EVENT_HANDLERS = {
+    'order.paid': handle_order_paid,
+    'order.shipped': handle_order_shipped,
+    'order.delivered': handle_order_delivered,
+}
+
+
+def dispatch_outbox_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """Apply the side effects of one batch of pending outbox events.
+
+    Events are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the
+    database supports it, so several dispatchers never handle the same event.
+    Each handler runs in a savepoint: its writes commit together with the
+    event's ``processed`` status, or roll back and the event is retried.
+    Returns the number of events handled.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = OutboxEvent.objects.filter(
+            status='pending',
+            available_at__lte=now,
+        ).select_related('order__user').order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            events = events.select_for_update(skip_locked=True, of=('self',))
+        batch = list(events[:batch_size])
+
+        for event in batch:
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    EVENT_HANDLERS[event.topic](event)
+            except Exception as e:
+                event.last_error = str(e)
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = 'failed'
+                else:
+                    event.available_at = now + get_retry_delay(event.attempts)
+            else:
+                event.status = 'processed'
+                event.processed_at = timezone.now()
+                event.last_error = ''
+            event.save(update_fields=[
+                'status', 'attempts', 'last_error', 'available_at', 'processed_at'
+            ])
+
+    return len(batch)
@@ -0,0 +1,61 @@
+import base64
+import json
+
+from django.db.models import Q
+
+from .models import ProductListing
+
+LISTING_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(value, pk):
+    """Encode a (sort value, pk) pair as an opaque URL-safe token"""
+    raw = json.dumps([None if value is None else str(value), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field_name):
+    """Decode a cursor into a (sort value, pk) pair for ``field_name``"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        field = ProductListing._meta.get_field(field_name)
+        return field.to_python(value), int(pk)
+    except Exception as e:
+        raise InvalidCursor(str(e))
+
+
+def keyset_page(products, ordering, cursor=None, page_size=LISTING_PAGE_SIZE):
+    """Return one page of ``products`` after ``cursor`` plus the next cursor.
+
+    ``ordering`` is a (field, 'pk') pair such as ``('-price', '-pk')``; the pk
+    tiebreaker makes the ordering total so a cursor identifies exactly one
+    position. Seeking with a WHERE on the sort key keeps every page as cheap
+    as the first, unlike OFFSET which scans all earlier rows.
+    """
+    sort_field = ordering[0]
+    descending = sort_field.startswith('-')
+    field_name = sort_field.lstrip('-')
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    products = products.order_by(*ordering)
+    if cursor:
+        value, pk = decode_cursor(cursor, field_name)
+        if descending:
+            seek = Q(**{f'{field_name}__lt': value}) | Q(**{field_name: value, 'pk__lt': pk})
+        else:
+            seek = Q(**{f'{field_name}__gt': value}) | Q(**{field_name: value, 'pk__gt': pk})
+        products = products.filter(seek)
+
+    items = list(products[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field_name), last.pk)
+    return items, next_cursor
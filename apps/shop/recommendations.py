@@ -0,0 +1,153 @@
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.pagecache import invalidate_pages
+from .models import (
+    CartItem, OrderItem, ProductCooccurrence, ProductRecommendation, RecommendationCursor, WishlistItem
+)
+
+RECOMMENDATIONS_COUNT = 3
+
+# Pairs seen in fewer weighted baskets than this are too thin to recommend
+MIN_COOCCURRENCE = 1.0
+
+# Lines younger than this are left for the next run, so a line whose
+# transaction commits after a higher id was folded in is not skipped
+SETTLE_DELAY = timedelta(minutes=5)
+
+# source: (line model, basket field, creation time field, weight)
+SOURCES = {
+    'order': (OrderItem, 'order_id', 'order__created_at', 1.0),
+    'cart': (CartItem, 'cart_id', 'added_at', 0.5),
+    'wishlist': (WishlistItem, 'wishlist_id', 'added_at', 0.25),
+}
+
+
+def count_new_pairs(source, last_id):
+    """Co-occurrence counts contributed by lines added after ``last_id``.
+
+    Each new line is paired with the distinct products already in its
+    basket (lines with a lower id), so every pair in a basket is counted
+    exactly once however many runs it is spread over. Returns the sparse
+    counts as ``{(product_id, other_id): weight}`` and the new cursor.
+    """
+    model, basket_field, created_field, weight = SOURCES[source]
+    new_lines = list(
+        model.objects.filter(
+            id__gt=last_id, **{f'{created_field}__lte': timezone.now() - SETTLE_DELAY}
+        ).order_by('id').values_list('id', basket_field, 'product_id')
+    )
+    if not new_lines:
+        return Counter(), last_id
+    last_id = new_lines[-1][0]
+
+    baskets = defaultdict(list)
+    for line_id, basket_id, product_id in model.objects.filter(
+        id__lte=last_id, **{f'{basket_field}__in': {basket_id for _, basket_id, _ in new_lines}}
+    ).order_by('id').values_list('id', basket_field, 'product_id'):
+        baskets[basket_id].append((line_id, product_id))
+
+    counts = Counter()
+    for line_id, basket_id, product_id in new_lines:
+        earlier = {other_id for other_line_id, other_id in baskets[basket_id] if other_line_id < line_id}
+        if product_id in earlier:
+            continue  # another variant of a product the basket already counted
+        counts[product_id, product_id] += weight
+        for other_id in earlier:
+            counts[product_id, other_id] += weight
+            counts[other_id, product_id] += weight
+    return counts, last_id
+
+
+def add_counts(counts):
+    """Fold sparse counts into the co-occurrence table"""
+    if not counts:
+        return
+    product_ids = {product_id for product_id, _ in counts}
+    existing = {
+        (row.product_id, row.other_id): row
+        for row in ProductCooccurrence.objects.filter(product_id__in=product_ids)
+    }
+    updated, created = [], []
+    for (product_id, other_id), weight in counts.items():
+        row = existing.get((product_id, other_id))
+        if row is None:
+            created.append(ProductCooccurrence(product_id=product_id, other_id=other_id, weight=weight))
+        else:
+            row.weight += weight
+            updated.append(row)
+    ProductCooccurrence.objects.bulk_update(updated, ['weight'])
+    ProductCooccurrence.objects.bulk_create(created)
+
+
+def refresh_recommendations(product_ids):
+    """Recompute the top-N table for ``product_ids`` from the co-occurrence counts.
+
+    Scores are cosine-normalised, ``count(a, b) / sqrt(count(a) * count(b))``,
+    so products that are in every basket do not top every list.
+    """
+    pairs = list(
+        ProductCooccurrence.objects.filter(
+            product_id__in=product_ids, weight__gte=MIN_COOCCURRENCE
+        ).exclude(other=F('product')).values_list('product_id', 'other_id', 'weight')
+    )
+    totals = dict(
+        ProductCooccurrence.objects.filter(
+            product=F('other'),
+            product_id__in=set(product_ids) | {other_id for _, other_id, _ in pairs},
+        ).values_list('product_id', 'weight')
+    )
+
+    scored = defaultdict(list)
+    for product_id, other_id, weight in pairs:
+        scored[product_id].append((weight / math.sqrt(totals[product_id] * totals[other_id]), other_id))
+
+    ProductRecommendation.objects.filter(product_id__in=product_ids).delete()
+    ProductRecommendation.objects.bulk_create([
+        ProductRecommendation(product_id=product_id, recommended_id=other_id, rank=rank, score=score)
+        for product_id, scores in scored.items()
+        for rank, (score, other_id) in enumerate(sorted(scores, reverse=True)[:RECOMMENDATIONS_COUNT])
+    ])
+
+
+def get_neighbours(product_ids):
+    """Products that share a basket with any of ``product_ids``"""
+    return set(
+        ProductCooccurrence.objects.filter(product_id__in=product_ids).values_list('other_id', flat=True)
+    )
+
+
+def update_recommendations(rebuild=False):
+    """Fold new basket lines into the counts and refresh the affected products.
+
+    A product's scores are normalised by the totals of the products it pairs
+    with, so new lines also move the scores of every product sharing a
+    basket with a touched product; those neighbours are refreshed too.
+
+    Runs under a lock on the cursor rows, so overlapping runs cannot count a
+    line twice. With ``rebuild`` the counts are recomputed from scratch.
+    Returns the number of products whose recommendations were refreshed.
+    """
+    with transaction.atomic():
+        if rebuild:
+            ProductCooccurrence.objects.all().delete()
+            ProductRecommendation.objects.all().delete()
+            RecommendationCursor.objects.update(last_id=0)
+
+        touched = set()
+        for source in SOURCES:
+            cursor, _ = RecommendationCursor.objects.select_for_update().get_or_create(source=source)
+            counts, cursor.last_id = count_new_pairs(source, cursor.last_id)
+            add_counts(counts)
+            touched.update(product_id for product_id, _ in counts)
+            cursor.save(update_fields=['last_id'])
+
+        affected = touched | get_neighbours(touched) if touched else set()
+        refresh_recommendations(affected)
+        transaction.on_commit(lambda: invalidate_pages(affected))
+    return len(affected)
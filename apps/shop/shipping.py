@@ -0,0 +1,112 @@
+from decimal import Decimal
+
+from apps.core.versions import bump_version, get_version
+from .cart import TWO_PLACES, get_cart_summary
+from .models import ShippingMethod, ShippingRate
+
+SHIPPING_VERSION_KEY = 'shop:shipping_version'
+
+ZERO = Decimal('0.00')
+
+# (version, ShippingTable) for this process
+_table = (None, None)
+
+
+class ShippingQuote:
+    """What one shipping method charges for a cart"""
+    __slots__ = ('method_id', 'name', 'description', 'cost', 'min_delivery_days', 'max_delivery_days')
+
+    def __init__(self, method, cost):
+        self.method_id = method.id
+        self.name = method.name
+        self.description = method.description
+        self.cost = cost
+        self.min_delivery_days = method.min_delivery_days
+        self.max_delivery_days = method.max_delivery_days
+
+    def as_dict(self, cost=None):
+        """Plain values for templates and JSON; ``cost`` overrides the quoted price"""
+        return {
+            'method_id': self.method_id,
+            'name': self.name,
+            'description': self.description,
+            'cost': self.cost if cost is None else cost,
+            'min_delivery_days': self.min_delivery_days,
+            'max_delivery_days': self.max_delivery_days,
+        }
+
+
+class ShippingTable:
+    """Active shipping methods with their zone prices keyed by destination country"""
+
+    def __init__(self, methods, rates):
+        self.methods = list(methods)
+        # (method id, country code) -> (base cost, cost per kg)
+        self.zone_prices = {}
+        for rate in rates:
+            for country in rate.zone.countries:
+                self.zone_prices.setdefault(
+                    (rate.method_id, country.code), (rate.base_cost, rate.cost_per_kg)
+                )
+        self.zoned_method_ids = {method_id for method_id, country in self.zone_prices}
+
+    def get_price(self, method, country):
+        """``(base cost, cost per kg)`` of a method for a destination, or None if it does not ship there"""
+        if method.id in self.zoned_method_ids:
+            return self.zone_prices.get((method.id, country))
+        return method.base_cost, method.cost_per_kg
+
+    def quote(self, weight, subtotal, country):
+        """Quotes of every method that can carry ``weight`` to ``country``, cheapest first"""
+        quotes = []
+        for method in self.methods:
+            if method.max_weight is not None and weight > method.max_weight:
+                continue
+            price = self.get_price(method, country)
+            if price is None:
+                continue
+            if method.free_shipping_threshold and subtotal >= method.free_shipping_threshold:
+                cost = ZERO
+            else:
+                base_cost, cost_per_kg = price
+                cost = (base_cost + cost_per_kg * weight).quantize(TWO_PLACES)
+            quotes.append(ShippingQuote(method, cost))
+        quotes.sort(key=lambda quote: (quote.cost, quote.max_delivery_days))
+        return quotes
+
+
+def get_shipping_version():
+    return get_version(SHIPPING_VERSION_KEY)
+
+
+def invalidate_shipping_table():
+    """Make every process reload its shipping methods and zones"""
+    bump_version(SHIPPING_VERSION_KEY)
+
+
+def get_shipping_table():
+    """The shipping table, kept in-process until the shared version moves"""
+    global _table
+    version = get_shipping_version()
+    if _table[0] != version:
+        methods = ShippingMethod.objects.filter(is_active=True).order_by('id')
+        rates = ShippingRate.objects.filter(method__is_active=True).select_related('zone').order_by('zone_id')
+        _table = (version, ShippingTable(methods, rates))
+    return _table[1]
+
+
+def get_shipping_quotes(cart, country):
+    """Quotes of every active method for a cart and destination country.
+
+    Weight and subtotal come from the cached cart summary and prices from
+    the in-process table, so a warm call runs no queries. Results are
+    memoized on the cart instance per destination.
+    """
+    country = str(country)
+    memo = getattr(cart, '_shipping_quotes', None)
+    if memo is None:
+        memo = cart._shipping_quotes = {}
+    if country not in memo:
+        summary = get_cart_summary(cart)
+        memo[country] = get_shipping_table().quote(summary.total_weight, summary.subtotal, country)
+    return memo[country]
@@ -1,10 +1,20 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-from django.conf import settings
-from django.utils import translation
-from .models import UserProfile, Order, Payment, LoyaltyTransaction
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from wagtail.images import get_image_model
+from wagtail.signals import page_published, page_unpublished, post_page_move
+from .cart import bump_prices_version, forget_cart_count, invalidate_cart_summary
+from .coupons import invalidate_coupon_rules
+from .currency import derive_prices, get_rates
+from .listing import sync_product_listing, remove_product_listing
+from .models import (
+    UserProfile, Order, Payment, ProductPage, ProductVariant, CartItem, Coupon,
+    ShippingMethod, ShippingZone, ShippingRate, TaxRate
+)
+from .outbox import record_event
+from .shipping import invalidate_shipping_table
+from .tax import invalidate_tax_table
 
 
 @receiver(post_save, sender=User)
@@ -21,178 +31,112 @@ def save_user_profile(sender, instance, **kwargs):
         instance.shop_profile.save()
 
 
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def reset_cart_count(sender, request, **kwargs):
+    """The header badge switches between the guest and the account cart"""
+    if request is not None and hasattr(request, 'session'):
+        forget_cart_count(request)
+
+
+@receiver(pre_save, sender=ProductPage)
+@receiver(pre_save, sender=ProductVariant)
+def fill_derived_prices(sender, instance, raw=False, **kwargs):
+    """Fill foreign prices editors left empty from the current exchange rates"""
+    if not raw:
+        derive_prices(instance, get_rates())
+
+
+@receiver(page_published, sender=ProductPage)
+def product_published(sender, instance, **kwargs):
+    """Refresh the denormalized listing row when a product is published"""
+    sync_product_listing(instance)
+    bump_prices_version()
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_changed(sender, **kwargs):
+    """Cart summaries price variant lines from the variant row"""
+    bump_prices_version()
+
+
+@receiver(page_unpublished, sender=ProductPage)
+def product_unpublished(sender, instance, **kwargs):
+    """Drop the listing row when a product is unpublished"""
+    remove_product_listing(instance)
+
+
+@receiver(post_page_move)
+def page_moved(sender, instance, **kwargs):
+    """A move changes the URL, and maybe the shop, of every product under the page"""
+    for product in ProductPage.objects.live().descendant_of(instance, inclusive=True):
+        sync_product_listing(product)
+
+
+@receiver(post_save, sender=get_image_model())
+def image_changed(sender, instance, created, raw=False, **kwargs):
+    """Listing rows keep the rendition URL of the product's featured image"""
+    if created or raw:
+        return
+    for product in ProductPage.objects.live().filter(featured_image=instance):
+        sync_product_listing(product)
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    """Drop the cached cart summary whenever a cart line changes"""
+    cart = instance.cart if CartItem.cart.is_cached(instance) else None
+    invalidate_cart_summary(instance.cart_id, cart)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(m2m_changed, sender=Coupon.products.through)
+@receiver(m2m_changed, sender=Coupon.categories.through)
+def coupon_changed(sender, **kwargs):
+    """Recompile the coupon rules after a coupon or its restrictions change"""
+    invalidate_coupon_rules()
+
+
+@receiver(post_save, sender=ShippingMethod)
+@receiver(post_delete, sender=ShippingMethod)
+@receiver(post_save, sender=ShippingZone)
+@receiver(post_delete, sender=ShippingZone)
+@receiver(post_save, sender=ShippingRate)
+@receiver(post_delete, sender=ShippingRate)
+def shipping_changed(sender, **kwargs):
+    """Reload the shipping table after a method, zone or rate changes"""
+    invalidate_shipping_table()
+
+
+@receiver(post_save, sender=TaxRate)
+@receiver(post_delete, sender=TaxRate)
+def tax_rate_changed(sender, **kwargs):
+    """Reload the tax table after a rate changes"""
+    invalidate_tax_table()
+
+
 @receiver(post_save, sender=Order)
 def order_status_changed(sender, instance, created, **kwargs):
-    """Handle order status changes"""
+    """Record outbox events for order status changes"""
     if not created:
-        # Send email notifications based on status
+        # Emails and loyalty points are applied by the outbox dispatcher
         if instance.status == 'shipped':
-            send_order_shipped_email(instance)
+            record_event('order.shipped', instance)
         elif instance.status == 'delivered':
-            send_order_delivered_email(instance)
-            # Award loyalty points for delivered orders
-            award_loyalty_points(instance)
+            record_event('order.delivered', instance)
 
 
 @receiver(post_save, sender=Payment)
 def payment_completed(sender, instance, created, **kwargs):
     """Handle payment completion"""
     if instance.status == 'completed' and instance.order.status == 'pending':
-        # Update order status to paid
+        # Update order status to paid, in the payment's transaction
         instance.order.status = 'paid'
         instance.order.save()
-        
-        # Send order confirmation email
-        send_order_confirmation_email(instance.order)
-
-
-def send_order_confirmation_email(order):
-    """Send order confirmation email"""
-    # Get user language preference
-    user_language = 'en'
-    if hasattr(order.user, 'shop_profile'):
-        user_language = order.user.shop_profile.language or 'en'
-    
-    # Activate user's language
-    translation.activate(user_language)
-    
-    # Get user currency
-    currency = 'USD'
-    if hasattr(order.user, 'shop_profile'):
-        currency = order.user.shop_profile.currency or 'USD'
-    
-    symbols = {'USD': '$', 'EUR': '€', 'GBP': '£', 'CAD': 'CA$', 'AUD': 'A$'}
-    symbol = symbols.get(currency, '$')
-    
-    subject = f'Order Confirmation - #{order.order_number}'
-    message = f'''
-    Dear {order.user.get_full_name() or order.user.username},
-    
-    Thank you for your order! Your order #{order.order_number} has been confirmed.
-    
-    Order Total: {symbol}{order.total_amount}
-    
-    We'll send you another email when your order ships.
-    
-    Best regards,
-    The Brickaria Team
-    '''
-    
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [order.user.email],
-        fail_silently=True,
-    )
-    
-    translation.deactivate()
-
-
-def send_order_shipped_email(order):
-    """Send order shipped email"""
-    user_language = 'en'
-    if hasattr(order.user, 'shop_profile'):
-        user_language = order.user.shop_profile.language or 'en'
-    
-    translation.activate(user_language)
-    
-    subject = f'Your Order Has Shipped - #{order.order_number}'
-    message = f'''
-    Dear {order.user.get_full_name() or order.user.username},
-    
-    Great news! Your order #{order.order_number} has been shipped.
-    
-    You can track your order using the tracking information provided.
-    
-    Best regards,
-    The Brickaria Team
-    '''
-    
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [order.user.email],
-        fail_silently=True,
-    )
-    
-    translation.deactivate()
-
-
-def send_order_delivered_email(order):
-    """Send order delivered email"""
-    user_language = 'en'
-    if hasattr(order.user, 'shop_profile'):
-        user_language = order.user.shop_profile.language or 'en'
-    
-    translation.activate(user_language)
-    
-    subject = f'Order Delivered - #{order.order_number}'
-    message = f'''
-    Dear {order.user.get_full_name() or order.user.username},
-    
-    Your order #{order.order_number} has been delivered!
-    
-    We hope you love your purchase. Don't forget to leave a review!
-    
-    You've earned {int(order.total_amount)} loyalty points for this order.
-    
-    Best regards,
-    The Brickaria Team
-    '''
-    
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [order.user.email],
-        fail_silently=True,
-    )
-    
-    translation.deactivate()
-
-
-def award_loyalty_points(order):
-    """Award loyalty points for completed orders"""
-    if hasattr(order.user, 'shop_profile'):
-        points = int(order.total_amount * settings.LOYALTY_POINTS_PER_DOLLAR)
-        
-        # Add points to user profile
-        order.user.shop_profile.loyalty_points += points
-        
-        # Update loyalty tier
-        update_loyalty_tier(order.user.shop_profile)
-        order.user.shop_profile.save()
-        
-        # Create loyalty transaction record
-        LoyaltyTransaction.objects.create(
-            user=order.user,
-            type='earned',
-            points=points,
-            description=f'Order #{order.order_number}',
-            order=order
-        )
-
-
-def update_loyalty_tier(profile):
-    """Update user's loyalty tier based on points"""
-    points = profile.loyalty_points
-    
-    if points >= settings.LOYALTY_TIERS['platinum']['min_points']:
-        profile.loyalty_tier = 'platinum'
-    elif points >= settings.LOYALTY_TIERS['gold']['min_points']:
-        profile.loyalty_tier = 'gold'
-    elif points >= settings.LOYALTY_TIERS['silver']['min_points']:
-        profile.loyalty_tier = 'silver'
-    else:
-        profile.loyalty_tier = 'bronze'
-
-
-@receiver(pre_save, sender=Order)
-def generate_order_number(sender, instance, **kwargs):
-    """Generate order number if not exists"""
-    if not instance.order_number:
-        import random
-        import string
-        instance.order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
\ No newline at end of file
+
+        # Confirmation email goes out through the outbox
+        record_event('order.paid', instance.order, {'payment_id': instance.payment_id})
+
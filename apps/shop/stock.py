@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+
+from .models import ProductPage, ProductVariant, StockReservation
+
+
+class OutOfStockError(Exception):
+    """Raised when a cart line asks for more units than are available"""
+
+
+def get_reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def split_cart_quantities(lines):
+    """Group cart lines into ({product_id: qty}, {variant_id: qty}) stock claims"""
+    product_quantities = {}
+    variant_quantities = {}
+    for line in lines:
+        if line.variant_id:
+            variant_quantities[line.variant_id] = variant_quantities.get(line.variant_id, 0) + line.quantity
+        else:
+            product_quantities[line.product_id] = product_quantities.get(line.product_id, 0) + line.quantity
+    return product_quantities, variant_quantities
+
+
+def get_held_quantities(model, pks, exclude_cart=None):
+    """Units of ``pks`` held by unexpired reservations of other carts"""
+    reservations = StockReservation.objects.filter(expires_at__gt=timezone.now())
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    if model is ProductVariant:
+        reservations = reservations.filter(variant_id__in=pks)
+        key = 'variant_id'
+    else:
+        reservations = reservations.filter(variant__isnull=True, product_id__in=pks)
+        key = 'product_id'
+    return dict(reservations.values_list(key).annotate(held=Sum('quantity')))
+
+
+def _check_available(model, quantities, cart):
+    """Lock the stock rows and make sure reservations of other carts leave enough"""
+    if not quantities:
+        return
+    stock = dict(
+        model.objects.select_for_update().filter(pk__in=quantities).values_list('pk', 'stock_quantity')
+    )
+    held = get_held_quantities(model, list(quantities), exclude_cart=cart)
+    for pk, quantity in quantities.items():
+        if stock.get(pk, 0) - held.get(pk, 0) < quantity:
+            raise OutOfStockError('Some items in your cart are no longer in stock')
+
+
+def reserve_cart_stock(cart):
+    """Hold stock for every line in the cart for the reservation TTL.
+
+    Replaces any reservation the cart already holds. The stock rows are locked
+    while availability is checked so two carts cannot both reserve the last
+    unit.
+    """
+    expires_at = timezone.now() + get_reservation_ttl()
+    with transaction.atomic():
+        lines = list(cart.items.all())
+        product_quantities, variant_quantities = split_cart_quantities(lines)
+
+        _check_available(ProductPage, product_quantities, cart)
+        _check_available(ProductVariant, variant_quantities, cart)
+
+        cart.reservations.all().delete()
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                cart=cart,
+                product_id=line.product_id,
+                variant_id=line.variant_id,
+                quantity=line.quantity,
+                expires_at=expires_at,
+            )
+            for line in lines
+        ])
+
+
+def claim_stock(model, quantities, cart=None):
+    """Decrement stock for all of ``quantities`` in one conditional UPDATE.
+
+    Each row is only touched if ``stock_quantity`` still covers the claim plus
+    whatever other carts have reserved; if any row fails the condition the
+    whole claim raises and the surrounding transaction rolls back.
+    """
+    if not quantities:
+        return
+    held = get_held_quantities(model, list(quantities), exclude_cart=cart)
+    condition = Q()
+    for pk, quantity in quantities.items():
+        condition |= Q(pk=pk, stock_quantity__gte=quantity + held.get(pk, 0))
+
+    updated = model.objects.filter(condition).update(
+        stock_quantity=F('stock_quantity') - Case(
+            *[When(pk=pk, then=quantity) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        )
+    )
+    if updated != len(quantities):
+        raise OutOfStockError('Some items in your cart are no longer in stock')
+
+
+def release_cart_reservations(cart):
+    """Drop every reservation held by a cart"""
+    return cart.reservations.all().delete()[0]
+
+
+def release_expired_reservations():
+    """Sweep reservations whose TTL has passed"""
+    return StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -0,0 +1,155 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.versions import bump_version, get_version
+from .cart import CART_SUMMARY_TIMEOUT, TWO_PLACES, CartLine, get_cart_lines, get_cart_tax_cache_key
+from .models import TaxRate
+
+TAX_VERSION_KEY = 'shop:tax_version'
+
+ZERO = Decimal('0.00')
+
+# TaxTable for this process
+_table = None
+
+
+class CartTax:
+    """Tax of every line of a cart and their total"""
+
+    def __init__(self, lines):
+        # [(product id, rate, tax)]
+        self.lines = lines
+        self.total = sum((tax for product_id, rate, tax in lines), ZERO)
+
+
+class TaxTable:
+    """Tax rates keyed by ``(country, region, tax class)``"""
+
+    def __init__(self, version, rates, default_rate):
+        self.version = version
+        self.rates = {
+            (str(country), region.strip().upper(), tax_class): rate
+            for country, region, tax_class, rate in rates
+        }
+        self.default_rate = default_rate
+
+    def get_rate(self, country, region, tax_class):
+        """Most specific rate for a destination: region before country, own class before standard.
+
+        Destinations without a matching rate use ``DEFAULT_TAX_RATE``.
+        """
+        if tax_class == 'zero':
+            return Decimal('0')
+        for rate_class in dict.fromkeys([tax_class, 'standard']):
+            for key in ((country, region, rate_class), (country, '', rate_class)):
+                rate = self.rates.get(key)
+                if rate is not None:
+                    return rate
+        return self.default_rate
+
+    def compute(self, lines, country, region, discount=ZERO):
+        """Tax each line in one pass, rounding per line.
+
+        An order ``discount`` is taken off the lines before tax, spread in
+        proportion to their totals, so no tax is charged on money the
+        customer does not pay.
+        """
+        rates = {}
+        taxed = []
+        for line, share in zip(lines, allocate_discount(lines, discount)):
+            tax_class = 'digital' if line.is_digital else line.tax_class
+            rate = rates.get(tax_class)
+            if rate is None:
+                rate = rates[tax_class] = self.get_rate(country, region, tax_class)
+            taxable = max(line.total_price - share, ZERO)
+            taxed.append((
+                line.product_id, rate,
+                (taxable * rate).quantize(TWO_PLACES, rounding=ROUND_HALF_UP),
+            ))
+        return CartTax(taxed)
+
+
+def allocate_discount(lines, discount):
+    """Split ``discount`` across ``lines`` in proportion to their totals, to the cent.
+
+    The last line takes the rounding remainder, so the shares always add up
+    to the discount.
+    """
+    subtotal = sum((line.total_price for line in lines), ZERO)
+    if not lines or not discount or not subtotal:
+        return [ZERO] * len(lines)
+    discount = min(discount, subtotal)
+    shares = [
+        (line.total_price * discount / subtotal).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+        for line in lines[:-1]
+    ]
+    shares.append(discount - sum(shares, ZERO))
+    return shares
+
+
+def get_tax_version():
+    return get_version(TAX_VERSION_KEY)
+
+
+def invalidate_tax_table():
+    """Make every process reload its tax rates"""
+    bump_version(TAX_VERSION_KEY)
+
+
+def get_tax_table():
+    """The tax table, kept in-process until the shared version moves"""
+    global _table
+    version = get_tax_version()
+    if _table is None or _table.version != version:
+        _table = TaxTable(
+            version,
+            TaxRate.objects.values_list('country', 'region', 'tax_class', 'rate'),
+            Decimal(str(settings.DEFAULT_TAX_RATE)),
+        )
+    return _table
+
+
+def get_destination(address):
+    """``(country, region)`` a tax lookup is keyed by"""
+    if address is None:
+        return '', ''
+    return str(address.country), address.state.strip().upper()
+
+
+def compute_items_tax(items, address=None, discount=ZERO):
+    """Tax cart items already loaded with their product and variant, uncached.
+
+    ``place_order`` uses this so an order's tax always matches the prices
+    of the lines it stores.
+    """
+    lines = [
+        CartLine(item.product_id, set(), item.quantity, item.unit_price, item.product.is_digital,
+                 item.product.tax_class)
+        for item in items
+    ]
+    return get_tax_table().compute(lines, *get_destination(address), discount)
+
+
+def get_cart_tax(cart, address=None, discount=ZERO):
+    """Tax for a cart shipped to ``address``, after an order ``discount``.
+
+    Results are cached per cart, destination, discount and table version;
+    the entry is dropped with the cart summary whenever the cart's items
+    change. Without an address every line is taxed at ``DEFAULT_TAX_RATE``.
+    """
+    country, region = get_destination(address)
+    table = get_tax_table()
+
+    cache_key = get_cart_tax_cache_key(cart.pk)
+    # Only results of the current table are worth keeping
+    entries = {
+        key: tax for key, tax in (cache.get(cache_key) or {}).items() if key[0] == table.version
+    }
+    key = (table.version, country, region, discount)
+    tax = entries.get(key)
+    if tax is None:
+        tax = entries[key] = table.compute(get_cart_lines(cart), country, region, discount)
+        cache.set(cache_key, entries, CART_SUMMARY_TIMEOUT)
+    return tax
@@ -14,10 +14,10 @@ CURRENCY_SYMBOLS = {
 @register.filter
 def format_price(product_or_amount, currency='USD'):
     """Format price with currency symbol"""
-    from apps.shop.models import ProductPage, ProductVariant
+    from apps.shop.models import ProductPage, ProductVariant, ProductListing
     
     # If it's a product, get the price in the specified currency
-    if isinstance(product_or_amount, (ProductPage, ProductVariant)):
+    if isinstance(product_or_amount, (ProductPage, ProductVariant, ProductListing)):
         amount = product_or_amount.get_current_price(currency)
     else:
         amount = product_or_amount
@@ -1,4 +1,6 @@
 from django import template
+from apps.shop.cards import render_product_cards
+from apps.shop.currency import convert
 from apps.shop.models import ShopIndexPage
 from decimal import Decimal
 
@@ -12,6 +14,12 @@ def get_shop_url():
     return shop_page.url if shop_page else '/shop/'
 
 
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """Render product cards from the fragment cache"""
+    return render_product_cards(context, products)
+
+
 @register.filter
 def currency_format(value, currency='USD'):
     """Format price with currency symbol"""
@@ -37,23 +45,14 @@ def currency_format(value, currency='USD'):
 
 @register.filter
 def convert_currency(value, target_currency='USD'):
-    """Convert currency (simplified - use real exchange rates in production)"""
+    """Convert a US dollar amount with the current exchange rates"""
     if value is None:
         return value
-    
-    try:
-        value = Decimal(str(value))
-    except:
-        return value
-    
-    # Simplified conversion rates (use real API in production)
-    rates = {
-        'USD': Decimal('1.00'),
-        'EUR': Decimal('0.92'),
-        'GBP': Decimal('0.79'),
-        'CAD': Decimal('1.36'),
-        'AUD': Decimal('1.52'),
-    }
-    
-    rate = rates.get(target_currency, Decimal('1.00'))
-    return value * rate
+
+    if not isinstance(value, Decimal):
+        try:
+            value = Decimal(str(value))
+        except:
+            return value
+
+    return convert(value, target_currency)
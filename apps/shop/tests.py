@@ -0,0 +1,1281 @@
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Page, Revision, Site
+
+from .cart import get_cart_summary, compute_cart_summary
+from .coupons import CouponQuote, CouponUnavailable, check_coupon, get_coupon_rules, rank_coupons, redeem_coupon
+from .currency import bump_rates_version, load_rates, reprice_catalog, round_price
+from .facets import compute_facets, get_facets
+from .listing import (
+    refresh_listing_stock, get_sort_ordering, search_listings, sort_listings, bump_listing_version,
+    get_listing_version,
+)
+from .models import (
+    ShopIndexPage, ProductPage, ProductCategory, Brand, ProductListing,
+    ProductVariant, Cart, CartItem, Address, Order, Payment, StockReservation,
+    EmailNotification, OutboxEvent, LoyaltyTransaction, OrderItem, ProductCooccurrence,
+    ProductRecommendation, ExchangeRate, Coupon, CouponRedemption, ShippingMethod, ShippingZone,
+    ShippingRate, TaxRate
+)
+from .notifications import queue_order_email, send_notification_batch
+from .numbering import encode_crockford
+from .orders import place_order
+from .outbox import dispatch_outbox_batch
+from .pagination import keyset_page, InvalidCursor
+from .recommendations import update_recommendations
+from .shipping import get_shipping_quotes
+from .tax import get_cart_tax
+from .stock import OutOfStockError, reserve_cart_stock, release_expired_reservations
+
+
+class ShopTestMixin:
+    """Builds a small shop tree for the tests below"""
+
+    def create_shop(self):
+        cache.clear()
+        root = Site.objects.get(is_default_site=True).root_page
+        self.shop = ShopIndexPage(title='Shop', slug='test-shop')
+        root.add_child(instance=self.shop)
+        self.category = ProductCategory.objects.create(name='Building Sets')
+        self.brand = Brand.objects.create(name='Brickaria')
+
+    def create_product(self, title, price, stock_quantity=5, sale_price=None, **kwargs):
+        product = ProductPage(
+            title=title,
+            slug=title.lower().replace(' ', '-'),
+            short_description=f'{title} description',
+            description='<p>Description</p>',
+            price=Decimal(price),
+            sale_price=Decimal(sale_price) if sale_price else None,
+            sku=title.upper().replace(' ', '-'),
+            stock_quantity=stock_quantity,
+            brand=self.brand,
+            **kwargs
+        )
+        self.shop.add_child(instance=product)
+        product.categories.set([self.category])
+        product.save_revision().publish()
+        return product
+
+
+class ProductListingTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.factory = RequestFactory()
+
+    def test_publish_creates_listing(self):
+        product = self.create_product('Castle', '49.99', sale_price='39.99')
+        listing = ProductListing.objects.get(product=product)
+        self.assertEqual(listing.shop_page_id, self.shop.id)
+        self.assertEqual(listing.price, Decimal('49.99'))
+        self.assertTrue(listing.is_on_sale)
+        self.assertEqual(listing.discount_percentage, 20)
+        self.assertEqual(list(listing.categories.all()), [self.category])
+
+    def test_unpublish_removes_listing(self):
+        product = self.create_product('Castle', '49.99')
+        product.unpublish()
+        self.assertFalse(ProductListing.objects.filter(product=product).exists())
+
+    def test_refresh_listing_stock(self):
+        product = self.create_product('Castle', '49.99', stock_quantity=5)
+        other = self.create_product('Rocket', '19.99', stock_quantity=0)
+        ProductPage.objects.filter(id=product.id).update(stock_quantity=0)
+        ProductPage.objects.filter(id=other.id).update(stock_quantity=3)
+        with CaptureQueriesContext(connection) as queries:
+            refresh_listing_stock([product.id, other.id])
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(ProductListing.objects.get(product=product).is_in_stock)
+        self.assertEqual(ProductListing.objects.get(product=other).stock_quantity, 3)
+
+    def test_stock_change_keeps_listing_version_unless_stock_runs_out(self):
+        product = self.create_product('Castle', '49.99', stock_quantity=5)
+        version = get_listing_version()
+
+        ProductPage.objects.filter(id=product.id).update(stock_quantity=4)
+        refresh_listing_stock([product.id])
+        self.assertEqual(ProductListing.objects.get(product=product).stock_quantity, 4)
+        self.assertEqual(get_listing_version(), version)
+
+        ProductPage.objects.filter(id=product.id).update(stock_quantity=0)
+        refresh_listing_stock([product.id])
+        self.assertNotEqual(get_listing_version(), version)
+
+    def test_publishing_a_revision_keeps_live_stock(self):
+        product = self.create_product('Castle', '49.99', stock_quantity=5)
+        old_revision_id = product.latest_revision_id
+        ProductPage.objects.filter(pk=product.pk).update(stock_quantity=2)
+
+        Revision.objects.get(pk=old_revision_id).publish()
+        self.assertEqual(ProductPage.objects.get(pk=product.pk).stock_quantity, 2)
+
+        # An edit that leaves the stock alone does not undo a checkout since
+        page = ProductPage.objects.get(pk=product.pk).get_latest_revision_as_object()
+        ProductPage.objects.filter(pk=product.pk).update(stock_quantity=1)
+        page.title = 'Castle XL'
+        page.save_revision().publish()
+        self.assertEqual(ProductPage.objects.get(pk=product.pk).stock_quantity, 1)
+
+        # Stock an editor sets still applies
+        page = ProductPage.objects.get(pk=product.pk)
+        page.stock_quantity = 8
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save_revision()
+        self.assertEqual(ProductPage.objects.get(pk=product.pk).stock_quantity, 8)
+        self.assertEqual(ProductListing.objects.get(product=product).stock_quantity, 8)
+
+    def test_moving_products_resyncs_listings(self):
+        product = self.create_product('Castle', '49.99')
+        outlet = ShopIndexPage(title='Outlet', slug='test-outlet')
+        self.shop.get_parent().add_child(instance=outlet)
+
+        product.move(outlet, pos='last-child')
+        listing = ProductListing.objects.get(product=product)
+        self.assertEqual(listing.shop_page_id, outlet.id)
+        self.assertIn('/test-outlet/castle/', listing.url)
+
+        # Moving a page above the shop changes the URL of every product under it
+        catalog = Page(title='Catalog', slug='test-catalog')
+        Page.objects.get(pk=outlet.get_parent().pk).add_child(instance=catalog)
+        ShopIndexPage.objects.get(pk=outlet.pk).move(catalog, pos='last-child')
+        self.assertIn('/test-catalog/test-outlet/castle/', ProductListing.objects.get(product=product).url)
+
+    def test_saving_an_image_resyncs_listings(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            product = self.create_product('Castle', '49.99')
+            image = get_image_model().objects.create(title='Castle', file=get_test_image_file())
+            ProductPage.objects.filter(pk=product.pk).update(featured_image=image)
+            self.assertEqual(ProductListing.objects.get(product=product).image_url, '')
+
+            image.save()
+            self.assertNotEqual(ProductListing.objects.get(product=product).image_url, '')
+
+    def test_search_uses_the_search_backend(self):
+        self.create_product('Castle', '49.99')
+        self.create_product('Rocket', '19.99')
+
+        response = self.client.get(reverse('shop:search_products'), {'q': 'castle'})
+        self.assertEqual([p.title for p in response.context['products']], ['Castle'])
+        self.assertFalse(response.context['truncated'])
+
+    def test_search_keeps_relevance_order(self):
+        self.create_product('Castle Castle Castle', '49.99')
+        self.create_product('Castle gate', '19.99')
+        self.create_product('Rocket', '19.99')
+        ranked = [page.title for page in ProductPage.objects.live().search('castle')]
+
+        response = self.client.get(reverse('shop:search_products'), {'q': 'castle'})
+        self.assertEqual([p.title for p in response.context['products']], ranked)
+
+        products, truncated = search_listings(ProductListing.objects.all(), 'castle', limit=1)
+        self.assertEqual([p.title for p in products.order_by('search_rank')], ranked[:1])
+        self.assertTrue(truncated)
+
+    def test_shop_index_context_uses_listing(self):
+        self.create_product('Castle', '49.99')
+        self.create_product('Rocket', '19.99', stock_quantity=0)
+
+        request = self.factory.get('/', {'sort': 'price_asc'})
+        request.user = User()
+        products = list(self.shop.get_context(request)['products'])
+        self.assertEqual([p.title for p in products], ['Rocket', 'Castle'])
+
+        request = self.factory.get('/', {'in_stock': '1'})
+        request.user = User()
+        products = list(self.shop.get_context(request)['products'])
+        self.assertEqual([p.title for p in products], ['Castle'])
+
+    def test_shop_index_renders(self):
+        self.create_product('Castle', '49.99')
+        response = self.client.get(self.shop.url)
+        self.assertContains(response, 'Castle')
+
+    def test_bad_filters_are_dropped(self):
+        self.create_product('Castle', '49.99')
+        response = self.client.get(self.shop.url, {'category': 'bricks', 'min_price': 'cheap', 'in_stock': '1'})
+        self.assertContains(response, 'Castle')
+        self.assertIsNone(response.context['filters']['category'])
+
+        response = self.client.get(reverse('shop:search_products'), {'q': 'castle', 'max_price': 'NaN'})
+        self.assertEqual([p.title for p in response.context['products']], ['Castle'])
+        self.assertEqual(response.context['max_price'], '')
+
+
+class ShopViewQueryTestCase(ShopTestMixin, TestCase):
+    """Query budgets for the shop pages, which must not grow with the catalogue"""
+
+    def setUp(self):
+        self.create_shop()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, RENDITION_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.image = get_image_model().objects.create(title='Box', file=get_test_image_file())
+        self.castle = self.create_product('Castle', '49.99', featured_image=self.image)
+        self.create_product('Rocket', '19.99', featured_image=self.image)
+        # Signed in, so the page cache is bypassed and the views themselves are measured
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@example.com', 'pass12345'))
+
+    def assertQueryBudget(self, url, count):
+        self.client.get(url)
+        with self.assertNumQueries(count):
+            self.client.get(url)
+        for index in range(4):
+            self.create_product(f'Set {index}', '9.99', featured_image=self.image)
+        self.client.get(url)
+        with self.assertNumQueries(count):
+            self.client.get(url)
+
+    def test_shop_index(self):
+        self.assertQueryBudget(self.shop.url, 17)
+
+    def test_product_page(self):
+        self.assertQueryBudget(self.castle.url, 22)
+
+
+class FacetTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.create_product('Castle', '49.99', sale_price='39.99')
+        self.create_product('Rocket', '19.99', stock_quantity=0)
+        self.create_product('Tower', '120.00')
+
+    def test_compute_facets(self):
+        facets = compute_facets(self.shop, {})
+        self.assertEqual(facets['categories'], {self.category.id: 3})
+        self.assertEqual(facets['brands'], {self.brand.id: 3})
+        self.assertEqual([b['count'] for b in facets['price_buckets']], [1, 1, 0, 1])
+        self.assertEqual(facets['in_stock'], 2)
+        self.assertEqual(facets['on_sale'], 1)
+
+    def test_facets_respect_other_filters(self):
+        facets = compute_facets(self.shop, {'in_stock': '1', 'category': str(self.category.id)})
+        self.assertEqual(facets['categories'], {self.category.id: 2})
+        self.assertEqual(facets['in_stock'], 2)
+        self.assertEqual(facets['on_sale'], 1)
+
+    def test_facets_cached_until_listing_changes(self):
+        self.assertEqual(get_facets(self.shop, {})['in_stock'], 2)
+        with self.assertNumQueries(0):
+            get_facets(self.shop, {})
+        self.create_product('Ship', '10.00')
+        self.assertEqual(get_facets(self.shop, {})['in_stock'], 3)
+
+
+class KeysetPaginationTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        for index, price in enumerate(['10.00', '20.00', '20.00', '30.00', '40.00']):
+            self.create_product(f'Set {index}', price)
+
+    def collect(self, sort, page_size=2):
+        products = ProductListing.objects.filter(shop_page=self.shop)
+        titles, cursor = [], None
+        while True:
+            items, cursor = keyset_page(products, get_sort_ordering(sort), cursor, page_size)
+            titles.extend(item.title for item in items)
+            if not cursor:
+                return titles
+
+    def test_pages_cover_every_product_once(self):
+        for sort in ['price_asc', 'price_desc', 'name_asc', 'name_desc', 'newest']:
+            expected = [
+                p.title for p in sort_listings(ProductListing.objects.filter(shop_page=self.shop), sort)
+            ]
+            self.assertEqual(self.collect(sort), expected, sort)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_page(ProductListing.objects.all(), ('price', 'pk'), 'not-a-cursor')
+
+    def test_product_feed(self):
+        response = self.client.get(
+            reverse('shop:product_feed'), {'shop': self.shop.id, 'sort': 'price_asc', 'page_size': 3}
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([p['title'] for p in data['products']], ['Set 0', 'Set 1', 'Set 2'])
+        self.assertIn('Set 0', data['html'])
+
+        response = self.client.get(reverse('shop:product_feed'), {
+            'shop': self.shop.id, 'sort': 'price_asc', 'page_size': 3, 'cursor': data['next_cursor'],
+        })
+        data = response.json()
+        self.assertEqual([p['title'] for p in data['products']], ['Set 3', 'Set 4'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_product_feed_rejects_bad_parameters(self):
+        url = reverse('shop:product_feed')
+        for params, error in [
+            ({'shop': 'main'}, 'Invalid shop'),
+            ({'category': 'bricks'}, 'Invalid filter: category must be a whole number'),
+            ({'min_price': 'cheap'}, 'Invalid filter: min_price must be a number'),
+            ({'max_price': 'NaN'}, 'Invalid filter: max_price must be a number'),
+            ({'page_size': 'all'}, 'Invalid page size'),
+            ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()['error'], error)
+
+    def test_product_feed_skips_footer_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('shop:product_feed'), {'shop': self.shop.id})
+        footer_tables = ['core_socialmedialink', 'shop_brand', 'games_gamecategory']
+        self.assertFalse([
+            q for q in queries.captured_queries if any(table in q['sql'] for table in footer_tables)
+        ])
+
+
+class ProductCardCacheTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.castle = self.create_product('Castle', '50.00')
+
+    def feed_html(self, **params):
+        return self.client.get(reverse('shop:product_feed'), {'shop': self.shop.id, **params}).json()['html']
+
+    def test_cards_are_served_from_cache_until_version_bump(self):
+        self.assertIn('Castle', self.feed_html())
+
+        # Bypass sync so only the cache can explain the stale title
+        ProductListing.objects.filter(pk=self.castle.pk).update(title='Fortress')
+        self.assertIn('Castle', self.feed_html())
+
+        bump_listing_version()
+        self.assertIn('Fortress', self.feed_html())
+
+    def test_cards_are_keyed_by_currency(self):
+        self.castle.price_eur = Decimal('46.00')
+        self.castle.save_revision().publish()
+        self.assertIn('50.00', self.feed_html())
+
+        self.client.post(reverse('shop:set_currency'), {'currency': 'EUR'})
+        self.assertIn('46.00', self.feed_html())
+
+
+class CartSummaryTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.castle = self.create_product('Castle', '50.00', sale_price='40.00', weight=Decimal('1.50'))
+        self.castle.price_eur = Decimal('46.00')
+        self.castle.save()
+        self.rocket = self.create_product('Rocket', '20.00', weight=Decimal('0.50'))
+        self.variant = ProductVariant.objects.create(
+            product=self.rocket, sku='ROCKET-RED', price=Decimal('25.00'), weight=Decimal('0.75')
+        )
+        self.cart = Cart.objects.create(session_key='abc')
+        CartItem.objects.create(cart=self.cart, product=self.castle, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.rocket, variant=self.variant, quantity=1)
+
+    def test_summary_matches_item_properties(self):
+        items = list(self.cart.items.all())
+        with self.assertNumQueries(1):
+            summary = compute_cart_summary(self.cart.id)
+        self.assertEqual(summary.line_count, 2)
+        self.assertEqual(summary.total_items, 3)
+        self.assertEqual(summary.subtotal, sum(item.total_price for item in items))
+        self.assertEqual(summary.subtotal, Decimal('105.00'))
+        self.assertEqual(summary.total_weight, Decimal('3.75'))
+        self.assertEqual(
+            summary.get_subtotal('EUR'),
+            sum(item.get_unit_price('EUR') * item.quantity for item in items)
+        )
+
+    def test_summary_memoized_and_invalidated(self):
+        cart = Cart.objects.get(id=self.cart.id)
+        self.assertEqual(get_cart_summary(cart).total_items, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.total_items, 3)
+            self.assertEqual(cart.subtotal, Decimal('105.00'))
+
+        CartItem.objects.filter(cart=self.cart, variant=self.variant).get().delete()
+        cart = Cart.objects.get(id=self.cart.id)
+        self.assertEqual(cart.total_items, 2)
+
+    def test_price_changes_retire_cached_summaries(self):
+        self.assertEqual(get_cart_summary(Cart.objects.get(id=self.cart.id)).subtotal, Decimal('105.00'))
+
+        self.castle.sale_price = Decimal('30.00')
+        self.castle.save_revision().publish()
+        self.assertEqual(get_cart_summary(Cart.objects.get(id=self.cart.id)).subtotal, Decimal('85.00'))
+
+        self.variant.price = Decimal('35.00')
+        self.variant.save()
+        self.assertEqual(get_cart_summary(Cart.objects.get(id=self.cart.id)).subtotal, Decimal('95.00'))
+
+    def test_empty_cart(self):
+        summary = compute_cart_summary(Cart.objects.create(session_key='empty').id)
+        self.assertTrue(summary.is_empty)
+        self.assertEqual(summary.subtotal, Decimal('0.00'))
+
+
+class CartBadgeTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.castle = self.create_product('Castle', '50.00')
+
+    def test_badge_count_follows_cart_mutations(self):
+        self.client.post(reverse('shop:add_to_cart'), {'product_id': self.castle.id, 'quantity': 2})
+        self.assertEqual(self.client.get(reverse('shop:cart_count')).json()['count'], 2)
+
+        item = CartItem.objects.get()
+        self.client.post(reverse('shop:update_cart_item'), {'item_id': item.id, 'quantity': 5})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('shop:cart_count')).json()['count'], 5)
+        self.assertFalse([q for q in queries.captured_queries if 'shop_cart' in q['sql']])
+
+        self.client.post(reverse('shop:remove_from_cart'), {'item_id': item.id})
+        self.assertEqual(self.client.get(reverse('shop:cart_count')).json()['count'], 0)
+
+
+class CartBadgeLoginTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.castle = self.create_product('Castle', '50.00')
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+
+    def test_login_switches_badge_to_account_cart(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('shop:add_to_cart'), {'product_id': self.castle.id, 'quantity': 1})
+        self.client.logout()
+
+        self.client.post(reverse('shop:add_to_cart'), {'product_id': self.castle.id, 'quantity': 3})
+        self.assertEqual(self.client.get(reverse('shop:cart_count')).json()['count'], 3)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('shop:cart_count')).json()['count'], 1)
+
+
+class PlaceOrderTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.address = Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Stud Street', city='Billund', state='South', postal_code='7190',
+            country='DK'
+        )
+        self.castle = self.create_product('Castle', '50.00', stock_quantity=3)
+        self.rocket = self.create_product('Rocket', '20.00', stock_quantity=0)
+        self.variant = ProductVariant.objects.create(
+            product=self.rocket, sku='ROCKET-RED', price=Decimal('25.00'), stock_quantity=4
+        )
+        self.cart = Cart.objects.create(user=self.user)
+
+    def place(self):
+        return place_order(
+            cart=self.cart, user=self.user, billing_address=self.address,
+            shipping_address=self.address, payment_method='card',
+            tax_amount=Decimal('0.00'), shipping_cost=Decimal('10.00'),
+        )
+
+    def test_place_order(self):
+        CartItem.objects.create(cart=self.cart, product=self.castle, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.rocket, variant=self.variant, quantity=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.place()
+
+        self.assertEqual(order.subtotal, Decimal('175.00'))
+        self.assertEqual(order.total_amount, Decimal('185.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.payments.get().amount, Decimal('185.00'))
+        self.assertEqual(ProductPage.objects.get(id=self.castle.id).stock_quantity, 1)
+        self.assertEqual(ProductVariant.objects.get(id=self.variant.id).stock_quantity, 1)
+        self.assertEqual(ProductListing.objects.get(product=self.castle).stock_quantity, 1)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_out_of_stock_rolls_back(self):
+        CartItem.objects.create(cart=self.cart, product=self.castle, quantity=5)
+
+        with self.assertRaises(OutOfStockError):
+            self.place()
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductPage.objects.get(id=self.castle.id).stock_quantity, 3)
+        self.assertTrue(self.cart.items.exists())
+
+
+class StockReservationTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.castle = self.create_product('Castle', '50.00', stock_quantity=3)
+        self.first = Cart.objects.create(session_key='first')
+        self.second = Cart.objects.create(session_key='second')
+        CartItem.objects.create(cart=self.first, product=self.castle, quantity=2)
+        CartItem.objects.create(cart=self.second, product=self.castle, quantity=2)
+
+    def test_reservation_holds_stock_from_other_carts(self):
+        reserve_cart_stock(self.first)
+        with self.assertRaises(OutOfStockError):
+            reserve_cart_stock(self.second)
+
+    def test_reserving_again_replaces_the_hold(self):
+        reserve_cart_stock(self.first)
+        reserve_cart_stock(self.first)
+        self.assertEqual(self.first.reservations.count(), 1)
+
+    def test_expired_reservations_are_swept(self):
+        reserve_cart_stock(self.first)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        reserve_cart_stock(self.second)
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertFalse(self.first.reservations.exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OversellLoadTestCase(ShopTestMixin, TransactionTestCase):
+    """200 buyers race for a 10-unit SKU; exactly 10 orders may succeed"""
+
+    # The flush after each test wipes the root page and default Site the
+    # migrations created; restore them for the next test
+    serialized_rollback = True
+
+    buyers = 200
+    stock = 10
+
+    def setUp(self):
+        self.create_shop()
+        self.product = self.create_product('Limited', '99.00', stock_quantity=self.stock)
+        self.carts = []
+        for index in range(self.buyers):
+            user = User.objects.create_user(f'buyer{index}', f'buyer{index}@example.com', 'pass12345')
+            address = Address.objects.create(
+                user=user, type='shipping', first_name='Ada', last_name='Brick',
+                address_line_1='1 Stud Street', city='Billund', state='South',
+                postal_code='7190', country='DK'
+            )
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            self.carts.append((cart, user, address))
+
+    def buy(self, args):
+        cart, user, address = args
+        try:
+            place_order(
+                cart=cart, user=user, billing_address=address, shipping_address=address,
+                payment_method='card', tax_amount=Decimal('0.00'), shipping_cost=Decimal('0.00'),
+            )
+            return True
+        except OutOfStockError:
+            return False
+        finally:
+            connections.close_all()
+
+    def test_no_oversell(self):
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(self.buy, self.carts))
+
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(ProductPage.objects.get(id=self.product.id).stock_quantity, 0)
+
+
+class NotificationQueueTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.order = Order.objects.create(
+            user=self.user, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'),
+            billing_address={}, shipping_address={}
+        )
+
+    def test_status_change_queues_instead_of_sending(self):
+        self.order.status = 'shipped'
+        self.order.save()
+        self.order.save()
+        dispatch_outbox_batch()
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailNotification.objects.filter(kind='order_shipped').count(), 1)
+
+        self.assertEqual(send_notification_batch(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.order.order_number, mail.outbox[0].subject)
+        self.assertEqual(EmailNotification.objects.get().status, 'sent')
+        self.assertEqual(send_notification_batch(), 0)
+
+    def test_failed_send_is_retried_later(self):
+        queue_order_email(self.order, 'order_confirmation')
+
+        with mock.patch('apps.shop.notifications.EmailMessage.send', side_effect=OSError('down')):
+            send_notification_batch()
+
+        notification = EmailNotification.objects.get()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(send_notification_batch(), 0)
+
+    def test_unreachable_mail_server_backs_off(self):
+        queue_order_email(self.order, 'order_confirmation')
+
+        with mock.patch('apps.shop.notifications.get_connection') as get_connection:
+            get_connection.return_value.open.side_effect = OSError('refused')
+            self.assertEqual(send_notification_batch(), 1)
+            self.assertEqual(send_notification_batch(), 0)
+
+        notification = EmailNotification.objects.get()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.last_error, 'refused')
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+    def test_mail_is_sent_outside_the_claiming_transaction(self):
+        queue_order_email(self.order, 'order_confirmation')
+
+        # The test case itself runs inside atomic blocks
+        depth = len(connection.savepoint_ids)
+
+        def send(message):
+            self.assertEqual(len(connection.savepoint_ids), depth)
+            self.assertEqual(EmailNotification.objects.get().attempts, 1)
+            return 1
+
+        with mock.patch('apps.shop.notifications.EmailMessage.send', autospec=True, side_effect=send):
+            self.assertEqual(send_notification_batch(), 1)
+        self.assertEqual(EmailNotification.objects.get().status, 'sent')
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.order = Order.objects.create(
+            user=self.user, subtotal=Decimal('120.00'), total_amount=Decimal('120.00'),
+            billing_address={}, shipping_address={}
+        )
+
+    def test_payment_marks_order_paid_and_records_event(self):
+        Payment.objects.create(
+            order=self.order, payment_id='pay_1', method='card', status='completed',
+            amount=Decimal('120.00'), gateway='manual'
+        )
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.topic, 'order.paid')
+        self.assertFalse(EmailNotification.objects.exists())
+
+        self.assertEqual(dispatch_outbox_batch(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'processed')
+        self.assertEqual(EmailNotification.objects.get().kind, 'order_confirmation')
+
+    def test_delivered_order_awards_points_once(self):
+        self.order.status = 'delivered'
+        self.order.save()
+        self.order.notes = 'Left at the door'
+        self.order.save()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+        dispatch_outbox_batch()
+        dispatch_outbox_batch()
+
+        self.assertEqual(LoyaltyTransaction.objects.filter(order=self.order).count(), 1)
+        self.user.shop_profile.refresh_from_db()
+        self.assertEqual(self.user.shop_profile.loyalty_points, 120)
+
+    def test_failed_handler_rolls_back_and_retries(self):
+        self.order.status = 'delivered'
+        self.order.save()
+
+        with mock.patch('apps.shop.outbox.queue_order_email', side_effect=RuntimeError('boom')):
+            self.assertEqual(dispatch_outbox_batch(), 1)
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.status, 'pending')
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertFalse(LoyaltyTransaction.objects.exists())
+
+
+class OrderNumberTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+
+    def create_order(self):
+        return Order.objects.create(
+            user=self.user, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'),
+            billing_address={}, shipping_address={}
+        )
+
+    def test_encode_crockford(self):
+        self.assertEqual(encode_crockford(0, 4), '0000')
+        self.assertEqual(encode_crockford(31, 4), '000Z')
+        self.assertEqual(encode_crockford(32 ** 2 + 10, 4), '010A')
+
+    def test_order_numbers_are_unique_and_ordered(self):
+        numbers = [self.create_order().order_number for _ in range(40)]
+
+        self.assertEqual(len(set(numbers)), 40)
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertTrue(all(n.startswith('BR-') and len(n) == 11 for n in numbers))
+
+    def test_payment_id_is_allocated(self):
+        order = self.create_order()
+        payments = [
+            Payment.objects.create(order=order, method='card', amount=Decimal('10.00'), gateway='manual')
+            for _ in range(2)
+        ]
+
+        self.assertTrue(payments[0].payment_id.startswith('PAY-'))
+        self.assertLess(payments[0].payment_id, payments[1].payment_id)
+
+
+@mock.patch('apps.shop.recommendations.SETTLE_DELAY', timedelta(0))
+class RecommendationTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.a, self.b, self.c, self.d = [
+            self.create_product(title, '10.00') for title in ('Castle', 'Dragon', 'Knight', 'Tower')
+        ]
+
+    def order(self, *products):
+        order = Order.objects.create(
+            user=self.user, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'),
+            billing_address={}, shipping_address={}
+        )
+        for product in products:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=1, unit_price=product.price,
+                total_price=product.price, product_name=product.title, product_sku=product.sku
+            )
+
+    def recommended(self, product):
+        return list(
+            ProductRecommendation.objects.filter(product=product).values_list('recommended_id', flat=True)
+        )
+
+    def cooccurrence_rows(self):
+        return sorted(ProductCooccurrence.objects.values_list('product_id', 'other_id', 'weight'))
+
+    def test_recommendations_rank_normalised_cooccurrence(self):
+        self.order(self.a, self.b)
+        self.order(self.a, self.b)
+        self.order(self.a, self.c)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.a)
+        CartItem.objects.create(cart=cart, product=self.d)
+
+        update_recommendations()
+        self.assertEqual(self.recommended(self.a), [self.b.pk, self.c.pk])
+        self.assertEqual(self.recommended(self.c), [self.a.pk])
+
+    def test_neighbours_of_touched_products_are_rescored(self):
+        self.order(self.a, self.b)
+        self.order(self.a, self.c)
+        update_recommendations()
+
+        # Only Castle and Tower are in the new basket, but Castle's total
+        # changes Dragon's score for it too
+        self.order(self.a, self.d)
+        self.assertEqual(update_recommendations(), 4)
+        score = ProductRecommendation.objects.get(product=self.b, recommended=self.a).score
+        self.assertAlmostEqual(score, 1 / 3 ** 0.5)
+
+    def test_incremental_runs_match_a_rebuild(self):
+        self.order(self.a, self.b)
+        update_recommendations()
+        self.order(self.a, self.b, self.c)
+        self.order(self.c, self.d)
+        self.assertEqual(update_recommendations(), 4)
+
+        incremental = self.cooccurrence_rows()
+        update_recommendations(rebuild=True)
+        self.assertEqual(self.cooccurrence_rows(), incremental)
+        self.assertEqual(update_recommendations(), 0)
+
+    def test_product_page_shows_recommendations(self):
+        self.order(self.a, self.b)
+        update_recommendations()
+
+        response = self.client.get(self.a.url)
+        self.assertContains(response, 'Frequently bought together')
+        self.assertEqual([listing.pk for listing in response.context['recommended_products']], [self.b.pk])
+
+
+class ExchangeRateTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+
+    def test_round_price(self):
+        self.assertEqual(round_price(Decimal('42.3156'), 'EUR'), Decimal('42.99'))
+        self.assertEqual(round_price(Decimal('0.456'), 'GBP'), Decimal('0.46'))
+
+    def test_missing_prices_are_derived_on_save(self):
+        castle = self.create_product('Castle', '50.00', sale_price='40.00')
+
+        self.assertEqual(castle.price_eur, Decimal('46.99'))
+        self.assertEqual(castle.sale_price_cad, Decimal('54.99'))
+        self.assertEqual(castle.listing.price_eur, Decimal('46.99'))
+        self.assertEqual(castle.get_current_price('GBP'), Decimal('31.99'))
+
+    def test_derived_sale_price_stays_below_price(self):
+        # 51.00 and 50.50 both convert to 46.x EUR and would round to 46.99
+        castle = self.create_product('Castle', '51.00', sale_price='50.50')
+        self.assertEqual(castle.price_eur, Decimal('46.99'))
+        self.assertEqual(castle.sale_price_eur, Decimal('45.99'))
+
+    def test_rate_change_reprices_all_but_editor_prices(self):
+        castle = self.create_product('Castle', '50.00')
+        dragon = self.create_product('Dragon', '20.00')
+        dragon.price_eur = Decimal('15.00')
+        dragon.save_revision().publish()
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'base': 'USD', 'rates': {'EUR': '1.10'}}, f)
+            f.flush()
+            with self.captureOnCommitCallbacks(execute=True):
+                load_rates(f.name)
+        self.assertEqual(ExchangeRate.objects.get(currency='EUR').rate, Decimal('1.10'))
+
+        reprice_catalog()
+        castle.refresh_from_db()
+        dragon.refresh_from_db()
+        self.assertEqual(castle.price_eur, Decimal('55.99'))
+        self.assertEqual(ProductListing.objects.get(pk=castle.pk).price_eur, Decimal('55.99'))
+        self.assertEqual(dragon.price_eur, Decimal('15.00'))
+        self.assertNotIn('price_eur', dragon.derived_prices)
+
+    def test_rates_are_cached_in_process(self):
+        self.create_product('Castle', '50.00')
+        with CaptureQueriesContext(connection) as queries:
+            self.create_product('Dragon', '20.00')
+        self.assertFalse([q for q in queries.captured_queries if 'shop_exchangerate' in q['sql']])
+
+        ExchangeRate.objects.filter(currency='EUR').update(rate=Decimal('1.00'))
+        bump_rates_version()
+        self.assertEqual(self.create_product('Knight', '20.00').price_eur, Decimal('20.99'))
+
+
+class CouponEngineTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.castle = self.create_product('Castle', '80.00')
+        self.rocket = self.create_product('Rocket', '20.00')
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.castle)
+        CartItem.objects.create(cart=self.cart, product=self.rocket, quantity=3)
+
+    def create_coupon(self, code, discount_type='percentage', discount_value='10', **kwargs):
+        now = timezone.now()
+        return Coupon.objects.create(
+            code=code, name=code, discount_type=discount_type,
+            discount_value=Decimal(discount_value), valid_from=now - timedelta(days=1),
+            valid_until=now + timedelta(days=1), **kwargs
+        )
+
+    def order(self, coupon=None):
+        return Order.objects.create(
+            user=self.user, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'),
+            billing_address={}, shipping_address={}, coupon=coupon
+        )
+
+    def test_product_restriction_and_maximum_discount(self):
+        coupon = self.create_coupon('ROCKETS', discount_value='50', maximum_discount=Decimal('25.00'))
+        coupon.products.add(self.rocket)
+
+        quote, message = check_coupon('rockets', self.cart, self.user)
+        self.assertEqual(quote.discount, Decimal('25.00'))
+
+        coupon.products.set([])
+        coupon.categories.add(self.category)
+        coupon.maximum_discount = None
+        coupon.save()
+        quote, message = check_coupon('ROCKETS', self.cart, self.user)
+        self.assertEqual(quote.discount, Decimal('70.00'))
+
+    def test_restricted_coupon_without_matching_items(self):
+        other = self.create_product('Train', '5.00')
+        self.create_coupon('TRAINS').products.add(other)
+
+        quote, message = check_coupon('TRAINS', self.cart, self.user)
+        self.assertIsNone(quote)
+        self.assertEqual(message, 'Coupon does not apply to any items in your cart')
+
+    def test_per_user_limit_and_first_order(self):
+        coupon = self.create_coupon('ONCE', usage_limit_per_user=1)
+        self.create_coupon('WELCOME', first_order_only=True)
+        self.assertEqual(len(rank_coupons(self.cart, self.user)), 2)
+
+        self.order(coupon)
+        self.assertEqual(rank_coupons(self.cart, self.user), [])
+        self.assertEqual(check_coupon('ONCE', self.cart, self.user)[1], 'You have already used this coupon')
+        self.assertFalse(coupon.is_valid(user=self.user, cart_total=100)[0])
+
+    def test_rank_coupons(self):
+        self.create_coupon('TENPERCENT')
+        self.create_coupon('FIVER', discount_type='fixed', discount_value='5')
+        self.create_coupon('THREEFORTWO', discount_type='buy_x_get_y', discount_value='2')
+        self.create_coupon('BIGSPENDER', minimum_amount=Decimal('500.00'))
+
+        get_coupon_rules()
+        with self.assertNumQueries(3):
+            quotes = rank_coupons(self.cart, self.user)
+        self.assertEqual(
+            [(quote.code, quote.discount) for quote in quotes],
+            [('THREEFORTWO', Decimal('20.00')), ('TENPERCENT', Decimal('14.00')), ('FIVER', Decimal('5.00'))]
+        )
+
+    def test_rules_recompile_on_save(self):
+        coupon = self.create_coupon('SPRING')
+        get_coupon_rules()
+        with self.assertNumQueries(0):
+            get_coupon_rules()
+
+        coupon.is_active = False
+        coupon.save()
+        self.assertNotIn('SPRING', get_coupon_rules())
+
+    def test_apply_coupon_view(self):
+        self.create_coupon('SPRING')
+        self.client.force_login(self.user)
+        self.cart.items.all().delete()
+        self.cart.delete()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.castle)
+
+        self.client.post(reverse('shop:apply_coupon'), {'coupon_code': 'spring'})
+        self.assertEqual(self.client.session['applied_coupon'], 'SPRING')
+
+
+class CouponRedemptionTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.address = Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Stud Street', city='Billund', state='South', postal_code='7190',
+            country='DK'
+        )
+        self.castle = self.create_product('Castle', '50.00', stock_quantity=10)
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='SPRING', name='Spring', discount_type='fixed', discount_value=Decimal('5.00'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+            usage_limit=2, usage_limit_per_user=1,
+        )
+
+    def place(self, user):
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.castle)
+        quote, message = check_coupon('SPRING', cart, user)
+        return place_order(
+            cart=cart, user=user, billing_address=self.address, shipping_address=self.address,
+            payment_method='card', tax_amount=Decimal('0.00'), shipping_cost=Decimal('0.00'),
+            coupon=quote or CouponQuote(self.coupon.id, 'SPRING', Decimal('5.00')),
+        )
+
+    def test_place_order_redeems_coupon(self):
+        order = self.place(self.user)
+
+        self.assertEqual(order.discount_amount, Decimal('5.00'))
+        self.assertEqual(order.total_amount, Decimal('45.00'))
+        self.assertEqual(order.coupon_redemption.sequence, 1)
+        self.assertEqual(Coupon.objects.get(pk=self.coupon.pk).used_count, 1)
+
+    def test_sequence_survives_deleted_redemptions(self):
+        self.coupon.usage_limit = None
+        self.coupon.usage_limit_per_user = 3
+        self.coupon.save()
+        first = self.place(self.user)
+        self.place(self.user)
+
+        first.delete()
+        order = self.place(self.user)
+        self.assertEqual(order.coupon_redemption.sequence, 3)
+
+    def test_session_with_a_coupon_id_is_ignored(self):
+        self.client.force_login(self.user)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.castle)
+        session = self.client.session
+        session['applied_coupon'] = self.coupon.pk
+        session.save()
+
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('applied_coupon', self.client.session)
+
+    def test_per_user_limit_rolls_back_order(self):
+        self.place(self.user)
+
+        with self.assertRaises(CouponUnavailable):
+            self.place(self.user)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductPage.objects.get(pk=self.castle.pk).stock_quantity, 9)
+
+    def test_global_limit(self):
+        for index in range(2):
+            self.place(User.objects.create_user(f'fan{index}', f'fan{index}@example.com', 'pass12345'))
+
+        with self.assertRaises(CouponUnavailable):
+            self.place(User.objects.create_user('late', 'late@example.com', 'pass12345'))
+        self.assertEqual(Coupon.objects.get(pk=self.coupon.pk).used_count, 2)
+        self.assertNotIn('SPRING', [quote.code for quote in rank_coupons(Cart.objects.create(), None)])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CouponRedemptionLoadTestCase(TransactionTestCase):
+    """100 buyers check out twice each against a 10-use, once-per-user coupon"""
+
+    # The flush after each test wipes the root page and default Site the
+    # migrations created; restore them for the next test
+    serialized_rollback = True
+
+    buyers = 100
+    limit = 10
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.coupon = Coupon.objects.create(
+            code='VIRAL', name='Viral', discount_type='fixed', discount_value=Decimal('5.00'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+            usage_limit=self.limit, usage_limit_per_user=1,
+        )
+        self.quote = CouponQuote(self.coupon.id, 'VIRAL', Decimal('5.00'))
+        self.users = [
+            User.objects.create_user(f'buyer{index}', f'buyer{index}@example.com', 'pass12345')
+            for index in range(self.buyers)
+        ]
+
+    def redeem(self, user):
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=user, subtotal=Decimal('10.00'), total_amount=Decimal('5.00'),
+                    billing_address={}, shipping_address={}, coupon=self.coupon
+                )
+                redeem_coupon(self.quote, order)
+            return True
+        except CouponUnavailable:
+            return False
+        finally:
+            connections.close_all()
+
+    def test_limit_holds(self):
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(self.redeem, self.users * 2))
+
+        self.assertEqual(results.count(True), self.limit)
+        self.assertEqual(Coupon.objects.get(pk=self.coupon.pk).used_count, self.limit)
+        self.assertEqual(CouponRedemption.objects.values('user').distinct().count(), self.limit)
+
+
+class ShippingQuoteTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.castle = self.create_product('Castle', '40.00', weight=Decimal('2.00'))
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.castle)
+        self.standard = ShippingMethod.objects.create(
+            name='Standard', base_cost=Decimal('5.00'), cost_per_kg=Decimal('1.00'),
+            free_shipping_threshold=Decimal('100.00'), min_delivery_days=5, max_delivery_days=7,
+        )
+        self.express = ShippingMethod.objects.create(
+            name='Express', base_cost=Decimal('15.00'), cost_per_kg=Decimal('2.00'),
+            min_delivery_days=1, max_delivery_days=2, max_weight=Decimal('5.00'),
+        )
+        self.europe = ShippingZone.objects.create(name='Europe', countries=['DK', 'DE'])
+        ShippingRate.objects.create(
+            method=self.express, zone=self.europe, base_cost=Decimal('20.00'), cost_per_kg=Decimal('3.00')
+        )
+
+    def quotes(self, country, cart=None):
+        cart = cart or Cart.objects.get(pk=self.cart.pk)
+        return [(quote.name, quote.cost) for quote in get_shipping_quotes(cart, country)]
+
+    def test_quotes_follow_zones_and_weight(self):
+        self.assertEqual(self.quotes('DK'), [('Standard', Decimal('7.00')), ('Express', Decimal('26.00'))])
+        # Express has zone rates, so it only ships to its zones
+        self.assertEqual(self.quotes('US'), [('Standard', Decimal('7.00'))])
+
+        CartItem.objects.filter(cart=self.cart).update(quantity=3)
+        cache.clear()
+        self.assertEqual(self.quotes('DK'), [('Standard', Decimal('0.00'))])
+
+    def test_warm_quotes_run_no_queries(self):
+        self.quotes('DK')
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(0):
+            self.quotes('DK', cart)
+            self.quotes('DE', cart)
+
+        ShippingRate.objects.update(base_cost=Decimal('30.00'))
+        self.express.save()
+        self.assertEqual(self.quotes('DK')[1], ('Express', Decimal('36.00')))
+
+    def test_checkout_charges_chosen_method(self):
+        address = Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Stud Street', city='Billund', state='South', postal_code='7190',
+            country='DK'
+        )
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertEqual(response.context['shipping_cost'], Decimal('7.00'))
+
+        response = self.client.post(reverse('shop:process_order'), {
+            'shipping_address': address.id, 'billing_address': address.id,
+            'payment_method': 'card', 'shipping_method': self.express.id,
+        })
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Order.objects.get().shipping_cost, Decimal('26.00'))
+
+    def test_calculate_shipping_returns_totals(self):
+        self.client.force_login(self.user)
+        url = reverse('shop:calculate_shipping')
+
+        data = self.client.post(url, {'country': 'DK', 'shipping_method': self.express.id}).json()
+        self.assertEqual(data['shipping_method'], self.express.id)
+        self.assertEqual(data['totals']['shipping_cost'], '26.00')
+        totals = {key: Decimal(value) for key, value in data['totals'].items()}
+        self.assertEqual(
+            totals['total_amount'],
+            totals['subtotal'] + totals['tax_amount'] + totals['shipping_cost'] - totals['discount_amount']
+        )
+
+        # A method the destination does not offer falls back to the cheapest
+        data = self.client.post(url, {'country': 'US', 'shipping_method': self.express.id}).json()
+        self.assertEqual(data['shipping_method'], self.standard.id)
+        self.assertEqual(data['totals']['shipping_cost'], '7.00')
+
+    def test_free_shipping_coupon_zeroes_quoted_costs(self):
+        now = timezone.now()
+        Coupon.objects.create(
+            code='FREESHIP', name='Free shipping', discount_type='free_shipping',
+            discount_value=Decimal('0'), valid_from=now - timedelta(days=1),
+            valid_until=now + timedelta(days=1),
+        )
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['applied_coupon'] = 'FREESHIP'
+        session.save()
+
+        data = self.client.post(reverse('shop:calculate_shipping'), {'country': 'DK'}).json()
+        self.assertEqual([quote['cost'] for quote in data['quotes']], ['0.00', '0.00'])
+        self.assertEqual(data['totals']['shipping_cost'], '0.00')
+
+        Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Stud Street', city='Billund', state='South', postal_code='7190',
+            country='DK'
+        )
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertEqual(
+            [option['cost'] for option in response.context['shipping_options']],
+            [Decimal('0.00'), Decimal('0.00')]
+        )
+        self.assertContains(response, '<strong>Express</strong> - $0.00')
+
+
+class TaxTestCase(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.create_shop()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.castle = self.create_product('Castle', '100.00')
+        self.ebook = self.create_product('Ebook', '10.00', is_digital=True)
+        self.bread = self.create_product('Bread', '5.00', tax_class='reduced')
+        self.cart = Cart.objects.create(user=self.user)
+        for product in (self.castle, self.ebook, self.bread):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        TaxRate.objects.create(country='US', rate=Decimal('0.0500'))
+        TaxRate.objects.create(country='US', region='CA', rate=Decimal('0.0725'))
+        TaxRate.objects.create(country='US', region='CA', tax_class='reduced', rate=Decimal('0.0100'))
+        TaxRate.objects.create(country='US', tax_class='digital', rate=Decimal('0'))
+
+    def address(self, country, state):
+        return Address(user=self.user, type='shipping', country=country, state=state)
+
+    def taxes(self, address):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        return {product_id: (rate, tax) for product_id, rate, tax in get_cart_tax(cart, address).lines}
+
+    def test_rates_by_region_and_class(self):
+        taxes = self.taxes(self.address('US', 'ca'))
+        self.assertEqual(taxes[self.castle.pk], (Decimal('0.0725'), Decimal('14.50')))
+        self.assertEqual(taxes[self.bread.pk], (Decimal('0.0100'), Decimal('0.10')))
+        self.assertEqual(taxes[self.ebook.pk], (Decimal('0'), Decimal('0.00')))
+
+        taxes = self.taxes(self.address('US', 'TX'))
+        self.assertEqual(taxes[self.castle.pk], (Decimal('0.0500'), Decimal('10.00')))
+        self.assertEqual(taxes[self.bread.pk], (Decimal('0.0500'), Decimal('0.50')))
+
+        # Unlisted destinations fall back to DEFAULT_TAX_RATE
+        self.assertEqual(get_cart_tax(self.cart, self.address('DK', '')).total, Decimal('18.40'))
+
+    def test_order_tax_follows_the_order_lines(self):
+        address = Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Main Street', city='Fresno', state='CA', postal_code='93650', country='US'
+        )
+        get_cart_tax(self.cart, address)
+        # A price change the cached cart tax has not seen
+        ProductPage.objects.filter(pk=self.castle.pk).update(price=Decimal('200.00'))
+
+        order = place_order(
+            cart=Cart.objects.get(pk=self.cart.pk), user=self.user, billing_address=address,
+            shipping_address=address, payment_method='card', shipping_cost=Decimal('0.00'),
+        )
+        self.assertEqual(order.subtotal, Decimal('430.00'))
+        self.assertEqual(order.tax_amount, Decimal('29.10'))
+
+    def test_discount_is_taken_off_before_tax(self):
+        address = Address.objects.create(
+            user=self.user, type='shipping', first_name='Ada', last_name='Brick',
+            address_line_1='1 Main Street', city='Fresno', state='CA', postal_code='93650', country='US'
+        )
+        discount = Decimal('23.00')
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code='TENOFF', name='Ten off', discount_type='fixed', discount_value=discount,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        # 230.00 of lines less 10%: castle 180.00, ebook 18.00, bread 9.00
+        self.assertEqual(get_cart_tax(self.cart, address, discount).total, Decimal('13.14'))
+        self.assertEqual(get_cart_tax(self.cart, address).total, Decimal('14.60'))
+
+        order = place_order(
+            cart=Cart.objects.get(pk=self.cart.pk), user=self.user, billing_address=address,
+            shipping_address=address, payment_method='card', shipping_cost=Decimal('0.00'),
+            coupon=CouponQuote(coupon.id, 'TENOFF', discount),
+        )
+        self.assertEqual(order.tax_amount, Decimal('13.14'))
+        self.assertEqual(order.total_amount, Decimal('220.14'))
+
+    def test_tax_is_cached_per_cart_and_address(self):
+        address = self.address('US', 'CA')
+        self.taxes(address)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart_tax(Cart.objects.get(pk=self.cart.pk), address).total, Decimal('14.60'))
+
+        CartItem.objects.filter(product=self.castle).get().delete()
+        self.assertEqual(get_cart_tax(Cart.objects.get(pk=self.cart.pk), address).total, Decimal('0.10'))
+
+        TaxRate.objects.filter(region='CA', tax_class='reduced').get().delete()
+        self.assertEqual(get_cart_tax(Cart.objects.get(pk=self.cart.pk), address).total, Decimal('0.73'))
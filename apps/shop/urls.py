@@ -6,6 +6,7 @@ app_name = 'shop'
 urlpatterns = [
     # Cart URLs
     path('cart/', views.cart_view, name='cart'),
+    path('cart/count/', views.cart_count, name='cart_count'),
     path('cart/add/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/', views.update_cart_item, name='update_cart_item'),
     path('cart/remove/', views.remove_from_cart, name='remove_from_cart'),
@@ -41,6 +42,7 @@ urlpatterns = [
     
     # Search URLs
     path('search/', views.search_products, name='search_products'),
+    path('products/feed/', views.product_feed, name='product_feed'),
     
     # AJAX URLs
     path('wishlist/remove-ajax/', views.remove_from_wishlist_ajax, name='remove_from_wishlist_ajax'),
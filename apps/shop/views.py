@@ -1,4 +1,5 @@
 from decimal import Decimal
+from urllib.parse import urlencode
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -6,15 +7,28 @@ from django.core.paginator import Paginator
 from django.db import models
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
 from wagtail.models import Page, Locale
 
+from apps.core.preferences import set_preferences
+from .cart import get_cart_summary, get_cached_cart_count, remember_cart_count, SUPPORTED_CURRENCIES
+from .coupons import check_coupon
 from .forms import UserProfileForm, UserForm
+from .listing import (
+    SEARCH_RESULTS_LIMIT, InvalidFilter, clean_listing_filters, filter_listings, get_listing_filters,
+    get_sort_ordering, search_listings
+)
 from .models import (
     ProductPage, ProductVariant, Cart, CartItem, Order, OrderItem,
-    Payment, Coupon, UserProfile, Address, Wishlist, WishlistItem,
-    ShippingMethod, LoyaltyTransaction
+    Payment, UserProfile, Address, Wishlist, WishlistItem,
+    LoyaltyTransaction, ProductListing
 )
+from .orders import place_order
+from .pagination import keyset_page, InvalidCursor, LISTING_PAGE_SIZE
+from .shipping import get_shipping_quotes
+from .tax import get_cart_tax
+from .stock import reserve_cart_stock, OutOfStockError
 
 
 def get_or_create_cart(request):
@@ -31,6 +45,7 @@ def get_or_create_cart(request):
 def cart_view(request):
     """Display shopping cart"""
     cart = get_or_create_cart(request)
+    remember_cart_count(request, get_cart_summary(cart).total_items)
     context = {
         'cart': cart,
         'cart_items': cart.items.select_related('product', 'variant').all(),
@@ -38,6 +53,11 @@ def cart_view(request):
     return render(request, 'shop/cart.html', context)
 
 
+def cart_count(request):
+    """Header cart badge count, served from the session/cache only"""
+    return JsonResponse({'count': get_cached_cart_count(request) or 0})
+
+
 @require_POST
 def add_to_cart(request):
     """Add product to cart"""
@@ -63,10 +83,13 @@ def add_to_cart(request):
         cart_item.quantity += quantity
         cart_item.save()
 
+    summary = get_cart_summary(cart)
+    remember_cart_count(request, summary.total_items)
+
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
-            'cart_total_items': cart.total_items,
+            'cart_total_items': summary.total_items,
             'message': f'{product.title} added to cart'
         })
 
@@ -89,11 +112,14 @@ def update_cart_item(request):
     else:
         cart_item.delete()
 
+    summary = get_cart_summary(cart)
+    remember_cart_count(request, summary.total_items)
+
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
-            'cart_total_items': cart.total_items,
-            'cart_subtotal': float(cart.subtotal),
+            'cart_total_items': summary.total_items,
+            'cart_subtotal': float(summary.subtotal),
         })
 
     return redirect('shop:cart')
@@ -109,10 +135,12 @@ def remove_from_cart(request):
         cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
         cart_item.delete()
 
+        summary = get_cart_summary(cart)
+        remember_cart_count(request, summary.total_items)
         return JsonResponse({
             'success': True,
-            'cart_total_items': cart.total_items,
-            'cart_subtotal': float(cart.subtotal),
+            'cart_total_items': summary.total_items,
+            'cart_subtotal': float(summary.subtotal),
         })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
@@ -122,55 +150,93 @@ def remove_from_cart(request):
 def apply_coupon(request):
     """Apply coupon to cart"""
     coupon_code = request.POST.get('coupon_code', '').strip().upper()
+    cart = get_or_create_cart(request)
 
-    try:
-        coupon = Coupon.objects.get(code=coupon_code)
-        cart = get_or_create_cart(request)
+    quote, message = check_coupon(
+        coupon_code, cart, request.user if request.user.is_authenticated else None
+    )
 
-        is_valid, message = coupon.is_valid(
-            user=request.user if request.user.is_authenticated else None,
-            cart_total=float(cart.subtotal)
-        )
+    if quote is not None:
+        request.session['applied_coupon'] = quote.code
+        messages.success(request, f'Coupon "{coupon_code}" applied successfully!')
+    else:
+        messages.error(request, message)
 
-        if is_valid:
-            request.session['applied_coupon'] = coupon.id
-            messages.success(request, f'Coupon "{coupon_code}" applied successfully!')
-        else:
-            messages.error(request, message)
+    return redirect('shop:cart')
 
-    except Coupon.DoesNotExist:
-        messages.error(request, 'Invalid coupon code')
 
-    return redirect('shop:cart')
+def get_applied_coupon(request, cart):
+    """Re-check the session's coupon against the cart as it is now"""
+    code = request.session.get('applied_coupon')
+    if not isinstance(code, str):
+        # Older sessions stored the coupon id
+        request.session.pop('applied_coupon', None)
+        return None
+    quote, message = check_coupon(code, cart, request.user)
+    if quote is None:
+        del request.session['applied_coupon']
+    return quote
+
+
+def get_shipping_cost(quote, coupon=None):
+    """Shipping charged for a quote, after any free-shipping coupon"""
+    if quote is None or (coupon and coupon.free_shipping):
+        return Decimal('0.00')
+    return quote.cost
+
+
+def get_shipping_options(quotes, coupon=None):
+    """Shipping quotes as checkout shows them, with any free-shipping coupon applied"""
+    return [quote.as_dict(get_shipping_cost(quote, coupon)) for quote in quotes]
+
+
+def get_checkout_totals(cart, shipping_address, shipping_quote, coupon=None):
+    """The order summary for a destination and shipping method, as process_order charges it"""
+    subtotal = get_cart_summary(cart).subtotal
+    discount_amount = coupon.discount if coupon else Decimal('0.00')
+    tax_amount = get_cart_tax(cart, shipping_address, discount_amount).total
+    shipping_cost = get_shipping_cost(shipping_quote, coupon)
+    return {
+        'subtotal': subtotal,
+        'discount_amount': discount_amount,
+        'tax_amount': tax_amount,
+        'shipping_cost': shipping_cost,
+        'total_amount': subtotal - discount_amount + tax_amount + shipping_cost,
+    }
 
 
 @login_required
 def checkout(request):
     """Checkout process"""
     cart = get_or_create_cart(request)
+    summary = get_cart_summary(cart)
 
-    if not cart.items.exists():
+    if summary.is_empty:
         messages.error(request, 'Your cart is empty')
         return redirect('shop:cart')
 
-    shipping_addresses = request.user.addresses.filter(type='shipping')
-    billing_addresses = request.user.addresses.filter(type='billing')
-    shipping_methods = ShippingMethod.objects.filter(is_active=True)
+    try:
+        reserve_cart_stock(cart)
+    except OutOfStockError as e:
+        messages.error(request, str(e))
+        return redirect('shop:cart')
 
-    subtotal = cart.subtotal
-    tax_amount = subtotal * Decimal('0.08')
-    shipping_cost = Decimal('10.00')
-    total_amount = subtotal + tax_amount + shipping_cost
+    shipping_addresses = list(request.user.addresses.filter(type='shipping').order_by('-is_default', 'id'))
+    billing_addresses = request.user.addresses.filter(type='billing')
+    shipping_address = shipping_addresses[0] if shipping_addresses else None
+    shipping_quotes = get_shipping_quotes(cart, shipping_address.country) if shipping_address else []
+    coupon = get_applied_coupon(request, cart)
 
     context = {
         'cart': cart,
+        'cart_items': cart.items.select_related('product', 'variant'),
         'shipping_addresses': shipping_addresses,
+        'shipping_address': shipping_address,
         'billing_addresses': billing_addresses,
-        'shipping_methods': shipping_methods,
-        'subtotal': subtotal,
-        'tax_amount': tax_amount,
-        'shipping_cost': shipping_cost,
-        'total_amount': total_amount,
+        'shipping_options': get_shipping_options(shipping_quotes, coupon),
+        **get_checkout_totals(
+            cart, shipping_address, shipping_quotes[0] if shipping_quotes else None, coupon
+        ),
     }
 
     return render(request, 'shop/checkout.html', context)
@@ -181,8 +247,9 @@ def checkout(request):
 def process_order(request):
     """Process the order"""
     cart = get_or_create_cart(request)
+    summary = get_cart_summary(cart)
 
-    if not cart.items.exists():
+    if summary.is_empty:
         return JsonResponse({'success': False, 'error': 'Cart is empty'})
 
     try:
@@ -193,54 +260,28 @@ def process_order(request):
         shipping_address = get_object_or_404(Address, id=shipping_address_id, user=request.user)
         billing_address = get_object_or_404(Address, id=billing_address_id, user=request.user)
 
-        subtotal = cart.subtotal
-        tax_amount = subtotal * Decimal('0.08')
-        shipping_cost = Decimal('10.00')
-        total_amount = subtotal + tax_amount + shipping_cost
+        shipping_quote = next((
+            quote for quote in get_shipping_quotes(cart, shipping_address.country)
+            if str(quote.method_id) == request.POST.get('shipping_method')
+        ), None)
+        if shipping_quote is None:
+            return JsonResponse({'success': False, 'error': 'This shipping method is not available for your address'})
+
+        coupon = get_applied_coupon(request, cart)
+        shipping_cost = get_shipping_cost(shipping_quote, coupon)
 
-        order = Order.objects.create(
+        order = place_order(
+            cart=cart,
             user=request.user,
-            subtotal=subtotal,
-            tax_amount=tax_amount,
+            billing_address=billing_address,
+            shipping_address=shipping_address,
+            payment_method=payment_method,
             shipping_cost=shipping_cost,
-            total_amount=total_amount,
-            billing_address={
-                'first_name': billing_address.first_name,
-                'last_name': billing_address.last_name,
-                'address_line_1': billing_address.address_line_1,
-                'city': billing_address.city,
-                'country': str(billing_address.country),
-            },
-            shipping_address={
-                'first_name': shipping_address.first_name,
-                'last_name': shipping_address.last_name,
-                'address_line_1': shipping_address.address_line_1,
-                'city': shipping_address.city,
-                'country': str(shipping_address.country),
-            }
-        )
-
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                total_price=cart_item.total_price,
-                product_name=cart_item.product.title,
-                product_sku=cart_item.variant.sku if cart_item.variant else cart_item.product.sku
-            )
-
-        Payment.objects.create(
-            order=order,
-            payment_id=f"order_{order.id}",
-            method=payment_method,
-            amount=total_amount,
-            gateway='manual'
+            coupon=coupon,
         )
 
-        cart.items.all().delete()
+        request.session.pop('applied_coupon', None)
+        remember_cart_count(request, 0)
 
         return JsonResponse({
             'success': True,
@@ -463,8 +504,6 @@ def add_review(request, product_id):
 def edit_profile(request):
     """Edit user profile"""
 
-    LANGUAGE_SESSION_KEY = '_language'
-
     profile, created = UserProfile.objects.get_or_create(user=request.user)
 
     if request.method == 'POST':
@@ -476,8 +515,7 @@ def edit_profile(request):
             user_form.save()
             saved_profile = profile_form.save()
 
-            request.session['currency'] = saved_profile.currency
-            request.session[LANGUAGE_SESSION_KEY] = saved_profile.language
+            set_preferences(request, language=saved_profile.language, currency=saved_profile.currency)
 
             messages.success(request, 'Profile updated successfully!')
 
@@ -528,22 +566,39 @@ def loyalty_points(request):
 
 
 def calculate_shipping(request):
-    """Calculate shipping cost via AJAX"""
-    if request.method == 'POST':
-        shipping_method_id = request.POST.get('shipping_method_id')
+    """Quote every shipping method and recompute the order summary via AJAX.
 
-        try:
-            shipping_method = ShippingMethod.objects.get(id=shipping_method_id)
-            cart = get_or_create_cart(request)
+    Takes a saved ``shipping_address`` or a bare ``country``, plus the
+    selected ``shipping_method``; the cheapest method is used when that one
+    is not available.
+    """
+    if request.method == 'POST':
+        address = None
+        country = request.POST.get('country')
+        address_id = request.POST.get('shipping_address')
+        if address_id and request.user.is_authenticated:
+            address = Address.objects.filter(id=address_id, user=request.user).first()
+            country = address.country if address else None
+        if not country:
+            return JsonResponse({'success': False, 'error': 'Invalid destination'})
+        if address is None:
+            address = Address(country=country, state='')
 
-            shipping_cost = shipping_method.calculate_cost(cart.total_weight, cart.subtotal)
+        cart = get_or_create_cart(request)
+        quotes = get_shipping_quotes(cart, country)
+        method_id = request.POST.get('shipping_method')
+        quote = next(
+            (quote for quote in quotes if str(quote.method_id) == method_id),
+            quotes[0] if quotes else None
+        )
+        coupon = get_applied_coupon(request, cart)
 
-            return JsonResponse({
-                'success': True,
-                'shipping_cost': float(shipping_cost)
-            })
-        except ShippingMethod.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Invalid shipping method'})
+        return JsonResponse({
+            'success': True,
+            'quotes': get_shipping_options(quotes, coupon),
+            'shipping_method': quote.method_id if quote else None,
+            'totals': get_checkout_totals(cart, address, quote, coupon),
+        })
 
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
@@ -584,16 +639,22 @@ def search_products(request):
     """Product search functionality"""
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
-    min_price = request.GET.get('min_price', '')
-    max_price = request.GET.get('max_price', '')
+    # Prices that are not numbers are dropped, as on the shop index
+    prices = clean_listing_filters(
+        {'min_price': request.GET.get('min_price'), 'max_price': request.GET.get('max_price')},
+        drop_invalid=True,
+    )
+    min_price = prices['min_price'] or ''
+    max_price = prices['max_price'] or ''
 
-    products = ProductPage.objects.live()
+    products = ProductListing.objects.all()
+    truncated = False
 
     if query:
-        products = products.search(query)
+        products, truncated = search_listings(products, query)
 
     if category:
-        products = products.filter(categories__name__icontains=category)
+        products = products.filter(categories__name__icontains=category).distinct()
 
     if min_price:
         products = products.filter(price__gte=min_price)
@@ -601,8 +662,33 @@ def search_products(request):
     if max_price:
         products = products.filter(price__lte=max_price)
 
+    page_obj = next_cursor = None
+    if query:
+        # Best match first; the matches are capped, so offset pages stay cheap
+        page_obj = Paginator(products.order_by('search_rank', 'pk'), LISTING_PAGE_SIZE).get_page(
+            request.GET.get('page')
+        )
+        page_items = page_obj
+    else:
+        try:
+            page_items, next_cursor = keyset_page(
+                products, get_sort_ordering('newest'), request.GET.get('cursor')
+            )
+        except InvalidCursor:
+            page_items, next_cursor = keyset_page(products, get_sort_ordering('newest'))
+
     context = {
-        'products': products,
+        'products': page_items,
+        'page_obj': page_obj,
+        'next_cursor': next_cursor,
+        'truncated': truncated,
+        'results_limit': SEARCH_RESULTS_LIMIT,
+        'search_query': urlencode([
+            (key, value) for key, value in [
+                ('q', query), ('category', category),
+                ('min_price', min_price), ('max_price', max_price),
+            ] if value
+        ]),
         'query': query,
         'category': category,
         'min_price': min_price,
@@ -611,6 +697,63 @@ def search_products(request):
     return render(request, 'shop/search_results.html', context)
 
 
+def product_feed(request):
+    """Infinite-scroll JSON feed of product listings"""
+    try:
+        filters = clean_listing_filters(get_listing_filters(request))
+    except InvalidFilter as e:
+        return JsonResponse({'success': False, 'error': f'Invalid filter: {e}'}, status=400)
+    products = ProductListing.objects.all()
+
+    shop_id = request.GET.get('shop')
+    if shop_id:
+        try:
+            products = products.filter(shop_page_id=int(shop_id))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid shop'}, status=400)
+
+    query = request.GET.get('q')
+    truncated = False
+    if query:
+        products, truncated = search_listings(products, query)
+
+    products = filter_listings(products, filters)
+
+    try:
+        page_size = int(request.GET.get('page_size', LISTING_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid page size'}, status=400)
+    try:
+        page_items, next_cursor = keyset_page(
+            products, get_sort_ordering(filters['sort']), request.GET.get('cursor'), page_size
+        )
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+    html = render_to_string(
+        'shop/includes/product_cards.html', {'products': page_items}, request=request
+    )
+
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'next_cursor': next_cursor,
+        'truncated': truncated,
+        'products': [
+            {
+                'id': product.pk,
+                'title': product.title,
+                'url': product.url,
+                'image_url': product.image_url,
+                'price': float(product.price),
+                'sale_price': float(product.sale_price) if product.sale_price else None,
+                'is_in_stock': product.is_in_stock,
+            }
+            for product in page_items
+        ],
+    })
+
+
 @login_required
 def quick_add_to_cart(request):
     """Quick add to cart via AJAX"""
@@ -631,9 +774,12 @@ def quick_add_to_cart(request):
             cart_item.quantity += quantity
             cart_item.save()
 
+        summary = get_cart_summary(cart)
+        remember_cart_count(request, summary.total_items)
+
         return JsonResponse({
             'success': True,
-            'cart_total_items': cart.total_items,
+            'cart_total_items': summary.total_items,
             'message': f'{product.title} added to cart'
         })
 
@@ -645,16 +791,11 @@ def set_currency(request):
     if request.method == 'POST':
         currency = request.POST.get('currency', 'USD')
 
-        if currency in ['USD', 'EUR', 'GBP', 'CAD', 'AUD']:
-            request.session['currency'] = currency
+        if currency in SUPPORTED_CURRENCIES:
+            set_preferences(request, currency=currency)
 
             if request.user.is_authenticated:
-                try:
-                    profile = request.user.shop_profile
-                    profile.currency = currency
-                    profile.save()
-                except:
-                    UserProfile.objects.create(user=request.user, currency=currency)
+                UserProfile.objects.update_or_create(user=request.user, defaults={'currency': currency})
 
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': True, 'currency': currency})
@@ -97,6 +97,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'apps.core.middleware.AnonymousPageCacheMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'wagtail.contrib.redirects.middleware.RedirectMiddleware',
     'axes.middleware.AxesMiddleware',
@@ -122,6 +123,7 @@ TEMPLATES = [
                 'wagtailmenus.context_processors.wagtailmenus',
                 'apps.core.context_processors.footer_context',
                 'apps.shop.context_processors.user_preferences',
+                'apps.shop.context_processors.cart_count',
             ],
         },
     },
@@ -277,6 +279,12 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 # Cart Settings
 CART_SESSION_ID = 'cart'
 CART_TIMEOUT = 86400 * 7  # 7 days
+STOCK_RESERVATION_MINUTES = 15
+PAGE_CACHE_SECONDS = 60 * 10  # anonymous full-page cache
+RENDITION_WORKERS = 2  # background rendition processes; 0 renders inline
+
+# Currency Settings
+EXCHANGE_RATES_FILE = config('EXCHANGE_RATES_FILE', default=str(BASE_DIR / 'exchange_rates.json'))
 
 # Loyalty Settings
 LOYALTY_POINTS_PER_DOLLAR = 1
@@ -9,7 +9,7 @@ from wagtail.admin import urls as wagtailadmin_urls
 from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
-from apps.core.views import SearchView, set_language
+from apps.core.views import SearchView, set_language, page_state
 from apps.home.views import switch_language
 
 # Error handlers
@@ -25,6 +25,7 @@ urlpatterns = [
     path('documents/', include(wagtaildocs_urls)),
     path('set-language/', set_language, name='set_language'),
     path('switch-language/', switch_language, name='switch_language'),
+    path('page-state/', page_state, name='page_state'),
     
     # Chrome DevTools
     path('.well-known/appspecific/com.chrome.devtools.json', lambda r: HttpResponse(status=204)),